@@ -1,21 +1,44 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+import click
 import os
 from dotenv import load_dotenv
-from werkzeug.utils import secure_filename # For securely saving filenames
+from werkzeug.utils import secure_filename # For sanitizing uploaded filenames
 from datetime import datetime, date, timedelta # Ensure timedelta is imported
-from collections import defaultdict # For calculating category sums
 import json # For passing data to JavaScript
 import calendar # For month names
-from sqlalchemy import extract # For filtering by month/year
+from sqlalchemy import and_, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload # Explicit loading, avoids N+1 lazy loads
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate # For database migrations
 import logging # For better logging
 from flask_login import login_required, current_user
 
 from extensions import db, login_manager, csrf
-from models import Category, Rule, Transaction, Budget, User
-from categorizer import assign_category, get_defined_categories
-from parser import process_uploaded_file # Re-adding parser for file uploads
+from models import (
+    Category, Rule, Transaction, Budget, User, MonthlyCategoryTotal, fingerprint_fields_changed,
+    insert_new_transactions, transaction_fingerprint
+)
+from categorizer import assign_category, get_defined_categories, invalidate_rule_cache
+from bulk_transactions import (
+    BULK_ACTIONS, DuplicateTransactionsError, bulk_criteria, delete_transactions,
+    recategorize_transactions, update_transactions
+)
+from recategorize import RECATEGORIZE_SYNC_LIMIT, recategorize_after_rule_change
+from rule_preview import MAX_PREVIEW_SAMPLE_SIZE, PREVIEW_SAMPLE_SIZE, preview_rule
+from importer import import_statement # Streams uploaded statements into the database
+from dashboard import build_dashboard
+from budgets import effective_budget_amounts, effective_budgets, month_after, months_between, save_budgets
+from pagination import MAX_PAGE_SIZE, PAGE_SIZE, SORT_COLUMNS, SORT_ORDERS, transactions_page
+from transaction_payloads import (
+    API_PAGE_SIZE, ENCODINGS, MAX_API_PAGE_SIZE, columnar_payload, json_response, parse_fields, rows_payload,
+    select_transactions
+)
+from rollup import month_bounds, month_of, rebuild_monthly_totals, refresh_monthly_totals, verify_monthly_totals
+from dashboard_cache import dashboard_cache_key, get_dashboard_cache, init_dashboard_cache, invalidate_dashboard_cache
+from instrumentation import init_request_instrumentation
+from metrics import init_metrics
+from profiling import init_profiling
 from auth import auth
 
 load_dotenv() # Load environment variables from .env
@@ -23,6 +46,9 @@ load_dotenv() # Load environment variables from .env
 # Setup basic logging
 logging.basicConfig(level=logging.INFO)
 
+# Upper bound on entries accepted by POST /api/budgets/bulk
+MAX_BULK_BUDGETS = 1000
+
 @login_manager.user_loader
 def load_user(user_id):
     return db.session.get(User, int(user_id))
@@ -70,6 +96,8 @@ def create_default_categories_for_user(user_id):
             rule = Rule(keyword_pattern=rule_kw, category_id=category.id)
             db.session.add(rule)
     db.session.commit()
+    invalidate_rule_cache(user_id)
+    invalidate_dashboard_cache(user_id)
 
 def create_app():
     app = Flask(__name__, template_folder='templates')
@@ -78,19 +106,37 @@ def create_app():
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'a_very_strong_default_secret_key_pls_change')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///categories_rules.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-    # Ensure upload folder exists and has correct permissions
-    if not os.path.exists(app.config['UPLOAD_FOLDER']):
-        os.makedirs(app.config['UPLOAD_FOLDER'], mode=0o755)
-        app.logger.info(f"Created uploads directory: {app.config['UPLOAD_FOLDER']}")
+    # Statements slower than this are logged with their route
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+    # Worker processes share metrics through one file each in this directory
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+    # Bearer token Prometheus scrapes /metrics with; without one only logged-in users can read it
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    # On-demand request profiling, triggered by requests carrying PROFILING_TOKEN
+    app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    app.config['PROFILING_TOKEN'] = os.environ.get('PROFILING_TOKEN')
+    app.config['PROFILES_DIR'] = os.environ.get('PROFILES_DIR', os.path.join(app.instance_path, 'profiles'))
+    app.config['PROFILING_MIN_INTERVAL'] = float(os.environ.get('PROFILING_MIN_INTERVAL', 60))
+    # Dashboard cache backend: 'sqlite' (shared by all workers), 'lru' (single process only) or 'none'
+    app.config['DASHBOARD_CACHE'] = os.environ.get('DASHBOARD_CACHE', 'sqlite')
+    app.config['DASHBOARD_CACHE_PATH'] = os.environ.get('DASHBOARD_CACHE_PATH', os.path.join(app.instance_path, 'dashboard_cache.db'))
+    # Transactions rendered per page; further pages are fetched with a cursor
+    app.config['TRANSACTIONS_PAGE_SIZE'] = int(os.environ.get('TRANSACTIONS_PAGE_SIZE', PAGE_SIZE))
+    # Rows per page of /api/transactions
+    app.config['TRANSACTIONS_API_PAGE_SIZE'] = int(os.environ.get('TRANSACTIONS_API_PAGE_SIZE', API_PAGE_SIZE))
+    # Rule changes re-categorize up to this many transactions within the request, more in the background
+    app.config['RECATEGORIZE_SYNC_LIMIT'] = int(os.environ.get('RECATEGORIZE_SYNC_LIMIT', RECATEGORIZE_SYNC_LIMIT))
 
     # --- Initialize Extensions ---
     db.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
     Migrate(app, db)
+    init_request_instrumentation(app)
+    init_metrics(app)
+    init_profiling(app)
+    init_dashboard_cache(app)
 
     # Register blueprints
     app.register_blueprint(auth)
@@ -124,86 +170,22 @@ def create_app():
             month = today.month
             year = today.year
 
-        # Calculate start and end dates for the specified month
-        start_date = date(year, month, 1)
-        if month == 12:
-            end_date = date(year + 1, 1, 1)
-        else:
-            end_date = date(year, month + 1, 1)
-
-        # Build the query with sorting
-        query = Transaction.query.filter(
-            Transaction.date >= start_date,
-            Transaction.date < end_date,
-            Transaction.user_id == current_user.id
-        )
-
-        # Apply sorting based on column
-        if sort_by == 'date':
-            if sort_order == 'asc':
-                query = query.order_by(Transaction.date.asc())
-            else:
-                query = query.order_by(Transaction.date.desc())
-        elif sort_by == 'description':
-            if sort_order == 'asc':
-                query = query.order_by(Transaction.description.asc())
-            else:
-                query = query.order_by(Transaction.description.desc())
-        elif sort_by == 'amount':
-            if sort_order == 'asc':
-                query = query.order_by(Transaction.amount.asc())
-            else:
-                query = query.order_by(Transaction.amount.desc())
-        elif sort_by == 'account_source':
-            if sort_order == 'asc':
-                query = query.order_by(Transaction.account_source.asc())
-            else:
-                query = query.order_by(Transaction.account_source.desc())
-        elif sort_by == 'category':
-            # For category sorting, we need to join with Category table
-            from sqlalchemy import func
-            if sort_order == 'asc':
-                query = query.outerjoin(Category).order_by(func.coalesce(Category.name, 'Uncategorized').asc())
-            else:
-                query = query.outerjoin(Category).order_by(func.coalesce(Category.name, 'Uncategorized').desc())
-
-        transactions = query.all()
-
-        # Calculate totals by category
-        category_totals = defaultdict(float)
-        expense_categories = defaultdict(float)
-
-        for transaction in transactions:
-            category_name = transaction.category.name if transaction.category else 'Uncategorized'
-            category_totals[category_name] += transaction.amount
-
-            # Only track expenses for charts (negative amounts)
-            if transaction.amount < 0:
-                expense_categories[category_name] += abs(transaction.amount)  # Convert to positive for chart
-
-        # Calculate income and expenses
-        total_income = sum(amount for amount in (t.amount for t in transactions) if amount > 0)
-        total_expenses = sum(amount for amount in (t.amount for t in transactions) if amount < 0)
-        net_amount = total_income + total_expenses  # expenses are negative
-
-        # Prepare chart data for JavaScript
-        expense_chart_data = {
-            'labels': list(expense_categories.keys()),
-            'data': list(expense_categories.values())
-        }
-
-        # Prepare bar chart data (Income vs Expenses)
-        bar_chart_data = {
-            'labels': ['Income', 'Expenses'],
-            'data': [total_income, abs(total_expenses)]
-        }
-
-        # Get top 5 spending categories
-        top_spending_categories = sorted(
-            expense_categories.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )[:5]
+        # Dashboard numbers come from grouped queries; the page shows no transaction rows.
+        # They are cached per user and month until the user's data changes.
+        cache = get_dashboard_cache()
+        cache_key = dashboard_cache_key(year, month, cache.generation(current_user.id))
+        cached = cache.get(current_user.id, cache_key)
+        if cached is None:
+            cached = {
+                'dashboard': build_dashboard(current_user.id, year, month),
+                # All categories for budget setup
+                'all_categories': [category.to_dict() for category in Category.query.options(
+                    selectinload(Category.rules)
+                ).filter_by(user_id=current_user.id).order_by(Category.name).all()]
+            }
+            cache.set(current_user.id, cache_key, cached)
+        dashboard = cached['dashboard']
+        all_categories = cached['all_categories']
 
         # Calculate navigation dates (previous and next month)
         if month == 1:
@@ -220,64 +202,27 @@ def create_app():
             next_month = month + 1
             next_year = year
 
-        # Get budget data for the current month
-        budgets = Budget.query.filter_by(month=month, year=year, user_id=current_user.id).all()
-        budget_data = {}
-        total_budgeted = 0
-        total_spent = 0
-
-        # Create a mapping of budget data
-        for budget in budgets:
-            if budget.category:
-                category_name = budget.category.name
-                # Get actual spending for this category (only expenses, so negative amounts)
-                actual_spent = abs(category_totals.get(category_name, 0)) if category_totals.get(category_name, 0) < 0 else 0
-
-                budget_data[category_name] = {
-                    'budgeted': budget.budgeted_amount,
-                    'spent': actual_spent,
-                    'remaining': budget.budgeted_amount - actual_spent,
-                    'percentage': (actual_spent / budget.budgeted_amount * 100) if budget.budgeted_amount > 0 else 0,
-                    'over_budget': actual_spent > budget.budgeted_amount
-                }
-
-                total_budgeted += budget.budgeted_amount
-                total_spent += actual_spent
-
-        # Calculate overall budget performance
-        budget_summary = {
-            'total_budgeted': total_budgeted,
-            'total_spent': total_spent,
-            'total_remaining': total_budgeted - total_spent,
-            'overall_percentage': (total_spent / total_budgeted * 100) if total_budgeted > 0 else 0,
-            'over_budget': total_spent > total_budgeted
-        }
-
-        # Get all categories for budget setup
-        all_categories = [category.to_dict() for category in Category.query.filter_by(user_id=current_user.id).order_by(Category.name).all()]
-
         return render_template('index.html',
-                            transactions=transactions,
-                            category_totals=dict(category_totals),
-                            total_income=total_income,
-                            total_expenses=abs(total_expenses),
-                            net_amount=net_amount,
+                            category_totals=dashboard['category_totals'],
+                            total_income=dashboard['total_income'],
+                            total_expenses=dashboard['total_expenses'],
+                            net_amount=dashboard['net_amount'],
                             current_month=calendar.month_name[month],
                             current_year=year,
                             current_month_num=month,
                             current_sort_by=sort_by,
                             current_sort_order=sort_order,
-                            expense_chart_data=json.dumps(expense_chart_data),
-                            bar_chart_data=json.dumps(bar_chart_data),
-                            top_spending_categories=top_spending_categories,
+                            expense_chart_data=json.dumps(dashboard['expense_chart_data']),
+                            bar_chart_data=json.dumps(dashboard['bar_chart_data']),
+                            top_spending_categories=dashboard['top_spending_categories'],
                             prev_month=prev_month,
                             prev_year=prev_year,
                             next_month=next_month,
                             next_year=next_year,
                             is_current_month=(year == today.year and month == today.month),
                             month_names=calendar.month_name,
-                            budget_data=budget_data,
-                            budget_summary=budget_summary,
+                            budget_data=dashboard['budget_data'],
+                            budget_summary=dashboard['budget_summary'],
                             all_categories=all_categories)
 
     @app.route('/transactions')
@@ -289,12 +234,11 @@ def create_app():
         sort_order = request.args.get('sort_order', 'desc')  # Default descending order
 
         # Validate sort_by parameter to prevent SQLAlchemy errors
-        valid_columns = ['date', 'description', 'amount', 'account_source', 'category']
-        if sort_by not in valid_columns:
+        if sort_by not in SORT_COLUMNS:
             sort_by = 'date'
 
         # Validate sort_order parameter
-        if sort_order not in ['asc', 'desc']:
+        if sort_order not in SORT_ORDERS:
             sort_order = 'desc'
 
         # Use provided year/month or default to current month
@@ -309,50 +253,15 @@ def create_app():
             year = today.year
 
         # Calculate start and end dates for the specified month
-        start_date = date(year, month, 1)
-        if month == 12:
-            end_date = date(year + 1, 1, 1)
-        else:
-            end_date = date(year, month + 1, 1)
+        start_date, end_date = month_bounds(year, month)
 
-        # Build the query with sorting
-        query = Transaction.query.filter(
-            Transaction.date >= start_date,
-            Transaction.date < end_date,
-            Transaction.user_id == current_user.id
+        # Only the first page is rendered; the page fetches the rest from
+        # api_transactions_page with next_cursor
+        transactions, next_cursor = transactions_page(
+            current_user.id, start_date, end_date, sort_by, sort_order,
+            limit=app.config['TRANSACTIONS_PAGE_SIZE']
         )
 
-        # Apply sorting based on column
-        if sort_by == 'date':
-            if sort_order == 'asc':
-                query = query.order_by(Transaction.date.asc())
-            else:
-                query = query.order_by(Transaction.date.desc())
-        elif sort_by == 'description':
-            if sort_order == 'asc':
-                query = query.order_by(Transaction.description.asc())
-            else:
-                query = query.order_by(Transaction.description.desc())
-        elif sort_by == 'amount':
-            if sort_order == 'asc':
-                query = query.order_by(Transaction.amount.asc())
-            else:
-                query = query.order_by(Transaction.amount.desc())
-        elif sort_by == 'account_source':
-            if sort_order == 'asc':
-                query = query.order_by(Transaction.account_source.asc())
-            else:
-                query = query.order_by(Transaction.account_source.desc())
-        elif sort_by == 'category':
-            # For category sorting, we need to join with Category table
-            from sqlalchemy import func
-            if sort_order == 'asc':
-                query = query.outerjoin(Category).order_by(func.coalesce(Category.name, 'Uncategorized').asc())
-            else:
-                query = query.outerjoin(Category).order_by(func.coalesce(Category.name, 'Uncategorized').desc())
-
-        transactions = query.all()
-
         # Calculate navigation dates (previous and next month)
         if month == 1:
             prev_month = 12
@@ -375,6 +284,7 @@ def create_app():
                             current_month_num=month,
                             current_sort_by=sort_by,
                             current_sort_order=sort_order,
+                            next_cursor=next_cursor,
                             prev_month=prev_month,
                             prev_year=prev_year,
                             next_month=next_month,
@@ -382,6 +292,76 @@ def create_app():
                             is_current_month=(year == today.year and month == today.month),
                             month_names=calendar.month_name)
 
+    @app.route('/api/transactions/<int:year>/<int:month>')
+    @login_required
+    def api_transactions_page(year, month):
+        """One page of a month's transactions, continuing after the ?cursor= of the previous page"""
+        sort_by = request.args.get('sort_by', 'date')
+        sort_order = request.args.get('sort_order', 'desc')
+        if sort_by not in SORT_COLUMNS or sort_order not in SORT_ORDERS:
+            return jsonify({'error': 'Invalid sort_by or sort_order'}), 400
+        if month < 1 or month > 12:
+            return jsonify({'error': 'Invalid month'}), 400
+        limit = request.args.get('limit', app.config['TRANSACTIONS_PAGE_SIZE'], type=int)
+        if limit < 1 or limit > MAX_PAGE_SIZE:
+            return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+
+        start_date, end_date = month_bounds(year, month)
+        try:
+            transactions, next_cursor = transactions_page(
+                current_user.id, start_date, end_date, sort_by, sort_order,
+                cursor=request.args.get('cursor') or None, limit=limit
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        transactions_data = []
+        for t in transactions:
+            transaction_data = t.to_dict()
+            transaction_data['category_name'] = t.category.name if t.category else 'Uncategorized'
+            transactions_data.append(transaction_data)
+        return jsonify({'transactions': transactions_data, 'next_cursor': next_cursor})
+
+    @app.route('/api/transactions')
+    @login_required
+    def api_transactions():
+        """
+        Transactions filtered by ?start_date=&end_date= (YYYY-MM-DD, end
+        exclusive), ?account= and ?category= (ids or 'uncategorized', both
+        repeatable), with the columns chosen by ?fields= and
+        ?encoding=rows|columnar. Pages hold up to ?limit= rows and the
+        next page continues after the ?cursor= of the previous one.
+        """
+        try:
+            fields = parse_fields(request.args.get('fields'))
+            start_date = request.args.get('start_date')
+            end_date = request.args.get('end_date')
+            start_date = date.fromisoformat(start_date) if start_date else None
+            end_date = date.fromisoformat(end_date) if end_date else None
+            category_params = request.args.getlist('category')
+            uncategorized = 'uncategorized' in category_params
+            category_ids = [int(category_id) for category_id in category_params if category_id != 'uncategorized']
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        encoding = request.args.get('encoding', 'rows')
+        if encoding not in ENCODINGS:
+            return jsonify({'error': f"encoding must be one of: {', '.join(ENCODINGS)}"}), 400
+        limit = request.args.get('limit', app.config['TRANSACTIONS_API_PAGE_SIZE'], type=int)
+        if limit < 1 or limit > MAX_API_PAGE_SIZE:
+            return jsonify({'error': f'limit must be between 1 and {MAX_API_PAGE_SIZE}'}), 400
+
+        try:
+            rows, next_cursor = select_transactions(
+                current_user.id, fields, start_date, end_date,
+                accounts=request.args.getlist('account'), category_ids=category_ids, uncategorized=uncategorized,
+                cursor=request.args.get('cursor') or None, limit=limit
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if encoding == 'columnar':
+            return json_response(columnar_payload(fields, rows, next_cursor))
+        return json_response(rows_payload(fields, rows, next_cursor))
+
     @app.route('/upload', methods=['POST'])
     @login_required
     def upload_file():
@@ -397,81 +377,32 @@ def create_app():
             return redirect(url_for('transactions'))
 
         if file:
+            filename = secure_filename(file.filename)
             try:
-                # Ensure upload folder exists (in case it was deleted)
-                if not os.path.exists(app.config['UPLOAD_FOLDER']):
-                    os.makedirs(app.config['UPLOAD_FOLDER'], mode=0o755)
-                    app.logger.info(f"Re-created uploads directory: {app.config['UPLOAD_FOLDER']}")
-
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                app.logger.info(f"Saving uploaded file: {filename} to {filepath}")
-                file.save(filepath)
-
-                if not os.path.exists(filepath):
-                    app.logger.error(f"File was not saved successfully: {filepath}")
-                    flash('Error saving file', 'error')
-                    return redirect(url_for('transactions'))
-
-                app.logger.info(f"File saved successfully, size: {os.path.getsize(filepath)} bytes")
-
-                try:
-                    app.logger.info(f"Processing file: {filename}")
-                    transactions = process_uploaded_file(filepath, filename, current_user.id)
-                    app.logger.info(f"Found {len(transactions)} transactions to add")
-
-                    if transactions:
-                        added_count = 0
-                        duplicate_count = 0
-
-                        for transaction in transactions:
-                            # Set the user_id for the transaction
-                            transaction.user_id = current_user.id
-
-                            # Check for duplicate transactions with same description, amount, and date for this user
-                            existing_transaction = Transaction.query.filter_by(
-                                description=transaction.description,
-                                amount=transaction.amount,
-                                date=transaction.date,
-                                user_id=current_user.id
-                            ).first()
-
-                            if existing_transaction:
-                                duplicate_count += 1
-                                app.logger.debug(f"Skipping duplicate transaction: {transaction.description}, {transaction.amount}, {transaction.date}")
-                            else:
-                                app.logger.debug(f"Adding transaction: {transaction.description}, {transaction.amount}, {transaction.category_id}")
-                                db.session.add(transaction)
-                                added_count += 1
-
-                        db.session.commit()
-
-                        if duplicate_count > 0:
-                            app.logger.info(f"Successfully added {added_count} new transactions, skipped {duplicate_count} duplicates")
-                            flash(f'Successfully processed {added_count} new transactions. Skipped {duplicate_count} duplicate transactions.', 'success')
-                        else:
-                            app.logger.info(f"Successfully added {added_count} transactions")
-                            flash(f'Successfully processed {added_count} transactions', 'success')
+                # Parse straight from the request stream, nothing is written to a shared folder
+                app.logger.info(f"Processing file: {filename}")
+                import_stats = import_statement(file.stream, filename, current_user.id)
+                added_count = import_stats['added']
+                duplicate_count = import_stats['duplicates']
+
+                if import_stats['parsed']:
+                    db.session.commit()
+                    invalidate_dashboard_cache(current_user.id)
+
+                    if duplicate_count > 0:
+                        app.logger.info(f"Successfully added {added_count} new transactions, skipped {duplicate_count} duplicates")
+                        flash(f'Successfully processed {added_count} new transactions. Skipped {duplicate_count} duplicate transactions.', 'success')
                     else:
-                        app.logger.warning("No transactions found in file")
-                        flash('No transactions found in the file', 'info')
-
-                except Exception as e:
-                    db.session.rollback()
-                    app.logger.error(f"Error processing file: {e}")
-                    flash(f'Error processing file: {str(e)}', 'error')
+                        app.logger.info(f"Successfully added {added_count} transactions")
+                        flash(f'Successfully processed {added_count} transactions', 'success')
+                else:
+                    app.logger.warning("No transactions found in file")
+                    flash('No transactions found in the file', 'info')
 
             except Exception as e:
-                app.logger.error(f"Error handling upload: {e}")
-                flash(f'Error handling file: {str(e)}', 'error')
-            finally:
-                # Clean up the uploaded file
-                if os.path.exists(filepath):
-                    try:
-                        os.remove(filepath)
-                        app.logger.debug(f"Cleaned up file: {filepath}")
-                    except Exception as e:
-                        app.logger.error(f"Error cleaning up file {filepath}: {e}")
+                db.session.rollback()
+                app.logger.error(f"Error processing file: {e}")
+                flash(f'Error processing file: {str(e)}', 'error')
 
         return redirect(url_for('transactions'))
 
@@ -487,15 +418,27 @@ def create_app():
                 account_source = request.form['account_source']
                 category_id = request.form.get('category_id')  # This will be None if no category selected
 
-                # Check for duplicate transactions with same description, amount, and date for this user
-                existing_transaction = Transaction.query.filter_by(
-                    description=description,
-                    amount=amount,
-                    date=transaction_date,
-                    user_id=current_user.id
-                ).first()
+                # Validate category belongs to current user if provided
+                if category_id:
+                    category = Category.query.filter_by(id=category_id, user_id=current_user.id).first()
+                    if not category:
+                        category_id = None  # Invalid category, set to None
 
-                if existing_transaction:
+                # Insert unless the fingerprint index already has the same transaction for this user
+                fingerprint = transaction_fingerprint(current_user.id, transaction_date, description, amount, account_source)
+                inserted = insert_new_transactions([{
+                    'date': transaction_date,
+                    'description': description,
+                    'amount': amount,
+                    'account_source': account_source,
+                    'category_id': category_id,
+                    'category_manual': bool(category_id),
+                    'user_id': current_user.id,
+                    'fingerprint': fingerprint
+                }])
+
+                if not inserted:
+                    db.session.rollback()
                     flash('A transaction with the same description, amount, and date already exists.', 'warning')
                     app.logger.debug(f"Attempted to add duplicate transaction: {description}, {amount}, {transaction_date}")
                     # Don't redirect, show the form again with the error message
@@ -505,24 +448,10 @@ def create_app():
                                          today=date.today(),
                                          form_data=request.form)
 
-                # Validate category belongs to current user if provided
-                if category_id:
-                    category = Category.query.filter_by(id=category_id, user_id=current_user.id).first()
-                    if not category:
-                        category_id = None  # Invalid category, set to None
-
-                # Create new transaction
-                new_transaction = Transaction(
-                    date=transaction_date,
-                    description=description,
-                    amount=amount,
-                    account_source=account_source,
-                    category_id=category_id,
-                    user_id=current_user.id
-                )
-
-                db.session.add(new_transaction)
+                # Core inserts bypass the ORM events that maintain the monthly rollup
+                refresh_monthly_totals([month_of(current_user.id, transaction_date)])
                 db.session.commit()
+                invalidate_dashboard_cache(current_user.id)
 
                 flash('Transaction added successfully!', 'success')
                 return redirect(url_for('transactions'))
@@ -551,13 +480,34 @@ def create_app():
                 category_id = request.form.get('category_id')
 
                 # Validate category belongs to current user if provided
+                original_category_id = transaction.category_id
                 if category_id:
                     category = Category.query.filter_by(id=category_id, user_id=current_user.id).first()
                     transaction.category_id = category.id if category else None
                 else:
                     transaction.category_id = None
+                if transaction.category_id != original_category_id:
+                    transaction.category_manual = True
+
+                # Only an edit of the identifying fields can create a duplicate
+                duplicate = None
+                if fingerprint_fields_changed(transaction):
+                    fingerprint = transaction_fingerprint(
+                        current_user.id, transaction.date, transaction.description,
+                        transaction.amount, transaction.account_source
+                    )
+                    with db.session.no_autoflush:
+                        duplicate = Transaction.query.filter(
+                            Transaction.fingerprint == fingerprint,
+                            Transaction.id != transaction.id
+                        ).first()
+                if duplicate:
+                    db.session.rollback()
+                    flash('A transaction with the same description, amount, and date already exists.', 'warning')
+                    return redirect(url_for('edit_transaction', transaction_id=transaction_id))
 
                 db.session.commit()
+                invalidate_dashboard_cache(current_user.id)
                 flash('Transaction updated successfully!', 'success')
                 return redirect(url_for('transactions'))
             except Exception as e:
@@ -577,6 +527,7 @@ def create_app():
         try:
             db.session.delete(transaction)
             db.session.commit()
+            invalidate_dashboard_cache(current_user.id)
             flash('Transaction deleted successfully!', 'success')
         except Exception as e:
             db.session.rollback()
@@ -584,6 +535,56 @@ def create_app():
             app.logger.error(f'Error deleting transaction: {e}')
         return redirect(url_for('transactions'))
 
+    @app.route('/api/transactions/bulk', methods=['POST'])
+    @login_required
+    @csrf.exempt
+    def bulk_transactions():
+        """Recategorize, delete or edit many transactions, selected by ids or by filter"""
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'JSON data is required'}), 400
+
+        action = data.get('action')
+        if action not in BULK_ACTIONS:
+            return jsonify({'error': f"action must be one of: {', '.join(BULK_ACTIONS)}"}), 400
+
+        try:
+            criteria = bulk_criteria(current_user.id, data.get('ids'), data.get('filter'))
+            if action == 'recategorize':
+                if 'category_id' not in data:
+                    return jsonify({'error': 'category_id is required'}), 400
+                category_id = data['category_id']
+                if category_id is not None and (isinstance(category_id, bool) or not isinstance(category_id, int)):
+                    return jsonify({'error': 'category_id must be a category id or null'}), 400
+                # Validate category belongs to current user; null uncategorizes
+                if category_id is not None and not Category.query.filter_by(id=category_id, user_id=current_user.id).first():
+                    return jsonify({'error': 'Category not found'}), 404
+                affected = recategorize_transactions(current_user.id, criteria, category_id)
+            elif action == 'delete':
+                affected = delete_transactions(current_user.id, criteria)
+            else:
+                affected = update_transactions(current_user.id, criteria, data.get('fields'))
+        except DuplicateTransactionsError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 409
+        except (TypeError, ValueError) as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            app.logger.error(f"Error in bulk {action} of transactions: {e}")
+            return jsonify({'error': f'Failed to {action} transactions'}), 500
+
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error in bulk {action} of transactions: {e}")
+            return jsonify({'error': f'Failed to {action} transactions'}), 500
+        invalidate_dashboard_cache(current_user.id)
+        app.logger.info(f"Bulk {action} of {affected} transactions for user {current_user.id}")
+        return jsonify({'action': action, 'affected': affected})
+
     @app.route('/delete-all-transactions', methods=['POST'])
     @login_required
     def delete_all_transactions():
@@ -594,7 +595,9 @@ def create_app():
                 return redirect(url_for('transactions'))
 
             Transaction.query.filter_by(user_id=current_user.id).delete()
+            rebuild_monthly_totals(current_user.id)
             db.session.commit()
+            invalidate_dashboard_cache(current_user.id)
             flash(f'Successfully deleted all {transaction_count} transactions!', 'success')
             app.logger.info(f'Deleted all {transaction_count} transactions for user {current_user.id}')
         except Exception as e:
@@ -614,7 +617,9 @@ def create_app():
     @login_required
     def get_categories():
         try:
-            categories = Category.query.filter_by(user_id=current_user.id).order_by(Category.name).all()
+            categories = Category.query.options(
+                selectinload(Category.rules)
+            ).filter_by(user_id=current_user.id).order_by(Category.name).all()
             return jsonify([category.to_dict() for category in categories])
         except Exception as e:
             app.logger.error(f"Error getting categories: {e}")
@@ -638,6 +643,7 @@ def create_app():
             new_category = Category(name=name, user_id=current_user.id, is_fixed_cost=is_fixed_cost)
             db.session.add(new_category)
             db.session.commit()
+            invalidate_dashboard_cache(current_user.id)
             app.logger.info(f"Added category: {name} (Fixed: {is_fixed_cost})")
             return jsonify(new_category.to_dict()), 201
         except Exception as e:
@@ -669,6 +675,8 @@ def create_app():
             category.name = new_name
             category.is_fixed_cost = is_fixed_cost
             db.session.commit()
+            invalidate_dashboard_cache(current_user.id)
+            invalidate_rule_cache(current_user.id)
             app.logger.info(f"Updated category ID {category_id} to: {new_name} (Fixed: {is_fixed_cost})")
             return jsonify(category.to_dict())
         except Exception as e:
@@ -685,6 +693,8 @@ def create_app():
             category_name = category.name
             db.session.delete(category)
             db.session.commit()
+            invalidate_dashboard_cache(current_user.id)
+            invalidate_rule_cache(current_user.id)
             app.logger.info(f"Deleted category: {category_name} (ID: {category_id})")
             return jsonify({'message': f'Category "{category_name}" deleted successfully'}), 200
         except Exception as e:
@@ -692,6 +702,20 @@ def create_app():
             app.logger.error(f"Error deleting category ID {category_id}: {e}")
             return jsonify({"error": f"Failed to delete category {category.name}"}), 500
 
+    def recategorize_for_rule(keyword_patterns, preserve_manual):
+        """Re-applies the rules to the transactions a committed rule change can affect"""
+        try:
+            result = recategorize_after_rule_change(
+                app, current_user.id, keyword_patterns, preserve_manual, app.config['RECATEGORIZE_SYNC_LIMIT']
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error re-categorizing transactions for rules {keyword_patterns}: {e}")
+            return {'status': 'failed'}
+        invalidate_dashboard_cache(current_user.id)
+        return result
+
     @app.route('/api/categories/<int:category_id>/rules', methods=['POST'])
     @login_required
     @csrf.exempt
@@ -709,18 +733,23 @@ def create_app():
             new_rule = Rule(keyword_pattern=keyword, category_id=category.id)
             db.session.add(new_rule)
             db.session.commit()
+            invalidate_dashboard_cache(current_user.id)
+            invalidate_rule_cache(current_user.id)
             app.logger.info(f"Added rule '{keyword}' to category: {category.name}")
-            return jsonify(category.to_dict()), 201
         except Exception as e:
             db.session.rollback()
             app.logger.error(f"Error adding rule '{keyword}' to category {category.name}: {e}")
             return jsonify({"error": f"Failed to add rule to category {category.name}"}), 500
 
+        response = category.to_dict()
+        response['recategorization'] = recategorize_for_rule([keyword], bool(data.get('preserve_manual')))
+        return jsonify(response), 201
+
     @app.route('/api/rules/<int:rule_id>', methods=['PUT'])
     @login_required
     @csrf.exempt
     def update_rule(rule_id):
-        rule = Rule.query.get_or_404(rule_id)
+        rule = db.get_or_404(Rule, rule_id)
         # Verify that the rule belongs to a category owned by the current user
         if rule.category.user_id != current_user.id:
             return jsonify({'error': 'Access denied'}), 403
@@ -743,19 +772,24 @@ def create_app():
             original_keyword = rule.keyword_pattern
             rule.keyword_pattern = new_keyword
             db.session.commit()
+            invalidate_dashboard_cache(current_user.id)
+            invalidate_rule_cache(current_user.id)
             app.logger.info(f"Updated rule ID {rule_id} from '{original_keyword}' to '{new_keyword}'")
-            updated_category = Category.query.get(rule.category_id)
-            return jsonify(updated_category.to_dict())
         except Exception as e:
             db.session.rollback()
             app.logger.error(f"Error updating rule ID {rule_id}: {e}")
             return jsonify({"error": "Failed to update rule"}), 500
 
+        recategorization = recategorize_for_rule([original_keyword, new_keyword], bool(data.get('preserve_manual')))
+        response = db.session.get(Category, rule.category_id, options=[selectinload(Category.rules)]).to_dict()
+        response['recategorization'] = recategorization
+        return jsonify(response)
+
     @app.route('/api/rules/<int:rule_id>', methods=['DELETE'])
     @login_required
     @csrf.exempt
     def delete_rule(rule_id):
-        rule = Rule.query.get_or_404(rule_id)
+        rule = db.get_or_404(Rule, rule_id)
         # Verify that the rule belongs to a category owned by the current user
         if rule.category.user_id != current_user.id:
             return jsonify({'error': 'Access denied'}), 403
@@ -765,33 +799,56 @@ def create_app():
             keyword_pattern = rule.keyword_pattern
             db.session.delete(rule)
             db.session.commit()
+            invalidate_dashboard_cache(current_user.id)
+            invalidate_rule_cache(current_user.id)
             app.logger.info(f"Deleted rule: {keyword_pattern} (ID: {rule_id}) from category ID {category_id}")
-            category = Category.query.get(category_id)
-            return jsonify(category.to_dict()), 200
         except Exception as e:
             db.session.rollback()
             app.logger.error(f"Error deleting rule ID {rule_id}: {e}")
             return jsonify({"error": "Failed to delete rule"}), 500
 
+        data = request.get_json(silent=True) or {}
+        recategorization = recategorize_for_rule([keyword_pattern], bool(data.get('preserve_manual')))
+        response = db.session.get(Category, category_id, options=[selectinload(Category.rules)]).to_dict()
+        response['recategorization'] = recategorization
+        return jsonify(response), 200
+
+    @app.route('/api/rules/preview')
+    @login_required
+    def preview_rule_impact():
+        """Which existing transactions a keyword would match, before it is saved as a rule"""
+        keyword = (request.args.get('keyword_pattern') or '').strip()
+        if not keyword:
+            return jsonify({'error': 'keyword_pattern is required and cannot be empty'}), 400
+        sample_size = request.args.get('limit', PREVIEW_SAMPLE_SIZE, type=int)
+        if sample_size < 0 or sample_size > MAX_PREVIEW_SAMPLE_SIZE:
+            return jsonify({'error': f'limit must be between 0 and {MAX_PREVIEW_SAMPLE_SIZE}'}), 400
+
+        try:
+            return jsonify(preview_rule(current_user.id, keyword, sample_size))
+        except Exception as e:
+            app.logger.error(f"Error previewing rule '{keyword}': {e}")
+            return jsonify({"error": "Failed to preview rule"}), 500
+
     @app.route('/api/available-months')
     @login_required
     def get_available_months():
         """Get all months that have transaction data"""
         from sqlalchemy import func, distinct
 
-        # Get distinct year-month combinations from transactions for current user
+        # Months with transactions for the current user, from the monthly rollup
         months_data = db.session.query(
-            extract('year', Transaction.date).label('year'),
-            extract('month', Transaction.date).label('month'),
-            func.count(Transaction.id).label('transaction_count')
+            MonthlyCategoryTotal.year,
+            MonthlyCategoryTotal.month,
+            func.sum(MonthlyCategoryTotal.txn_count).label('transaction_count')
         ).filter(
-            Transaction.user_id == current_user.id
+            MonthlyCategoryTotal.user_id == current_user.id
         ).group_by(
-            extract('year', Transaction.date),
-            extract('month', Transaction.date)
+            MonthlyCategoryTotal.year,
+            MonthlyCategoryTotal.month
         ).order_by(
-            extract('year', Transaction.date).desc(),
-            extract('month', Transaction.date).desc()
+            MonthlyCategoryTotal.year.desc(),
+            MonthlyCategoryTotal.month.desc()
         ).all()
 
         available_months = []
@@ -810,32 +867,20 @@ def create_app():
     @login_required
     def get_fixed_costs_analysis(year, month):
         """Get fixed vs variable costs analysis for a specific month/year"""
-        from sqlalchemy import func
-        from datetime import date
-
         try:
-            # Calculate start and end dates for the specified month
-            start_date = date(year, month, 1)
-            if month == 12:
-                end_date = date(year + 1, 1, 1)
-            else:
-                end_date = date(year, month + 1, 1)
-
-            # Get transactions for the month with category info
-            transactions_query = db.session.query(
-                Transaction.amount,
+            # Expenses per category for the month, from the monthly rollup
+            category_expenses = db.session.query(
+                MonthlyCategoryTotal.expense_sum,
                 Category.is_fixed_cost,
                 Category.name
             ).join(
-                Category, Transaction.category_id == Category.id, isouter=True
+                Category, MonthlyCategoryTotal.category_id == Category.id, isouter=True
             ).filter(
-                Transaction.date >= start_date,
-                Transaction.date < end_date,
-                Transaction.user_id == current_user.id,
-                Transaction.amount < 0  # Only expenses (negative amounts)
-            )
-
-            transactions = transactions_query.all()
+                MonthlyCategoryTotal.user_id == current_user.id,
+                MonthlyCategoryTotal.year == year,
+                MonthlyCategoryTotal.month == month,
+                MonthlyCategoryTotal.expense_sum < 0  # Only categories with expenses (negative amounts)
+            ).all()
 
             # Calculate totals
             fixed_costs_total = 0
@@ -843,7 +888,7 @@ def create_app():
             fixed_costs_categories = {}
             variable_costs_categories = {}
 
-            for amount, is_fixed_cost, category_name in transactions:
+            for amount, is_fixed_cost, category_name in category_expenses:
                 abs_amount = abs(amount)  # Convert to positive for display
                 category_name = category_name or 'Uncategorized'
 
@@ -856,6 +901,15 @@ def create_app():
 
             total_expenses = fixed_costs_total + variable_costs_total
 
+            # Budgets in effect this month, split the same way
+            fixed_costs_budgeted = 0
+            variable_costs_budgeted = 0
+            for budget in effective_budgets(current_user.id, year, month):
+                if budget.category.is_fixed_cost:
+                    fixed_costs_budgeted += budget.budgeted_amount
+                else:
+                    variable_costs_budgeted += budget.budgeted_amount
+
             # Calculate percentages
             fixed_percentage = (fixed_costs_total / total_expenses * 100) if total_expenses > 0 else 0
             variable_percentage = (variable_costs_total / total_expenses * 100) if total_expenses > 0 else 0
@@ -867,11 +921,13 @@ def create_app():
                 'fixed_costs': {
                     'total': round(fixed_costs_total, 2),
                     'percentage': round(fixed_percentage, 1),
+                    'budgeted': round(fixed_costs_budgeted, 2),
                     'categories': {k: round(v, 2) for k, v in fixed_costs_categories.items()}
                 },
                 'variable_costs': {
                     'total': round(variable_costs_total, 2),
                     'percentage': round(variable_percentage, 1),
+                    'budgeted': round(variable_costs_budgeted, 2),
                     'categories': {k: round(v, 2) for k, v in variable_costs_categories.items()}
                 },
                 'total_expenses': round(total_expenses, 2)
@@ -884,10 +940,20 @@ def create_app():
     @app.route('/api/budgets/<int:year>/<int:month>', methods=['GET'])
     @login_required
     def get_budgets(year, month):
-        """Get all budgets for a specific month/year"""
+        """Get the budgets in effect for a specific month/year"""
         try:
-            budgets = Budget.query.filter_by(month=month, year=year, user_id=current_user.id).all()
-            return jsonify([budget.to_dict() for budget in budgets])
+            # Budgets in effect this month, possibly set in an earlier month
+            budgets_data = []
+            for budget in effective_budgets(current_user.id, year, month):
+                budget_data = budget.to_dict()
+                budget_data.update({
+                    'month': month,
+                    'year': year,
+                    'effective_from_month': budget.month,
+                    'effective_from_year': budget.year
+                })
+                budgets_data.append(budget_data)
+            return jsonify(budgets_data)
         except Exception as e:
             app.logger.error(f"Error getting budgets for {year}-{month}: {e}")
             return jsonify({"error": "Failed to retrieve budgets"}), 500
@@ -939,6 +1005,7 @@ def create_app():
                 # Update existing budget
                 existing_budget.budgeted_amount = budgeted_amount
                 db.session.commit()
+                invalidate_dashboard_cache(current_user.id)
                 app.logger.info(f"Updated budget for {category.name} {year}-{month:02d}: ${budgeted_amount}")
                 return jsonify(existing_budget.to_dict())
             else:
@@ -952,6 +1019,7 @@ def create_app():
                 )
                 db.session.add(new_budget)
                 db.session.commit()
+                invalidate_dashboard_cache(current_user.id)
                 app.logger.info(f"Created budget for {category.name} {year}-{month:02d}: ${budgeted_amount}")
                 return jsonify(new_budget.to_dict()), 201
 
@@ -960,6 +1028,73 @@ def create_app():
             app.logger.error(f"Error setting budget: {e}")
             return jsonify({"error": "Failed to set budget"}), 500
 
+    @app.route('/api/budgets/bulk', methods=['POST'])
+    @login_required
+    @csrf.exempt
+    def set_budgets_bulk():
+        """Set or update many budgets in one transaction"""
+        data = request.get_json()
+        if not data or not isinstance(data.get('budgets'), list):
+            return jsonify({'error': 'budgets list is required'}), 400
+
+        entries = data['budgets']
+        if len(entries) > MAX_BULK_BUDGETS:
+            return jsonify({'error': f'At most {MAX_BULK_BUDGETS} budgets can be set at once'}), 400
+
+        # Validate every entry before writing anything. A later entry for the
+        # same category/month/year replaces an earlier one.
+        budgets_by_key = {}
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                return jsonify({'error': f'budgets[{index}] must be an object'}), 400
+            for field in ['category_id', 'month', 'year', 'budgeted_amount']:
+                if field not in entry:
+                    return jsonify({'error': f'budgets[{index}]: {field} is required'}), 400
+            # Ids and dates must be JSON integers; int() would quietly turn 5.7, "5" or true into a valid id
+            for field in ['category_id', 'month', 'year']:
+                if isinstance(entry[field], bool) or not isinstance(entry[field], int):
+                    return jsonify({'error': f'budgets[{index}]: {field} must be an integer'}), 400
+            category_id, month, year = entry['category_id'], entry['month'], entry['year']
+            if isinstance(entry['budgeted_amount'], bool):
+                return jsonify({'error': f'budgets[{index}]: invalid number'}), 400
+            try:
+                budgeted_amount = float(entry['budgeted_amount'])
+            except (TypeError, ValueError):
+                return jsonify({'error': f'budgets[{index}]: invalid number'}), 400
+
+            if not (1 <= month <= 12):
+                return jsonify({'error': f'budgets[{index}]: Month must be between 1 and 12'}), 400
+            if year < 2000 or year > 2100:
+                return jsonify({'error': f'budgets[{index}]: Year must be between 2000 and 2100'}), 400
+            if budgeted_amount < 0:
+                return jsonify({'error': f'budgets[{index}]: Budget amount cannot be negative'}), 400
+
+            budgets_by_key[(category_id, month, year)] = budgeted_amount
+
+        # Check every category belongs to current user with one query
+        category_ids = {category_id for category_id, _, _ in budgets_by_key}
+        owned_ids = {category_id for (category_id,) in db.session.query(Category.id).filter(
+            Category.user_id == current_user.id,
+            Category.id.in_(category_ids)
+        )}
+        if category_ids - owned_ids:
+            return jsonify({'error': 'Category not found'}), 404
+
+        if not budgets_by_key:
+            return jsonify({'budgets_saved': 0})
+
+        try:
+            budgets_saved = save_budgets(current_user.id, budgets_by_key)
+            db.session.commit()
+            invalidate_dashboard_cache(current_user.id)
+            app.logger.info(f"Saved {budgets_saved} budgets in bulk for user {current_user.id}")
+            return jsonify({'budgets_saved': budgets_saved})
+
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error setting budgets in bulk: {e}")
+            return jsonify({"error": "Failed to set budgets"}), 500
+
     @app.route('/api/budgets/<int:budget_id>', methods=['DELETE'])
     @login_required
     @csrf.exempt
@@ -970,6 +1105,7 @@ def create_app():
             category_name = budget.category.name if budget.category else 'Unknown'
             db.session.delete(budget)
             db.session.commit()
+            invalidate_dashboard_cache(current_user.id)
             app.logger.info(f"Deleted budget: {category_name} {budget.year}-{budget.month:02d}")
             return jsonify({'message': f'Budget for {category_name} deleted successfully'}), 200
         except Exception as e:
@@ -982,9 +1118,6 @@ def create_app():
     @csrf.exempt
     def carry_over_budgets():
         """Carry over current month's budgets to future months"""
-        from datetime import datetime, timedelta
-        from dateutil.relativedelta import relativedelta
-
         data = request.get_json()
         if not data:
             return jsonify({'error': 'JSON data is required'}), 400
@@ -1007,55 +1140,37 @@ def create_app():
             return jsonify({'error': 'Target months must be between 1 and 60'}), 400
 
         try:
-            # Get all budgets for the source month/year for current user
-            source_budgets = Budget.query.filter_by(
-                month=source_month,
-                year=source_year,
-                user_id=current_user.id
-            ).all()
-
-            if not source_budgets:
+            source_amounts = effective_budget_amounts(current_user.id, source_year, source_month)
+            if not source_amounts:
                 return jsonify({'error': f'No budgets found for {source_year}-{source_month:02d}'}), 404
 
-            budgets_created = 0
-            budgets_updated = 0
-
-            # Start from the next month after the source month
-            current_date = datetime(source_year, source_month, 1) + relativedelta(months=1)
-
-            for month_offset in range(target_months):
-                target_month = current_date.month
-                target_year = current_date.year
-
-                for source_budget in source_budgets:
-                    # Check if budget already exists for this category/month/year
-                    existing_budget = Budget.query.filter_by(
-                        category_id=source_budget.category_id,
-                        month=target_month,
-                        year=target_year,
-                        user_id=current_user.id
-                    ).first()
-
-                    if existing_budget:
-                        # Update existing budget
-                        existing_budget.budgeted_amount = source_budget.budgeted_amount
-                        budgets_updated += 1
-                    else:
-                        # Create new budget
-                        new_budget = Budget(
-                            category_id=source_budget.category_id,
-                            month=target_month,
-                            year=target_year,
-                            budgeted_amount=source_budget.budgeted_amount,
-                            user_id=current_user.id
-                        )
-                        db.session.add(new_budget)
-                        budgets_created += 1
-
-                # Move to next month
-                current_date += relativedelta(months=1)
+            # Budgets take effect until superseded, so carrying over means removing
+            # the later budgets set within the target months
+            target_end = month_after(source_year, source_month, target_months)
+            in_target_months = and_(
+                Budget.category_id.in_(source_amounts),
+                months_between(Budget, (source_year, source_month), target_end)
+            )
 
+            # Target months that had their own budget are reported as updated, the rest as created
+            budgets_updated = Budget.query.filter(in_target_months).count()
+            budgets_created = len(source_amounts) * target_months - budgets_updated
+
+            # The month after the range must keep the budget it has today, also when that is none
+            following_month = month_after(*target_end)
+            restored_budgets = [
+                Budget(category_id=budget.category_id, year=following_month[0], month=following_month[1],
+                       budgeted_amount=budget.budgeted_amount, user_id=current_user.id)
+                for budget in effective_budgets(current_user.id, *following_month, include_stopped=True)
+                if budget.category_id in source_amounts
+                and (budget.year, budget.month) != following_month
+                and budget.budgeted_amount != source_amounts[budget.category_id]
+            ]
+
+            Budget.query.filter(in_target_months).delete(synchronize_session=False)
+            db.session.add_all(restored_budgets)
             db.session.commit()
+            invalidate_dashboard_cache(current_user.id)
 
             app.logger.info(f"Carried over budgets from {source_year}-{source_month:02d} for {target_months} months: {budgets_created} created, {budgets_updated} updated")
 
@@ -1151,21 +1266,38 @@ def create_app():
             db.session.commit()
             app.logger.info(f"Successfully created default categories for user: {user.email}")
 
-
+    @app.cli.command("rebuild-monthly-totals")
+    @click.option('--user-id', type=int, default=None, help='Only rebuild this user\'s rows.')
+    def rebuild_monthly_totals_command(user_id):
+        """Rebuild the monthly_category_totals rollup from the raw transactions."""
+        rebuild_monthly_totals(user_id)
+        db.session.commit()
+        if user_id is not None:
+            invalidate_dashboard_cache(user_id)
+        else:
+            get_dashboard_cache().clear()
+        app.logger.info(f"Rebuilt monthly category totals{f' for user {user_id}' if user_id else ''}.")
+
+    @app.cli.command("verify-monthly-totals")
+    @click.option('--user-id', type=int, default=None, help='Only verify this user\'s rows.')
+    def verify_monthly_totals_command(user_id):
+        """Compare the monthly_category_totals rollup with the raw transactions."""
+        mismatches = verify_monthly_totals(user_id)
+        for row_user_id, year, month, category_id, expected, actual in mismatches:
+            click.echo(f"user {row_user_id} {year}-{month:02d} category {category_id}: "
+                       f"expected {expected}, found {actual}")
+        if mismatches:
+            click.echo(f"{len(mismatches)} mismatched rows. Run 'flask rebuild-monthly-totals' to fix them.")
+            raise SystemExit(1)
+        click.echo("Monthly category totals match the transactions.")
 
     return app
 
 if __name__ == '__main__':
     app = create_app()
     with app.app_context():
-        if not os.path.exists(app.config['UPLOAD_FOLDER']):
-            os.makedirs(app.config['UPLOAD_FOLDER'])
         db.create_all()
     app.run(debug=True, port=5001)
 else:
     # For production (Gunicorn will import this)
-    app = create_app()
-    with app.app_context():
-        # Ensure upload folder exists
-        if not os.path.exists(app.config['UPLOAD_FOLDER']):
-            os.makedirs(app.config['UPLOAD_FOLDER'])
\ No newline at end of file
+    app = create_app()
\ No newline at end of file
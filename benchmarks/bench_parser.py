@@ -0,0 +1,72 @@
+"""
+Micro-benchmark for the statement parser hot loop.
+
+Generates synthetic TD (MM/DD/YYYY, debit/credit columns) and American Express
+(DD Mon. YYYY, signed amount) statements in memory and reports how many rows
+per second parse_statement converts. No database is needed.
+
+Usage: python benchmarks/bench_parser.py [rows]
+"""
+import io
+import logging
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser import parse_statement  # noqa: E402
+
+MERCHANTS = ['SUPERSTORE #1234', 'TIM HORTONS #0042', 'NETFLIX.COM', 'AMAZON.CA*2K4', 'SHELL C02345',
+             'UBER EATS TORONTO', 'FORTISBC ENERGY', 'E-TRANSFER ***3kd', 'PAYROLL DEPOSIT', 'SPOTIFY P0A1B']
+
+
+def _dates(rows):
+    start = date(2019, 1, 1)
+    for i in range(rows):
+        yield start + timedelta(days=i * 5 // 100)
+
+
+def td_statement(rows):
+    rng = random.Random(1)
+    lines = []
+    for day in _dates(rows):
+        amount = f"{rng.uniform(1, 2500):,.2f}"
+        if rng.random() < 0.8:
+            debit, credit = amount, ''
+        else:
+            debit, credit = '', amount
+        lines.append(f'{day:%m/%d/%Y},{rng.choice(MERCHANTS)},{debit},{credit},"{rng.uniform(0, 9999):,.2f}"')
+    return '\n'.join(lines) + '\n'
+
+
+def amex_statement(rows):
+    rng = random.Random(2)
+    lines = ['Date,Date Processed,Description,Cardmember,Amount,Foreign Spend Amount']
+    for day in _dates(rows):
+        description = rng.choice(MERCHANTS)
+        amount = f"${rng.uniform(1, 900):,.2f}"
+        if rng.random() < 0.05:
+            description, amount = 'PAYMENT RECEIVED - THANK YOU', f"-{amount}"
+        month = day.strftime('%b') + ('.' if day.month != 5 else '')
+        lines.append(f'{day.day:02d} {month} {day.year},{day.day:02d} {month} {day.year},{description},JANE DOE,"{amount}",')
+    return '\n'.join(lines) + '\n'
+
+
+def bench(name, content, filename, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parsed = sum(1 for _ in parse_statement(io.StringIO(content), filename))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<6} {parsed:>8} rows  {best:7.3f}s  {parsed / best:>12,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    bench('TD', td_statement(rows), 'td-cb-accountactivity.csv')
+    bench('Amex', amex_statement(rows), 'amex-activity.csv')
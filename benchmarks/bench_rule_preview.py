@@ -0,0 +1,88 @@
+"""
+Benchmark for rule previews (/api/rules/preview) over a large history.
+
+Fills a temporary SQLite database with one user's synthetic transactions
+(a few thousand distinct merchants with store numbers) and reports how long
+preview_rule takes for a handful of keywords, with the FTS5 trigram index and
+with the in-process scan fallback.
+
+Usage: python benchmarks/bench_rule_preview.py [rows]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text  # noqa: E402
+
+from app import create_app  # noqa: E402
+from extensions import db  # noqa: E402
+from models import DESCRIPTION_FTS_TABLE, Transaction, User, transaction_fingerprint  # noqa: E402
+import rule_preview  # noqa: E402
+
+MERCHANTS = ['SUPERSTORE', 'TIM HORTONS', 'NETFLIX.COM', 'AMAZON.CA*', 'SHELL C0', 'UBER EATS TORONTO',
+             'FORTISBC ENERGY', 'E-TRANSFER ***', 'PAYROLL DEPOSIT', 'SPOTIFY P0', 'SAFEWAY', 'STARBUCKS',
+             'COSTCO WHOLESALE', 'LONDON DRUGS', 'PETRO-CANADA', 'DOORDASH*', 'APPLE.COM/BILL', 'IKEA']
+KEYWORDS = ['tim hortons', 'amazon.ca*', 'uber*toronto', 'starbucks #12', 'no such merchant', 'co']
+
+
+def fill(user_id, rows, batch_size=10_000):
+    rng = random.Random(1)
+    start = date(2015, 1, 1)
+    batch = []
+    for i in range(rows):
+        day = start + timedelta(days=i * 3650 // rows)
+        description = f'{rng.choice(MERCHANTS)} #{rng.randrange(400)}'
+        amount = round(-rng.uniform(1, 500), 2)
+        batch.append({
+            'date': day, 'description': description, 'amount': amount, 'account_source': 'Amex',
+            'user_id': user_id, 'fingerprint': transaction_fingerprint(user_id, day, description, amount, f'Amex{i}')
+        })
+        if len(batch) == batch_size:
+            db.session.execute(insert(Transaction), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Transaction), batch)
+    db.session.commit()
+
+
+def bench(user_id, label, repeat=5):
+    for keyword in KEYWORDS:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = rule_preview.preview_rule(user_id, keyword)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{label:<5} {result['index']:<5} {keyword!r:<20} {result['match_count']:>8} matches  {best * 1000:8.1f}ms")
+
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    # The engine is created with the app, so the database has to be chosen first
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    app = create_app()
+    try:
+        with app.app_context():
+            db.create_all()
+            user = User(email='bench@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+            fill(user.id, rows)
+            db.session.execute(text('ANALYZE'))
+            bench(user.id, 'fts5')
+
+            db.session.execute(text(f'DROP TABLE {DESCRIPTION_FTS_TABLE}'))
+            db.session.commit()
+            rule_preview._index_cache.clear()
+            bench(user.id, 'scan')
+    finally:
+        os.close(db_fd)
+        os.unlink(db_path)
@@ -0,0 +1,105 @@
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import aliased, contains_eager
+
+from extensions import db
+from models import Budget, Category, dialect_insert, supports_on_conflict
+
+# --- Effective-from budgets ---
+# A Budget row sets a category's budget from its (year, month) onwards, until
+# a later row for the same category supersedes it. A month's budget for a
+# category is therefore the latest row at or before that month, found with
+# one backwards probe of ix_budgets_category_id_year_month per category.
+# A budget of 0 stops an earlier one, which is how "no budget" is stored, so
+# those markers are left out unless include_stopped is set.
+
+
+def _at_or_before(budget, year, month):
+    return or_(budget.year < year, and_(budget.year == year, budget.month <= month))
+
+
+def effective_budgets_query(user_id, year, month, include_stopped=False):
+    """
+    Query for the Budget row in effect for each of a user's budgeted
+    categories in a month, with its category loaded. include_stopped also
+    returns the 0 rows of categories whose budget was stopped.
+    """
+    latest = aliased(Budget)
+    latest_id = select(latest.id).where(
+        latest.category_id == Category.id,
+        _at_or_before(latest, year, month)
+    ).order_by(latest.year.desc(), latest.month.desc()).limit(1).correlate(Category).scalar_subquery()
+
+    query = Budget.query.join(Category, Budget.category_id == Category.id).options(
+        contains_eager(Budget.category)
+    ).filter(
+        Category.user_id == user_id,
+        Budget.id == latest_id
+    )
+    if not include_stopped:
+        query = query.filter(Budget.budgeted_amount > 0)
+    return query
+
+
+def effective_budgets(user_id, year, month, include_stopped=False):
+    """Returns the Budget rows in effect in a month, one per budgeted category."""
+    return effective_budgets_query(user_id, year, month, include_stopped).all()
+
+
+def effective_budget_amounts(user_id, year, month):
+    """Returns {category_id: budgeted_amount} of the budgets in effect in a month."""
+    return {budget.category_id: budget.budgeted_amount for budget in effective_budgets(user_id, year, month)}
+
+
+def month_after(year, month, months=1):
+    """Returns the (year, month) that is months after (year, month)."""
+    year, month_index = divmod(year * 12 + month - 1 + months, 12)
+    return year, month_index + 1
+
+
+def months_between(budget, start, end):
+    """Filter for budgets with start < (year, month) <= end, both given as (year, month)."""
+    (start_year, start_month), (end_year, end_month) = start, end
+    return and_(
+        or_(budget.year > start_year, and_(budget.year == start_year, budget.month > start_month)),
+        _at_or_before(budget, end_year, end_month)
+    )
+
+
+def save_budgets(user_id, amounts):
+    """
+    Sets the user's budgets from {(category_id, month, year): budgeted_amount}
+    in one upsert on _category_month_year_user_uc. The caller commits.
+    Returns the number of budgets saved.
+    """
+    if not amounts:
+        return 0
+    if supports_on_conflict():
+        stmt = dialect_insert(Budget)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['category_id', 'month', 'year', 'user_id'],
+            set_={'budgeted_amount': stmt.excluded.budgeted_amount}
+        ).returning(Budget.id)
+        values = [
+            {'category_id': category_id, 'month': month, 'year': year,
+             'budgeted_amount': budgeted_amount, 'user_id': user_id}
+            for (category_id, month, year), budgeted_amount in amounts.items()
+        ]
+        return len(db.session.execute(stmt, values).all())
+
+    # Without ON CONFLICT the existing rows are loaded and updated, the rest added
+    existing = {
+        (budget.category_id, budget.month, budget.year): budget
+        for budget in Budget.query.filter(
+            Budget.user_id == user_id,
+            Budget.category_id.in_({category_id for category_id, _, _ in amounts})
+        )
+    }
+    for (category_id, month, year), budgeted_amount in amounts.items():
+        budget = existing.get((category_id, month, year))
+        if budget is None:
+            db.session.add(Budget(category_id=category_id, month=month, year=year,
+                                  budgeted_amount=budgeted_amount, user_id=user_id))
+        else:
+            budget.budgeted_amount = budgeted_amount
+    db.session.flush()
+    return len(amounts)
@@ -0,0 +1,174 @@
+from datetime import date
+
+from sqlalchemy import delete, func, select, update
+
+from categorizer import compile_keyword, keyword_like_pattern
+from extensions import db
+from models import Transaction, transaction_fingerprint
+from rollup import month_of, refresh_monthly_totals
+
+# --- Bulk operations on a user's transactions ---
+# Transactions are selected by an id list or a filter and changed with
+# set-based statements, not one ORM object at a time. These statements bypass
+# the unit of work, so each operation refreshes the monthly rollup for the
+# months it touched itself. The caller commits and invalidates the dashboard.
+
+BULK_ACTIONS = ('recategorize', 'delete', 'update')
+UPDATABLE_FIELDS = ('date', 'description', 'amount', 'account_source')
+MAX_BULK_IDS = 10000
+FINGERPRINT_CHUNK_SIZE = 500
+
+
+class DuplicateTransactionsError(ValueError):
+    """A bulk update would make transactions duplicates of each other or of existing ones."""
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _description_filter(user_id, keyword_pattern):
+    like = func.lower(Transaction.description).like(keyword_like_pattern(keyword_pattern), escape='\\')
+    if keyword_pattern.isascii() or db.engine.dialect.name == 'postgresql':
+        return like
+    # SQLite only folds ASCII case in lower() and LIKE, so non-ASCII keywords
+    # are checked with the keyword's regex against the user's descriptions
+    keyword = compile_keyword(keyword_pattern)
+    descriptions = db.session.execute(
+        select(Transaction.description).where(Transaction.user_id == user_id).distinct()
+    ).scalars()
+    return Transaction.description.in_([description for description in descriptions
+                                        if keyword.search(description.lower())])
+
+
+def bulk_criteria(user_id, ids=None, filters=None):
+    """
+    Returns the WHERE criteria for the user's transactions selected by ids or
+    by filters: start_date/end_date (YYYY-MM-DD, end exclusive),
+    account_source, description (a rule-style keyword, * wildcards) and
+    category_id (null for uncategorized). Raises ValueError when the
+    selection is missing or invalid.
+    """
+    if (ids is None) == (filters is None):
+        raise ValueError('Provide either ids or filter')
+
+    criteria = [Transaction.user_id == user_id]
+    if ids is not None:
+        if not isinstance(ids, list) or not all(_is_id(transaction_id) for transaction_id in ids):
+            raise ValueError('ids must be a list of transaction ids')
+        if len(ids) > MAX_BULK_IDS:
+            raise ValueError(f'At most {MAX_BULK_IDS} ids can be given')
+        criteria.append(Transaction.id.in_(ids))
+        return criteria
+
+    if not isinstance(filters, dict) or not filters:
+        raise ValueError('filter must be a non-empty object')
+    unknown = set(filters) - {'start_date', 'end_date', 'account_source', 'description', 'category_id'}
+    if unknown:
+        raise ValueError(f"Unknown filter keys: {', '.join(sorted(unknown))}")
+    if 'start_date' in filters:
+        criteria.append(Transaction.date >= date.fromisoformat(filters['start_date']))
+    if 'end_date' in filters:
+        criteria.append(Transaction.date < date.fromisoformat(filters['end_date']))
+    if 'account_source' in filters:
+        criteria.append(Transaction.account_source == filters['account_source'])
+    if 'description' in filters:
+        if not isinstance(filters['description'], str) or not filters['description']:
+            raise ValueError('description filter cannot be empty')
+        criteria.append(_description_filter(user_id, filters['description']))
+    if 'category_id' in filters:
+        category_id = filters['category_id']
+        if category_id is not None and not _is_id(category_id):
+            raise ValueError('category_id filter must be a category id or null')
+        criteria.append(Transaction.category_id.is_(None) if category_id is None else Transaction.category_id == category_id)
+    return criteria
+
+
+def _touched_months(user_id, criteria):
+    dates = db.session.execute(select(Transaction.date).where(*criteria).distinct()).scalars()
+    return {month_of(user_id, day) for day in dates}
+
+
+def recategorize_transactions(user_id, criteria, category_id):
+    """
+    Sets the category (None to uncategorize) of the selected transactions,
+    marked as assigned by hand. Returns the number changed.
+    """
+    months = _touched_months(user_id, criteria)
+    result = db.session.execute(
+        update(Transaction).where(*criteria).values(category_id=category_id, category_manual=True),
+        execution_options={'synchronize_session': False}
+    )
+    refresh_monthly_totals(months)
+    return result.rowcount
+
+
+def delete_transactions(user_id, criteria):
+    """Deletes the selected transactions. Returns the number deleted."""
+    months = _touched_months(user_id, criteria)
+    result = db.session.execute(
+        delete(Transaction).where(*criteria),
+        execution_options={'synchronize_session': False}
+    )
+    refresh_monthly_totals(months)
+    return result.rowcount
+
+
+def update_transactions(user_id, criteria, fields):
+    """
+    Sets date, description, amount and/or account_source of the selected
+    transactions. These fields make up the duplicate fingerprint, so it is
+    recomputed per row and the rows are written with one executemany UPDATE
+    by id. Raises DuplicateTransactionsError when the result would contain
+    duplicates. Returns the number updated.
+    """
+    if not isinstance(fields, dict) or not fields:
+        raise ValueError('fields must be a non-empty object')
+    unknown = set(fields) - set(UPDATABLE_FIELDS)
+    if unknown:
+        raise ValueError(f"Fields cannot be updated in bulk: {', '.join(sorted(unknown))}")
+    values = dict(fields)
+    if 'date' in values:
+        values['date'] = date.fromisoformat(values['date'])
+    if 'amount' in values:
+        values['amount'] = float(values['amount'])
+    for field in ('description', 'account_source'):
+        if field in values and not (isinstance(values[field], str) and values[field].strip()):
+            raise ValueError(f'{field} cannot be empty')
+
+    rows = db.session.execute(select(
+        Transaction.id, Transaction.date, Transaction.description, Transaction.amount, Transaction.account_source,
+        Transaction.fingerprint
+    ).where(*criteria)).all()
+    if not rows:
+        return 0
+
+    months = {month_of(user_id, row.date) for row in rows}
+    updates = []
+    for row in rows:
+        old_row = row._asdict()
+        new_row = {**old_row, **values}
+        # Unchanged rows keep their fingerprint, which for historical
+        # duplicates is salted with the row id
+        if new_row != old_row:
+            new_row['fingerprint'] = transaction_fingerprint(
+                user_id, new_row['date'], new_row['description'], new_row['amount'], new_row['account_source']
+            )
+        updates.append(new_row)
+        months.add(month_of(user_id, new_row['date']))
+
+    fingerprints = [new_row['fingerprint'] for new_row in updates]
+    if len(set(fingerprints)) != len(fingerprints):
+        raise DuplicateTransactionsError('The update would make some of the selected transactions identical')
+    # Rows being updated may keep their fingerprint; any other holder is a clash
+    updated_ids = {new_row['id'] for new_row in updates}
+    for start in range(0, len(fingerprints), FINGERPRINT_CHUNK_SIZE):
+        holders = db.session.execute(select(Transaction.id).where(
+            Transaction.fingerprint.in_(fingerprints[start:start + FINGERPRINT_CHUNK_SIZE])
+        )).scalars()
+        if any(holder not in updated_ids for holder in holders):
+            raise DuplicateTransactionsError('The update would duplicate an existing transaction')
+
+    db.session.execute(update(Transaction), updates)
+    refresh_monthly_totals(months)
+    return len(updates)
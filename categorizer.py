@@ -1,11 +1,13 @@
 import re
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import threading
+from itertools import chain
+from sqlalchemy import create_engine, event, func, inspect, select, update
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
 from contextlib import contextmanager
 
 # Assuming models.py and extensions.py are in the same directory or accessible in PYTHONPATH
 # and app.py initializes the db with the app context.
-from models import Category, Rule # Import your SQLAlchemy models
+from models import Category, Rule, User # Import your SQLAlchemy models
 from extensions import db # Import the db instance
 
 # To allow this module to be used standalone or within a Flask app context,
@@ -39,47 +41,191 @@ def get_db_session():
             print(f"Error creating database session: {e}")
             yield None
 
+def _rule_to_regex(keyword_pattern):
+    """Converts a rule keyword (with optional * wildcards) to a regex fragment."""
+    if '*' in keyword_pattern:
+        regex_parts = [re.escape(part) for part in keyword_pattern.split('*')]
+        return '.*'.join(regex_parts)
+    return re.escape(keyword_pattern)
+
+def keyword_like_pattern(keyword_pattern):
+    """
+    Converts a rule keyword (with optional * wildcards) to a LIKE pattern
+    (escape character '\\') matching the same descriptions as the rule, for
+    use against lower(description).
+    """
+    escaped = keyword_pattern.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%' + escaped.replace('*', '%') + '%'
+
+def compile_keyword(keyword_pattern):
+    """Compiles a single rule keyword the way RuleMatcher matches it, for use against lower(description)."""
+    return re.compile(_rule_to_regex(keyword_pattern), re.IGNORECASE)
+
+class RuleMatcher:
+    """All of one user's rules compiled into a single pattern.
+
+    Each rule becomes a lookahead alternative tried from the start of the
+    description, ordered longest rule first. The regex engine takes the first
+    alternative that matches anywhere in the string, which is exactly the
+    "longest rule wins" behaviour of checking the rules one by one.
+    """
+
+    def __init__(self, rules):
+        # rules: iterable of (keyword_pattern, category_id, category_name), longest first
+        self.categories = []
+        alternatives = []
+        for keyword_pattern, category_id, category_name in rules:
+            fragment = _rule_to_regex(keyword_pattern)
+            try:
+                re.compile(fragment, re.IGNORECASE)
+            except re.error as e:
+                print(f"Regex error for rule '{keyword_pattern}': {e}")
+                continue
+            alternatives.append(f'(?=[\\s\\S]*?({fragment}))')
+            self.categories.append((category_id, category_name))
+
+        if alternatives:
+            self._pattern = re.compile('^(?:' + '|'.join(alternatives) + ')', re.IGNORECASE)
+        else:
+            self._pattern = None
+
+    def match(self, description):
+        """Returns (category_id, category_name) of the winning rule, or None."""
+        if not description or self._pattern is None:
+            return None
+        m = self._pattern.match(description.lower())
+        if m is None:
+            return None
+        return self.categories[m.lastindex - 1]
+
+# Compiled matchers keyed by (database url, user_id), each stored with the
+# user's rules_version it was built from. Every flush that touches a user's
+# rules or categories bumps users.rules_version in the same transaction, so a
+# worker whose cached matcher predates a change made by another worker sees a
+# newer version on its next lookup and rebuilds. The rule/category endpoints
+# also call invalidate_rule_cache() to drop the local copy right away.
+_matcher_cache = {}
+_matcher_cache_lock = threading.Lock()
+
+def _cache_key(user_id):
+    return (str(db.engine.url), user_id)
+
+def _rules_version(session, user_id):
+    # Checked once per transaction, so an import categorizes every batch with
+    # the same rules and does not pay a lookup per batch
+    checked = session.info.setdefault('rules_versions', {})
+    transaction = session.get_transaction()
+    if transaction is not None and user_id in checked and checked[user_id][0] is transaction:
+        return checked[user_id][1]
+    if user_id:
+        version = session.execute(select(User.rules_version).where(User.id == user_id)).scalar()
+    else:
+        version = session.execute(select(func.coalesce(func.sum(User.rules_version), 0))).scalar()
+    checked[user_id] = (session.get_transaction(), version)
+    return version
+
+def get_rule_matcher(user_id=None, session=None):
+    """Returns the cached RuleMatcher for a user, building it when missing or older than their rules."""
+    session = session or db.session
+    if isinstance(session, scoped_session):
+        session = session()
+    key = _cache_key(user_id)
+    version = _rules_version(session, user_id)
+    cached = _matcher_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    query = session.query(Rule.keyword_pattern, Category.id, Category.name).join(Category)
+    if user_id:
+        query = query.filter(Category.user_id == user_id)
+    rules = query.order_by(db.func.length(Rule.keyword_pattern).desc(), Rule.id).all()
+    matcher = RuleMatcher(rules)
+
+    with _matcher_cache_lock:
+        _matcher_cache[key] = (version, matcher)
+    return matcher
+
+@event.listens_for(Session, 'after_flush')
+def _bump_rules_version_after_flush(session, flush_context):
+    user_ids, category_ids = set(), set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, Category):
+            user_ids.add(obj.user_id)
+        elif isinstance(obj, Rule):
+            # A rule moved to another category changes both categories' users
+            category_ids.update(inspect(obj).attrs.category_id.history.deleted)
+            category_ids.add(obj.category_id)
+    user_ids.discard(None)
+    category_ids.discard(None)
+    if not user_ids and not category_ids:
+        return
+    session.info.pop('rules_versions', None)
+    session.connection().execute(update(User).where(
+        User.id.in_(user_ids) | User.id.in_(select(Category.user_id).where(Category.id.in_(category_ids)))
+    ).values(rules_version=User.rules_version + 1))
+
+def invalidate_rule_cache(user_id=None):
+    """Drops the compiled matcher for a user after their rules or categories change."""
+    with _matcher_cache_lock:
+        _matcher_cache.pop(_cache_key(user_id), None)
+
+def clear_rule_cache():
+    """Drops every compiled matcher (used by tests and CLI commands)."""
+    with _matcher_cache_lock:
+        _matcher_cache.clear()
+
 def assign_category(description, user_id=None):
     """Assigns a category to a transaction based on its description using DB rules."""
     if not description:
         return None
 
-    desc_lower = description.lower()
-
     with get_db_session() as session:
         if not session:
             print("Error: No DB session available in assign_category.")
             return None
 
         try:
-            # Get all rules for the specific user, ordered by length (longer rules first for more specificity)
-            query = session.query(Rule).join(Category)
-            if user_id:
-                query = query.filter(Category.user_id == user_id)
-            rules = query.order_by(db.func.length(Rule.keyword_pattern).desc()).all()
+            match = get_rule_matcher(user_id, session).match(description)
+            if match:
+                return match[1]
+        except Exception as e:
+            print(f"Error assigning category: {e}")
+            return None
 
-            for rule in rules:
-                try:
-                    # Convert wildcards to regex pattern
-                    if '*' in rule.keyword_pattern:
-                        regex_parts = [re.escape(part) for part in rule.keyword_pattern.split('*')]
-                        pattern_to_search = '.*'.join(regex_parts)
-                    else:
-                        pattern_to_search = re.escape(rule.keyword_pattern)
+    return None
+
+def assign_categories(descriptions, user_id=None):
+    """Assigns category ids to many descriptions for one user in a single pass.
 
-                    # Search for pattern in description
-                    if re.search(pattern_to_search, desc_lower, re.IGNORECASE):
-                        return rule.category.name
+    The user's rules are loaded once and each distinct description is matched
+    once. Returns a list of category ids (None when no rule matches) in the same
+    order as descriptions.
+    """
+    descriptions = list(descriptions)
+    if not descriptions:
+        return []
 
-                except re.error as e:
-                    print(f"Regex error for rule '{rule.keyword_pattern}' (ID: {rule.id}): {e}")
-                    continue
+    with get_db_session() as session:
+        if not session:
+            print("Error: No DB session available in assign_categories.")
+            return [None] * len(descriptions)
 
+        try:
+            matcher = get_rule_matcher(user_id, session)
         except Exception as e:
-            print(f"Error assigning category: {e}")
-            return None
+            print(f"Error loading rules for categorization: {e}")
+            return [None] * len(descriptions)
 
-    return None
+    resolved = {}
+    category_ids = []
+    for description in descriptions:
+        if description not in resolved:
+            match = matcher.match(description)
+            resolved[description] = match[0] if match else None
+        category_ids.append(resolved[description])
+    return category_ids
 
 def get_defined_categories(user_id=None):
     """Returns a sorted list of unique category names from the database."""
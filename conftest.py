@@ -4,17 +4,26 @@ Pytest configuration and fixtures for Budgetly application tests
 import pytest
 import tempfile
 import os
+import shutil
+import threading
+from sqlalchemy import event
 from werkzeug.security import generate_password_hash
 from app import create_app
+from categorizer import clear_rule_cache
 from extensions import db
+from metrics import registry as metrics_registry
 from models import User, Category, Rule, Transaction, Budget
 
 
 @pytest.fixture(scope='function')
-def app():
+def app(monkeypatch):
     """Create and configure a new app instance for each test."""
     # Create a temporary file to isolate the database for each test
     db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    metrics_dir = tempfile.mkdtemp()
+    # The shared dashboard cache file is opened by create_app
+    cache_dir = tempfile.mkdtemp()
+    monkeypatch.setenv('DASHBOARD_CACHE_PATH', os.path.join(cache_dir, 'dashboard_cache.db'))
 
     # Create app with test configuration
     app = create_app()
@@ -22,12 +31,15 @@ def app():
         "TESTING": True,
         "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
         "WTF_CSRF_ENABLED": False,  # Disable CSRF for easier testing
-        "SECRET_KEY": "test-secret-key"
+        "SECRET_KEY": "test-secret-key",
+        "METRICS_DIR": metrics_dir
     })
 
     # Create the database and the database table
     with app.app_context():
         db.create_all()
+    clear_rule_cache()
+    metrics_registry.reset()
 
     yield app
 
@@ -37,6 +49,8 @@ def app():
         db.drop_all()
     os.close(db_fd)
     os.unlink(db_path)
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    shutil.rmtree(cache_dir, ignore_errors=True)
 
 
 @pytest.fixture(scope='function')
@@ -45,6 +59,50 @@ def client(app):
     return app.test_client()
 
 
+class QueryCounter:
+    """Counts the SQL statements (database round trips) issued by the current thread.
+
+    Listens on the engine only while the block runs, which suits tests; the
+    app measures its own statements with instrumentation.track_queries.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.statements = []
+        self._thread_id = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Engine events fire for every thread using the engine, only count our own
+        if threading.get_ident() != self._thread_id:
+            return
+        self.count += 1
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return False
+
+
+@pytest.fixture
+def query_counter(app):
+    """
+    Counts the SQL statements issued while handling requests:
+
+        with query_counter() as counter:
+            auth_client.get('/')
+        assert counter.count == 4
+    """
+    with app.app_context():
+        engine = db.engine
+    return lambda: QueryCounter(engine)
+
+
 @pytest.fixture
 def runner(app):
     """A test runner for the app's Click commands."""
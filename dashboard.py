@@ -0,0 +1,101 @@
+from sqlalchemy import func
+
+from budgets import effective_budgets
+from extensions import db
+from models import Category, MonthlyCategoryTotal
+
+UNCATEGORIZED = 'Uncategorized'
+TOP_SPENDING_LIMIT = 5
+
+
+def category_totals_for_month(user_id, year, month):
+    """
+    Returns one row per category with transactions in the month: name, income
+    (sum of positive amounts), expenses (sum of negative amounts) and
+    transaction_count. Uncategorized transactions form their own row. Reads
+    the monthly rollup, so the cost depends on the number of categories only.
+    """
+    return db.session.query(
+        func.coalesce(Category.name, UNCATEGORIZED).label('name'),
+        MonthlyCategoryTotal.income_sum.label('income'),
+        MonthlyCategoryTotal.expense_sum.label('expenses'),
+        MonthlyCategoryTotal.txn_count.label('transaction_count')
+    ).outerjoin(
+        Category, MonthlyCategoryTotal.category_id == Category.id
+    ).filter(
+        MonthlyCategoryTotal.user_id == user_id,
+        MonthlyCategoryTotal.year == year,
+        MonthlyCategoryTotal.month == month
+    ).all()
+
+
+def build_dashboard(user_id, year, month):
+    """
+    Computes the numbers shown on the home page for a user and month: totals
+    per category, income/expense sums, chart data, top spending categories
+    and budget progress. Everything comes from two queries, over the monthly
+    rollup and the budgets in effect, so the cost depends on the number of
+    categories, not transactions.
+    """
+    category_totals = {}
+    expense_categories = {}
+    total_income = 0.0
+    total_expenses = 0.0
+    transaction_count = 0
+
+    for row in category_totals_for_month(user_id, year, month):
+        income, expenses = row.income or 0.0, row.expenses or 0.0
+        # A user category called "Uncategorized" shares its totals with uncategorized rows
+        category_totals[row.name] = category_totals.get(row.name, 0.0) + income + expenses
+        if expenses < 0:
+            expense_categories[row.name] = expense_categories.get(row.name, 0.0) + abs(expenses)
+        total_income += income
+        total_expenses += expenses
+        transaction_count += row.transaction_count
+
+    # Largest spending first, for the chart and the top 5 list
+    expense_categories = dict(sorted(expense_categories.items(), key=lambda x: x[1], reverse=True))
+
+    budget_data = {}
+    total_budgeted = 0
+    total_spent = 0
+    for budget in effective_budgets(user_id, year, month):
+        category_name, budgeted_amount = budget.category.name, budget.budgeted_amount
+        # Actual spending for this category (only net expenses count)
+        category_total = category_totals.get(category_name, 0)
+        actual_spent = abs(category_total) if category_total < 0 else 0
+
+        budget_data[category_name] = {
+            'budgeted': budgeted_amount,
+            'spent': actual_spent,
+            'remaining': budgeted_amount - actual_spent,
+            'percentage': (actual_spent / budgeted_amount * 100) if budgeted_amount > 0 else 0,
+            'over_budget': actual_spent > budgeted_amount
+        }
+        total_budgeted += budgeted_amount
+        total_spent += actual_spent
+
+    return {
+        'category_totals': category_totals,
+        'transaction_count': transaction_count,
+        'total_income': total_income,
+        'total_expenses': abs(total_expenses),
+        'net_amount': total_income + total_expenses,  # expenses are negative
+        'expense_chart_data': {
+            'labels': list(expense_categories.keys()),
+            'data': list(expense_categories.values())
+        },
+        'bar_chart_data': {
+            'labels': ['Income', 'Expenses'],
+            'data': [total_income, abs(total_expenses)]
+        },
+        'top_spending_categories': list(expense_categories.items())[:TOP_SPENDING_LIMIT],
+        'budget_data': budget_data,
+        'budget_summary': {
+            'total_budgeted': total_budgeted,
+            'total_spent': total_spent,
+            'total_remaining': total_budgeted - total_spent,
+            'overall_percentage': (total_spent / total_budgeted * 100) if total_budgeted > 0 else 0,
+            'over_budget': total_spent > total_budgeted
+        }
+    }
@@ -0,0 +1,204 @@
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+# Safety net for writes that bypass the app (migrations, manual SQL); app writes invalidate explicitly
+DEFAULT_TTL = 300
+DEFAULT_LRU_SIZE = 256
+
+# Every backend keeps a generation per user that invalidate_user moves to a
+# new, never used value, and callers put it in the cache key (see
+# dashboard_cache_key). A request that read the generation before a write and
+# stores its dashboard after the invalidation stores it under the old
+# generation, where no later request looks, instead of bringing back stale
+# numbers until the TTL.
+
+
+class LRUBackend:
+    """In-process LRU. Only suitable for a single process: other workers never see its invalidations."""
+
+    def __init__(self, max_entries=DEFAULT_LRU_SIZE, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (user_id, key) -> (expires_at, value)
+        self._next_generation = itertools.count(1)
+        self._generations = {}  # user_id -> generation, for users invalidated since the last clear
+        self._cleared_generation = 0
+
+    def generation(self, user_id):
+        with self._lock:
+            return self._generations.get(user_id, self._cleared_generation)
+
+    def get(self, user_id, key):
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[(user_id, key)]
+                return None
+            self._entries.move_to_end((user_id, key))
+            return entry[1]
+
+    def set(self, user_id, key, value):
+        with self._lock:
+            self._entries[(user_id, key)] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._generations[user_id] = next(self._next_generation)
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[0] == user_id]:
+                del self._entries[entry_key]
+
+    def clear(self):
+        with self._lock:
+            self._cleared_generation = next(self._next_generation)
+            self._generations.clear()
+            self._entries.clear()
+
+
+class SQLiteBackend:
+    """
+    Cache in a local SQLite file, shared by every worker process on the host,
+    so an invalidation in one worker is seen by all of them. Values are JSON.
+    Generations come from one counter for the whole file; user_id 0 holds the
+    generation of users not invalidated since the last clear.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS dashboard_cache ('
+                ' user_id INTEGER NOT NULL,'
+                ' cache_key TEXT NOT NULL,'
+                ' value TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL,'
+                ' PRIMARY KEY (user_id, cache_key))'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS dashboard_cache_generations ('
+                ' user_id INTEGER PRIMARY KEY,'
+                ' generation INTEGER NOT NULL)'
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def generation(self, user_id):
+        row = self._connection().execute(
+            'SELECT generation FROM dashboard_cache_generations WHERE user_id IN (?, 0) ORDER BY user_id DESC LIMIT 1',
+            (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _bump_generation(self, conn, user_id):
+        conn.execute(
+            'INSERT OR REPLACE INTO dashboard_cache_generations (user_id, generation)'
+            ' SELECT ?, COALESCE(MAX(generation), 0) + 1 FROM dashboard_cache_generations',
+            (user_id,)
+        )
+
+    def get(self, user_id, key):
+        row = self._connection().execute(
+            'SELECT value FROM dashboard_cache WHERE user_id = ? AND cache_key = ? AND expires_at >= ?',
+            (user_id, key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, user_id, key, value):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO dashboard_cache (user_id, cache_key, value, expires_at) VALUES (?, ?, ?, ?)',
+                (user_id, key, json.dumps(value), now + self.ttl)
+            )
+            conn.execute('DELETE FROM dashboard_cache WHERE user_id = ? AND expires_at < ?', (user_id, now))
+
+    def invalidate_user(self, user_id):
+        with self._connection() as conn:
+            self._bump_generation(conn, user_id)
+            conn.execute('DELETE FROM dashboard_cache WHERE user_id = ?', (user_id,))
+
+    def clear(self):
+        with self._connection() as conn:
+            self._bump_generation(conn, 0)
+            conn.execute('DELETE FROM dashboard_cache_generations WHERE user_id != 0')
+            conn.execute('DELETE FROM dashboard_cache')
+
+
+class NullBackend:
+    """Caching disabled."""
+
+    def generation(self, user_id):
+        return 0
+
+    def get(self, user_id, key):
+        return None
+
+    def set(self, user_id, key, value):
+        pass
+
+    def invalidate_user(self, user_id):
+        pass
+
+    def clear(self):
+        pass
+
+
+def init_dashboard_cache(app):
+    """
+    Creates the dashboard cache backend selected by DASHBOARD_CACHE: 'sqlite'
+    (default, file at DASHBOARD_CACHE_PATH shared by all workers), 'lru'
+    (in-process, refused when WEB_CONCURRENCY asks for several workers) or
+    'none'.
+    """
+    backend_name = app.config.setdefault('DASHBOARD_CACHE', 'sqlite')
+    ttl = app.config.setdefault('DASHBOARD_CACHE_TTL', DEFAULT_TTL)
+    if backend_name == 'lru':
+        workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+        if workers > 1:
+            raise ValueError(f"DASHBOARD_CACHE 'lru' is per process and would serve stale dashboards "
+                             f"with WEB_CONCURRENCY={workers} workers; use 'sqlite'")
+        backend = LRUBackend(app.config.get('DASHBOARD_CACHE_SIZE', DEFAULT_LRU_SIZE), ttl)
+    elif backend_name == 'sqlite':
+        backend = SQLiteBackend(app.config['DASHBOARD_CACHE_PATH'], ttl)
+    elif backend_name == 'none':
+        backend = NullBackend()
+    else:
+        raise ValueError(f"Unknown DASHBOARD_CACHE backend '{backend_name}'")
+    app.extensions['dashboard_cache'] = backend
+    return backend
+
+
+def get_dashboard_cache():
+    return current_app.extensions['dashboard_cache']
+
+
+def dashboard_cache_key(year, month, generation):
+    """Key of a user's cached month; generation is the backend's generation(user_id) read before building it."""
+    return f'{generation}:{year}-{month:02d}'
+
+
+def invalidate_dashboard_cache(user_id):
+    """Drops every cached dashboard month of a user. Call after committing any change to their data."""
+    get_dashboard_cache().invalidate_user(user_id)
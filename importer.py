@@ -0,0 +1,75 @@
+import logging
+
+from instrumentation import track_queries
+from metrics import IMPORT_DUPLICATES_SKIPPED, registry as metrics
+from models import insert_new_transactions, transaction_fingerprint
+from parser import DEFAULT_BATCH_SIZE, categorize_batch, iter_batches, parse_statement
+from rollup import month_of, refresh_monthly_totals
+
+logger = logging.getLogger(__name__)
+
+
+def import_statement(source, original_filename, user_id, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Streams an uploaded statement into the database for a user. source is a
+    path, an upload stream (e.g. FileStorage.stream) or a text stream.
+
+    Rows flow parse -> categorize -> dedup -> insert in batches of batch_size,
+    so memory stays bounded by one batch no matter how long the file is. The
+    caller commits. Returns a dict with parsed, added and duplicate counts, the
+    number of database round trips made and the time spent in them.
+    """
+    stats = {'parsed': 0, 'added': 0, 'duplicates': 0}
+    touched_months = set()
+    with track_queries() as queries:
+        for batch in iter_batches(parse_statement(source, original_filename), batch_size):
+            categorize_batch(batch, user_id)
+            added_count, duplicate_count = save_transactions(batch, user_id)
+            stats['parsed'] += len(batch)
+            stats['added'] += added_count
+            stats['duplicates'] += duplicate_count
+            if added_count:
+                touched_months.update(month_of(user_id, row['date']) for row in batch)
+        # Bulk inserts bypass the ORM, so the monthly rollup is refreshed here, once per month
+        refresh_monthly_totals(touched_months)
+
+    stats['db_round_trips'] = queries.count
+    stats['db_ms'] = round(queries.total_time * 1000, 2)
+    metrics.inc(IMPORT_DUPLICATES_SKIPPED, stats['duplicates'])
+    logger.info(f"Imported {original_filename}: {stats['parsed']} parsed, {stats['added']} added, "
+                f"{stats['duplicates']} duplicates, {stats['db_round_trips']} database round trips "
+                f"({stats['db_ms']:.2f}ms)")
+    return stats
+
+
+def save_transactions(rows, user_id):
+    """
+    Inserts parsed rows (dicts with date, description, amount, account_source
+    and category_id) for a user, skipping duplicates.
+
+    Duplicates are decided by the unique transactions.fingerprint index: rows
+    are written with a single INSERT ... ON CONFLICT DO NOTHING, so a row that
+    already exists, repeats an earlier row of the same file, or is inserted
+    concurrently by another upload is skipped by the database (see
+    models.insert_new_transactions for databases without ON CONFLICT). The caller
+    commits and refreshes the monthly rollup (rollup.refresh_monthly_totals).
+    Returns (added_count, duplicate_count).
+    """
+    if not rows:
+        return 0, 0
+
+    values = [{
+        'date': row['date'],
+        'description': row['description'],
+        'amount': row['amount'],
+        'account_source': row['account_source'],
+        'category_id': row.get('category_id'),
+        'user_id': user_id,
+        'fingerprint': transaction_fingerprint(
+            user_id, row['date'], row['description'], row['amount'], row['account_source']
+        )
+    } for row in rows]
+
+    added_count = insert_new_transactions(values)
+
+    return added_count, len(values) - added_count
@@ -0,0 +1,152 @@
+import heapq
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# --- Per-request SQL instrumentation ---
+# Every request gets a RequestQueryStats on flask.g. Engine-wide cursor events
+# time each statement and record it on the stats of the request that issued it,
+# and on those of any track_queries() block the issuing thread is in (imports
+# report their own statements that way, inside or outside a request). Other
+# statements run outside a request (CLI, tests, startup) are ignored.
+
+SLOWEST_STATEMENTS = 3
+DEFAULT_SLOW_QUERY_THRESHOLD_MS = 100.0
+
+_engine_listeners_installed = False
+
+
+class RequestQueryStats:
+    """Statement count, total database time and slowest statements of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self._slowest = []  # min-heap of (duration, statement), at most SLOWEST_STATEMENTS
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total_time += duration
+        entry = (duration, statement)
+        if len(self._slowest) < SLOWEST_STATEMENTS:
+            heapq.heappush(self._slowest, entry)
+        elif duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        """(duration, statement) pairs, slowest first."""
+        return sorted(self._slowest, reverse=True)
+
+
+def parameter_shape(parameters, executemany=False):
+    """Describes statement parameters without their values, e.g. '500 x (str, float)'."""
+    if executemany:
+        count = len(parameters)
+        return f"{count} x {parameter_shape(parameters[0])}" if count else '0 x ()'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in parameters.items()) + '}'
+    if isinstance(parameters, (tuple, list)):
+        return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+    return type(parameters).__name__
+
+
+_tracked = threading.local()
+
+
+def _current_request_stats():
+    if not has_request_context():
+        return None
+    return g.get('sql_stats')
+
+
+@contextmanager
+def track_queries():
+    """
+    Yields a RequestQueryStats of the statements the current thread issues
+    inside the block, recorded by the engine-wide listeners that
+    init_request_instrumentation installs (nothing is listened to per block):
+
+        with track_queries() as queries:
+            ...
+        print(queries.count, queries.total_time)
+    """
+    stats = RequestQueryStats()
+    blocks = _tracked.__dict__.setdefault('blocks', [])
+    blocks.append(stats)
+    try:
+        yield stats
+    finally:
+        blocks.remove(stats)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and (_current_request_stats() is not None or getattr(_tracked, 'blocks', None)):
+        context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_time = getattr(context, '_query_start_time', None)
+    if start_time is None:
+        return
+    duration = time.perf_counter() - start_time
+    for block_stats in getattr(_tracked, 'blocks', ()):
+        block_stats.record(statement, duration)
+    stats = _current_request_stats()
+    if stats is None:
+        return
+    stats.record(statement, duration)
+
+    threshold_ms = current_app.config.get('SLOW_QUERY_THRESHOLD_MS', DEFAULT_SLOW_QUERY_THRESHOLD_MS)
+    if threshold_ms is not None and duration * 1000 >= threshold_ms:
+        current_app.logger.warning(
+            f"Slow query took {duration * 1000:.2f}ms in {request.method} {request.path} "
+            f"(endpoint={request.endpoint}) params={parameter_shape(parameters, executemany)}: {statement}"
+        )
+
+
+def _start_request_stats():
+    g.sql_stats = RequestQueryStats()
+    g.request_start_time = time.perf_counter()
+
+
+def _report_request_stats(response):
+    stats = g.get('sql_stats')
+    if stats is None:
+        return response
+    total_ms = (time.perf_counter() - g.request_start_time) * 1000
+    db_ms = stats.total_time * 1000
+
+    response.headers['Server-Timing'] = (
+        f'db;dur={db_ms:.2f};desc="{stats.count} queries", app;dur={total_ms:.2f}'
+    )
+    slowest = ', '.join(f"{duration * 1000:.2f}ms {' '.join(statement.split())[:120]}"
+                        for duration, statement in stats.slowest)
+    current_app.logger.info(
+        f"request method={request.method} path={request.path} endpoint={request.endpoint} "
+        f"status={response.status_code} queries={stats.count} db_ms={db_ms:.2f} total_ms={total_ms:.2f} "
+        f"slowest=[{slowest}]"
+    )
+    return response
+
+
+def init_request_instrumentation(app):
+    """
+    Records the SQL statements of every request: count, total database time and
+    the slowest statements. They are sent back in a Server-Timing header and
+    logged as one key=value line per request. Statements slower than
+    SLOW_QUERY_THRESHOLD_MS (None disables it) are logged with their SQL, the
+    shape of their parameters and the route that ran them.
+    """
+    global _engine_listeners_installed
+    app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', DEFAULT_SLOW_QUERY_THRESHOLD_MS)
+    if not _engine_listeners_installed:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _engine_listeners_installed = True
+    app.before_request(_start_request_stats)
+    app.after_request(_report_request_stats)
@@ -0,0 +1,307 @@
+import atexit
+import glob
+import hmac
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, current_app, g, request
+from flask_login import current_user
+
+try:
+    import fcntl
+except ImportError:  # Windows: no locking, so exited workers' files are never pruned
+    fcntl = None
+
+# --- Metric definitions ---
+# name -> (type, help text). Histograms share LATENCY_BUCKETS.
+
+REQUESTS_TOTAL = 'budgetly_http_requests_total'
+REQUEST_DURATION = 'budgetly_http_request_duration_seconds'
+IMPORT_ROWS_PARSED = 'budgetly_import_rows_parsed_total'
+IMPORT_ROWS_CATEGORIZED = 'budgetly_import_rows_categorized_total'
+IMPORT_DUPLICATES_SKIPPED = 'budgetly_import_duplicates_skipped_total'
+IMPORT_PARSE_ERRORS = 'budgetly_import_parse_errors_total'
+
+METRICS = {
+    REQUESTS_TOTAL: ('counter', 'HTTP requests handled, by endpoint, method and status.'),
+    REQUEST_DURATION: ('histogram', 'HTTP request latency in seconds, by endpoint and method.'),
+    IMPORT_ROWS_PARSED: ('counter', 'Statement rows parsed into transactions, by statement format.'),
+    IMPORT_ROWS_CATEGORIZED: ('counter', 'Imported rows matched to a category by a rule.'),
+    IMPORT_DUPLICATES_SKIPPED: ('counter', 'Imported rows skipped because the transaction already exists.'),
+    IMPORT_PARSE_ERRORS: ('counter', 'Statement rows or files that could not be parsed, by statement format.'),
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Each process writes its metrics to the store at most this often (and at exit)
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+# Totals of worker processes that have exited, folded together by collect()
+EXITED_FILE = 'metrics-exited.json'
+LOCK_FILE = 'metrics.lock'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    return True
+
+
+def _file_pid(path):
+    """The process id in metrics-<pid>-<start>.json (or the older metrics-<pid>.json), None for other files."""
+    parts = os.path.basename(path)[len('metrics-'):-len('.json')].split('-')
+    return int(parts[0]) if parts[0].isdigit() else None
+
+
+def _merge(counters, histograms, snapshot):
+    for name, labels, value in snapshot['counters']:
+        key = (name, tuple(sorted(labels.items())))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, values in snapshot['histograms']:
+        key = (name, tuple(sorted(labels.items())))
+        if key in histograms:
+            histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+        else:
+            histograms[key] = list(values)
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # Removed or unreadable file, skip it
+
+
+def _write_snapshot(directory, path, snapshot):
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(temp_path, path)
+
+
+@contextmanager
+def _store_lock(directory, exclusive):
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms, shared across worker processes through
+    a directory holding one JSON file per process. A process only ever writes
+    its own file (atomically, with os.replace), and /metrics sums all files, so
+    counts from every gunicorn worker, including ones that have exited, add up.
+
+    Files are named by process id and a per-process start token, so a new
+    worker that reuses an exited worker's pid never overwrites its counts.
+    When collecting, the files of processes that are no longer running are
+    folded into one EXITED_FILE and removed, under an exclusive lock that
+    readers share, so the directory does not grow with every worker restart.
+    """
+
+    def __init__(self, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._directory = None
+        self._last_flush = 0.0
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._file_name = f'metrics-{self._pid}-{int(time.time())}{secrets.token_hex(4)}.json'
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+    def _check_pid(self):
+        # A worker forked from a process that already counted something must not report it again
+        if os.getpid() != self._pid:
+            self._reset_state()
+
+    def reset(self):
+        with self._lock:
+            self._reset_state()
+            self._directory = None
+
+    def inc(self, name, amount=1, **labels):
+        if not amount:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_pid()
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_pid()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            histogram[bisect_left(LATENCY_BUCKETS, value)] += 1
+            histogram[-1] += value
+
+    def _snapshot(self):
+        return {
+            'counters': [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+            'histograms': [[name, dict(labels), values] for (name, labels), values in self._histograms.items()],
+        }
+
+    def flush(self, directory=None):
+        """Writes this process's metrics to its file in directory (default: the last one used)."""
+        directory = directory or self._directory
+        if directory is None:
+            return
+        with self._lock:
+            self._check_pid()
+            snapshot = self._snapshot()
+            self._directory = directory
+            self._last_flush = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        _write_snapshot(directory, os.path.join(directory, self._file_name), snapshot)
+
+    def maybe_flush(self, directory):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush(directory)
+
+    def collect(self, directory):
+        """Sums the metrics of every process that wrote to directory, after flushing our own."""
+        self.flush(directory)
+        self.prune(directory)
+        counters, histograms = {}, {}
+        with _store_lock(directory, exclusive=False):
+            for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+                snapshot = _read_snapshot(path)
+                if snapshot is not None:
+                    _merge(counters, histograms, snapshot)
+        return counters, histograms
+
+    def prune(self, directory):
+        """Folds the files of processes that are no longer running into EXITED_FILE and removes them."""
+        if fcntl is None:
+            return
+        with _store_lock(directory, exclusive=True):
+            exited = []
+            for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+                pid = _file_pid(path)
+                if pid is not None and pid != os.getpid() and not _pid_alive(pid):
+                    exited.append(path)
+            if not exited:
+                return
+            exited_path = os.path.join(directory, EXITED_FILE)
+            counters, histograms = {}, {}
+            for path in [exited_path] + exited:
+                snapshot = _read_snapshot(path)
+                if snapshot is not None:
+                    _merge(counters, histograms, snapshot)
+            _write_snapshot(directory, exited_path, {
+                'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+                'histograms': [[name, dict(labels), values] for (name, labels), values in histograms.items()],
+            })
+            for path in exited:
+                os.remove(path)
+
+
+registry = MetricsRegistry()
+
+
+@atexit.register
+def _flush_at_exit():
+    # Keep what was counted since the last flush, unless the store has been removed
+    if registry._directory and os.path.isdir(registry._directory):
+        registry.flush()
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render_prometheus(counters, histograms):
+    """Formats collected metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        if metric_type == 'counter':
+            for (metric_name, labels), value in sorted(counters.items()):
+                if metric_name == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        else:
+            for (metric_name, labels), values in sorted(histograms.items()):
+                if metric_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), values[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {values[-1]!r}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def _start_timer():
+    g.metrics_start_time = time.perf_counter()
+
+
+def _record_request(response):
+    start_time = g.get('metrics_start_time')
+    if start_time is None:
+        return response
+    # Label by route endpoint, never by path, to keep the number of series bounded
+    endpoint = request.endpoint or 'unmatched'
+    registry.observe(REQUEST_DURATION, time.perf_counter() - start_time, endpoint=endpoint, method=request.method)
+    registry.inc(REQUESTS_TOTAL, endpoint=endpoint, method=request.method, status=str(response.status_code))
+    registry.maybe_flush(current_app.config['METRICS_DIR'])
+    return response
+
+
+def init_metrics(app):
+    """
+    Records request counts and latency per endpoint and serves every metric,
+    summed over all worker processes sharing METRICS_DIR, on GET /metrics.
+    Scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN>"; without
+    a METRICS_TOKEN the endpoint is only open to logged-in users.
+    """
+    app.config.setdefault('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+
+    @app.route('/metrics')
+    def metrics():
+        token = current_app.config['METRICS_TOKEN']
+        if token:
+            supplied = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+                return Response('Unauthorized\n', status=401, headers={'WWW-Authenticate': 'Bearer'},
+                                mimetype='text/plain')
+        elif not current_user.is_authenticated:
+            return current_app.login_manager.unauthorized()
+        counters, histograms = registry.collect(current_app.config['METRICS_DIR'])
+        return Response(render_prometheus(counters, histograms), mimetype='text/plain; version=0.0.4')
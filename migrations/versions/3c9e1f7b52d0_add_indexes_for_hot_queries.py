@@ -0,0 +1,38 @@
+"""Add indexes for hot queries
+
+Revision ID: 3c9e1f7b52d0
+Revises: a5a66cc6c9d4
+Create Date: 2026-10-18 11:02:47.118530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9e1f7b52d0'
+down_revision = 'a5a66cc6c9d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Transactions are read per user and month (home, transactions, reports)
+    # and per category (category delete, joins from categories)
+    op.create_index('ix_transactions_user_id_date', 'transactions', ['user_id', 'date'], unique=False)
+    op.create_index(op.f('ix_transactions_category_id'), 'transactions', ['category_id'], unique=False)
+
+    # Budgets are read per user and month; the unique constraint leads with category_id
+    op.create_index('ix_budgets_user_id_year_month', 'budgets', ['user_id', 'year', 'month'], unique=False)
+
+    # Categorization joins rules to a user's categories; the unique constraint leads with name
+    op.create_index(op.f('ix_rules_category_id'), 'rules', ['category_id'], unique=False)
+    op.create_index(op.f('ix_categories_user_id'), 'categories', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_categories_user_id'), table_name='categories')
+    op.drop_index(op.f('ix_rules_category_id'), table_name='rules')
+    op.drop_index('ix_budgets_user_id_year_month', table_name='budgets')
+    op.drop_index(op.f('ix_transactions_category_id'), table_name='transactions')
+    op.drop_index('ix_transactions_user_id_date', table_name='transactions')
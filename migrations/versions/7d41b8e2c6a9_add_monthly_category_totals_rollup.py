@@ -0,0 +1,63 @@
+"""Add monthly_category_totals rollup
+
+Revision ID: 7d41b8e2c6a9
+Revises: 3c9e1f7b52d0
+Create Date: 2026-10-18 14:26:05.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d41b8e2c6a9'
+down_revision = '3c9e1f7b52d0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    rollup = op.create_table('monthly_category_totals',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('income_sum', sa.Float(), nullable=False),
+        sa.Column('expense_sum', sa.Float(), nullable=False),
+        sa.Column('txn_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_monthly_category_totals_user_id_year_month', 'monthly_category_totals',
+                    ['user_id', 'year', 'month'], unique=False)
+
+    # Backfill from the existing transactions
+    transactions = sa.table(
+        'transactions',
+        sa.column('id', sa.Integer),
+        sa.column('user_id', sa.Integer),
+        sa.column('date', sa.Date),
+        sa.column('amount', sa.Float),
+        sa.column('category_id', sa.Integer),
+    )
+    year = sa.cast(sa.extract('year', transactions.c.date), sa.Integer)
+    month = sa.cast(sa.extract('month', transactions.c.date), sa.Integer)
+    totals = sa.select(
+        transactions.c.user_id,
+        year,
+        month,
+        transactions.c.category_id,
+        sa.func.coalesce(sa.func.sum(sa.case((transactions.c.amount > 0, transactions.c.amount), else_=0.0)), 0.0),
+        sa.func.coalesce(sa.func.sum(sa.case((transactions.c.amount < 0, transactions.c.amount), else_=0.0)), 0.0),
+        sa.func.count(transactions.c.id),
+    ).group_by(transactions.c.user_id, year, month, transactions.c.category_id)
+    op.execute(rollup.insert().from_select(
+        ['user_id', 'year', 'month', 'category_id', 'income_sum', 'expense_sum', 'txn_count'], totals
+    ))
+
+
+def downgrade():
+    op.drop_index('ix_monthly_category_totals_user_id_year_month', table_name='monthly_category_totals')
+    op.drop_table('monthly_category_totals')
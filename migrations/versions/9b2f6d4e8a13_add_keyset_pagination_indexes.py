@@ -0,0 +1,35 @@
+"""Add keyset pagination indexes for transaction sorts
+
+Revision ID: 9b2f6d4e8a13
+Revises: 7d41b8e2c6a9
+Create Date: 2026-10-18 16:12:40.271904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2f6d4e8a13'
+down_revision = '7d41b8e2c6a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The transactions page pages through a user's transactions by
+    # (sort column, id); each sortable column gets a (user_id, column, id)
+    # index. The date one replaces ix_transactions_user_id_date, which it covers.
+    op.create_index('ix_transactions_user_id_date_id', 'transactions', ['user_id', 'date', 'id'], unique=False)
+    op.drop_index('ix_transactions_user_id_date', table_name='transactions')
+    op.create_index('ix_transactions_user_id_description_id', 'transactions', ['user_id', 'description', 'id'], unique=False)
+    op.create_index('ix_transactions_user_id_amount_id', 'transactions', ['user_id', 'amount', 'id'], unique=False)
+    op.create_index('ix_transactions_user_id_account_source_id', 'transactions', ['user_id', 'account_source', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_transactions_user_id_account_source_id', table_name='transactions')
+    op.drop_index('ix_transactions_user_id_amount_id', table_name='transactions')
+    op.drop_index('ix_transactions_user_id_description_id', table_name='transactions')
+    op.create_index('ix_transactions_user_id_date', 'transactions', ['user_id', 'date'], unique=False)
+    op.drop_index('ix_transactions_user_id_date_id', table_name='transactions')
@@ -0,0 +1,82 @@
+"""Add fingerprint column to transactions
+
+Revision ID: a5a66cc6c9d4
+Revises: 604a080f0be6
+Create Date: 2026-10-18 09:12:31.402215
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5a66cc6c9d4'
+down_revision = '604a080f0be6'
+branch_labels = None
+depends_on = None
+
+
+def _fingerprint(user_id, date, description, amount, account_source):
+    # Same recipe as models.transaction_fingerprint at the time of this migration
+    normalized_description = ' '.join((description or '').split()).lower()
+    normalized_source = ' '.join((account_source or '').split()).lower()
+    key = f"{user_id}|{date.isoformat()}|{normalized_description}|{float(amount):.2f}|{normalized_source}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def upgrade():
+    # Add the column as nullable first
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fingerprint', sa.String(length=64), nullable=True))
+
+    # Backfill existing rows. Duplicates that predate the constraint are kept,
+    # but every copy after the first gets a fingerprint salted with its id.
+    transactions = sa.table(
+        'transactions',
+        sa.column('id', sa.Integer),
+        sa.column('user_id', sa.Integer),
+        sa.column('date', sa.Date),
+        sa.column('description', sa.String),
+        sa.column('amount', sa.Float),
+        sa.column('account_source', sa.String),
+        sa.column('fingerprint', sa.String),
+    )
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(
+        transactions.c.id,
+        transactions.c.user_id,
+        transactions.c.date,
+        transactions.c.description,
+        transactions.c.amount,
+        transactions.c.account_source,
+    ).order_by(transactions.c.id)).all()
+
+    seen = set()
+    updates = []
+    for row in rows:
+        fingerprint = _fingerprint(row.user_id, row.date, row.description, row.amount, row.account_source)
+        if fingerprint in seen:
+            fingerprint = hashlib.sha256(f"{fingerprint}:{row.id}".encode('utf-8')).hexdigest()
+        seen.add(fingerprint)
+        updates.append({'row_id': row.id, 'fingerprint': fingerprint})
+
+    if updates:
+        connection.execute(
+            transactions.update()
+            .where(transactions.c.id == sa.bindparam('row_id'))
+            .values(fingerprint=sa.bindparam('fingerprint')),
+            updates
+        )
+
+    # Now make the column not nullable and unique
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.alter_column('fingerprint', existing_type=sa.String(length=64), nullable=False)
+        batch_op.create_unique_constraint('_transaction_fingerprint_uc', ['fingerprint'])
+
+
+def downgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_constraint('_transaction_fingerprint_uc', type_='unique')
+        batch_op.drop_column('fingerprint')
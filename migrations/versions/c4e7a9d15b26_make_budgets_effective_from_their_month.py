@@ -0,0 +1,107 @@
+"""Make budgets effective from their month until superseded
+
+Revision ID: c4e7a9d15b26
+Revises: 9b2f6d4e8a13
+Create Date: 2026-10-18 17:40:12.508316
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e7a9d15b26'
+down_revision = '9b2f6d4e8a13'
+branch_labels = None
+depends_on = None
+
+budgets = sa.table(
+    'budgets',
+    sa.column('id', sa.Integer),
+    sa.column('category_id', sa.Integer),
+    sa.column('user_id', sa.Integer),
+    sa.column('month', sa.Integer),
+    sa.column('year', sa.Integer),
+    sa.column('budgeted_amount', sa.Float),
+)
+
+
+def _month_index(year, month):
+    return year * 12 + month - 1
+
+
+def _budget_row(category_id, user_id, month_index, budgeted_amount):
+    year, month_offset = divmod(month_index, 12)
+    return {'category_id': category_id, 'user_id': user_id, 'year': year,
+            'month': month_offset + 1, 'budgeted_amount': budgeted_amount}
+
+
+def _rows_by_category(connection):
+    rows = connection.execute(sa.select(
+        budgets.c.id, budgets.c.category_id, budgets.c.user_id, budgets.c.year, budgets.c.month, budgets.c.budgeted_amount
+    ).order_by(budgets.c.category_id, budgets.c.year, budgets.c.month)).all()
+    by_category = {}
+    for row in rows:
+        by_category.setdefault(row.category_id, []).append(row)
+    return by_category
+
+
+def upgrade():
+    op.create_index('ix_budgets_category_id_year_month', 'budgets', ['category_id', 'year', 'month'], unique=False)
+    op.drop_index('ix_budgets_user_id_year_month', table_name='budgets')
+
+    # Budgets used to apply to their month only, one row per month. Each row
+    # now lasts until the next one, so:
+    # - a month without a row after a budgeted month gets a 0 budget, keeping
+    #   "no budget" from that month on;
+    # - rows with the same amount as the budget already in effect are removed,
+    #   including leading 0 budgets.
+    connection = op.get_bind()
+    stale_ids = []
+    new_rows = []
+    for rows in _rows_by_category(connection).values():
+        in_effect = 0.0  # No budget before the first row
+        previous_index = None
+        for row in rows:
+            month_index = _month_index(row.year, row.month)
+            if previous_index is not None and month_index > previous_index + 1 and in_effect:
+                # Gap after a budget: it ended there
+                new_rows.append(_budget_row(row.category_id, row.user_id, previous_index + 1, 0.0))
+                in_effect = 0.0
+            if row.budgeted_amount == in_effect:
+                stale_ids.append(row.id)
+            in_effect = row.budgeted_amount
+            previous_index = month_index
+        if in_effect:
+            last = rows[-1]
+            new_rows.append(_budget_row(last.category_id, last.user_id, previous_index + 1, 0.0))
+
+    for start in range(0, len(stale_ids), 500):
+        connection.execute(budgets.delete().where(budgets.c.id.in_(stale_ids[start:start + 500])))
+    if new_rows:
+        connection.execute(budgets.insert(), new_rows)
+
+
+def downgrade():
+    # Expand each budget back to one row per month, up to the next row. The
+    # last budget of a category is expanded up to the current month or the
+    # latest budgeted month, whichever is later; 0 budgets are not expanded.
+    connection = op.get_bind()
+    today = date.today()
+    for rows in _rows_by_category(connection).values():
+        last_index = max(_month_index(today.year, today.month), _month_index(rows[-1].year, rows[-1].month))
+        new_rows = []
+        for row, next_row in zip(rows, rows[1:] + [None]):
+            if not row.budgeted_amount:
+                continue
+            start_index = _month_index(row.year, row.month) + 1
+            end_index = _month_index(next_row.year, next_row.month) if next_row else last_index + 1
+            new_rows.extend(_budget_row(row.category_id, row.user_id, month_index, row.budgeted_amount)
+                            for month_index in range(start_index, end_index))
+        if new_rows:
+            connection.execute(budgets.insert(), new_rows)
+
+    op.create_index('ix_budgets_user_id_year_month', 'budgets', ['user_id', 'year', 'month'], unique=False)
+    op.drop_index('ix_budgets_category_id_year_month', table_name='budgets')
@@ -0,0 +1,29 @@
+"""Record whether a transaction's category was assigned by hand
+
+Revision ID: e2a8c6f1d47b
+Revises: c4e7a9d15b26
+Create Date: 2026-10-18 21:04:52.118310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a8c6f1d47b'
+down_revision = 'c4e7a9d15b26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Re-applying rules after a rule change can leave hand-picked categories
+    # alone. Which existing categories were picked by hand is unknown, so
+    # they all start out as rule-assigned.
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('category_manual', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_column('category_manual')
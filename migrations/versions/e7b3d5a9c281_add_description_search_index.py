@@ -0,0 +1,72 @@
+"""Add a trigram search index over transaction descriptions
+
+Revision ID: e7b3d5a9c281
+Revises: e2a8c6f1d47b
+Create Date: 2026-10-18 22:37:15.604183
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3d5a9c281'
+down_revision = 'e2a8c6f1d47b'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.env')
+
+
+def upgrade():
+    # Rule previews look up descriptions by substring. SQLite gets an FTS5
+    # trigram table kept in sync with transactions by triggers, Postgres a
+    # pg_trgm GIN index on lower(description). Same DDL as models.py.
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        statements = [
+            "CREATE VIRTUAL TABLE transactions_description_fts USING fts5("
+            "description, content='transactions', content_rowid='id', tokenize='trigram')",
+            "CREATE TRIGGER transactions_description_fts_ai AFTER INSERT ON transactions BEGIN "
+            "INSERT INTO transactions_description_fts(rowid, description) VALUES (new.id, new.description); END",
+            "CREATE TRIGGER transactions_description_fts_ad AFTER DELETE ON transactions BEGIN "
+            "INSERT INTO transactions_description_fts(transactions_description_fts, rowid, description) "
+            "VALUES ('delete', old.id, old.description); END",
+            "CREATE TRIGGER transactions_description_fts_au AFTER UPDATE OF description ON transactions BEGIN "
+            "INSERT INTO transactions_description_fts(transactions_description_fts, rowid, description) "
+            "VALUES ('delete', old.id, old.description); "
+            "INSERT INTO transactions_description_fts(rowid, description) VALUES (new.id, new.description); END",
+            "INSERT INTO transactions_description_fts(transactions_description_fts) VALUES ('rebuild')",
+        ]
+    elif bind.dialect.name == 'postgresql':
+        statements = [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE INDEX ix_transactions_description_trgm ON transactions "
+            "USING gin (lower(description) gin_trgm_ops)",
+        ]
+    else:
+        return
+
+    # SQLite builds without FTS5 or the trigram tokenizer (3.34+) and Postgres
+    # roles that may not create extensions go without the index, rule previews
+    # then scan instead. The savepoint keeps a failure from aborting the
+    # migration's transaction.
+    try:
+        with bind.begin_nested():
+            for statement in statements:
+                bind.exec_driver_sql(statement)
+    except sa.exc.DBAPIError as e:
+        logger.warning(f"Skipping the description search index, it could not be created: {e.orig}")
+
+
+def downgrade():
+    dialect_name = op.get_bind().dialect.name
+    if dialect_name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS transactions_description_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS transactions_description_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS transactions_description_fts_ai")
+        op.execute("DROP TABLE IF EXISTS transactions_description_fts")
+    elif dialect_name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_transactions_description_trgm")
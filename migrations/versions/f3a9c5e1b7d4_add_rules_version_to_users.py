@@ -0,0 +1,28 @@
+"""Version each user's rules so every worker notices rule changes
+
+Revision ID: f3a9c5e1b7d4
+Revises: e7b3d5a9c281
+Create Date: 2026-10-19 09:12:40.218573
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c5e1b7d4'
+down_revision = 'e7b3d5a9c281'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Compiled rule matchers are cached per worker process and rebuilt when
+    # this counter has moved on from the one they were built with.
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rules_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('rules_version')
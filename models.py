@@ -1,14 +1,22 @@
+import hashlib
+import logging
 from extensions import db
 from datetime import date
+from sqlalchemy import DDL, event, insert, inspect, select
+from sqlalchemy.exc import DBAPIError, IntegrityError
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
+logger = logging.getLogger(__name__)
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    # Bumped whenever the user's rules or categories change, see categorizer.get_rule_matcher
+    rules_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # Relationships
     categories = db.relationship('Category', backref='user', lazy=True, cascade="all, delete-orphan")
@@ -30,7 +38,7 @@ class Category(db.Model):
     __tablename__ = 'categories'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     is_fixed_cost = db.Column(db.Boolean, nullable=False, default=False)
     rules = db.relationship('Rule', backref='category', lazy=True, cascade="all, delete-orphan")
     transactions = db.relationship('Transaction', backref='category', lazy=True)
@@ -54,7 +62,7 @@ class Rule(db.Model):
     __tablename__ = 'rules'
     id = db.Column(db.Integer, primary_key=True)
     keyword_pattern = db.Column(db.String(200), nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False, index=True)
 
     def __repr__(self):
         return f'<Rule {self.keyword_pattern} (Category ID: {self.category_id})>'
@@ -66,6 +74,86 @@ class Rule(db.Model):
             # category_id is not needed here, it's implied by the parent category
         }
 
+def transaction_fingerprint(user_id, date, description, amount, account_source):
+    """Stable hash of the fields that identify a transaction, used for duplicate detection."""
+    normalized_description = ' '.join((description or '').split()).lower()
+    normalized_source = ' '.join((account_source or '').split()).lower()
+    key = f"{user_id}|{date.isoformat()}|{normalized_description}|{float(amount):.2f}|{normalized_source}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def _fingerprint_default(context):
+    params = context.get_current_parameters()
+    return transaction_fingerprint(
+        params['user_id'],
+        params.get('date') or date.today(),
+        params['description'],
+        params['amount'],
+        params['account_source']
+    )
+
+# Databases whose INSERT ... ON CONFLICT SQLAlchemy can build
+ON_CONFLICT_DIALECTS = ('sqlite', 'postgresql')
+
+def supports_on_conflict():
+    """True when the bound database takes INSERT ... ON CONFLICT (see dialect_insert)."""
+    return db.session.get_bind().dialect.name in ON_CONFLICT_DIALECTS
+
+def dialect_insert(model):
+    """
+    Returns an INSERT for the bound database's dialect, so callers can add
+    on_conflict_do_nothing()/on_conflict_do_update() on both SQLite and PostgreSQL.
+    Callers check supports_on_conflict() first and fall back to plain inserts.
+    """
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as on_conflict_insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as on_conflict_insert
+    else:
+        raise RuntimeError(f"INSERT ... ON CONFLICT is only built for {', '.join(ON_CONFLICT_DIALECTS)}, "
+                           f"not {dialect_name}; check supports_on_conflict() first")
+    return on_conflict_insert(model)
+
+def insert_new_transactions(values):
+    """
+    Inserts transaction rows (dicts of column values, fingerprint included),
+    skipping any whose fingerprint is already stored or repeats an earlier
+    row. Returns the number of rows inserted.
+    """
+    if supports_on_conflict():
+        stmt = dialect_insert(Transaction).on_conflict_do_nothing(
+            index_elements=['fingerprint']
+        ).returning(Transaction.id)
+        return len(db.session.execute(stmt, values).all())
+
+    # Without ON CONFLICT the stored fingerprints are filtered out first. A row
+    # another session inserts in the meantime is rejected by the unique index,
+    # and the batch is then retried row by row to skip just those.
+    stored = set(db.session.scalars(
+        select(Transaction.fingerprint).where(Transaction.fingerprint.in_({row['fingerprint'] for row in values}))
+    ))
+    new_rows = {}
+    for row in values:
+        if row['fingerprint'] not in stored:
+            new_rows.setdefault(row['fingerprint'], row)
+    if not new_rows:
+        return 0
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(Transaction), list(new_rows.values()))
+        return len(new_rows)
+    except IntegrityError:
+        added_count = 0
+        for row in new_rows.values():
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(Transaction), [row])
+                added_count += 1
+            except IntegrityError:
+                pass
+        return added_count
+
 class Transaction(db.Model):
     __tablename__ = 'transactions'
     id = db.Column(db.Integer, primary_key=True)
@@ -73,8 +161,23 @@ class Transaction(db.Model):
     description = db.Column(db.String(200), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     account_source = db.Column(db.String(50), nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True, index=True)
+    # Set when the user picked the category by hand rather than a rule assigning it
+    category_manual = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False, default=_fingerprint_default)
+
+    __table_args__ = (
+        # Duplicate protection: one row per user/date/description/amount/account
+        db.UniqueConstraint('fingerprint', name='_transaction_fingerprint_uc'),
+        # Monthly views and reports filter by user and date range. Each sortable
+        # column of the transactions page is indexed per user with id as the
+        # keyset pagination tiebreak
+        db.Index('ix_transactions_user_id_date_id', 'user_id', 'date', 'id'),
+        db.Index('ix_transactions_user_id_description_id', 'user_id', 'description', 'id'),
+        db.Index('ix_transactions_user_id_amount_id', 'user_id', 'amount', 'id'),
+        db.Index('ix_transactions_user_id_account_source_id', 'user_id', 'account_source', 'id'),
+    )
 
     def __repr__(self):
         return f'<Transaction {self.date} {self.description} {self.amount}>'
@@ -89,7 +192,76 @@ class Transaction(db.Model):
             'category_id': self.category_id
         }
 
+FINGERPRINT_FIELDS = ('user_id', 'date', 'description', 'amount', 'account_source')
+
+def fingerprint_fields_changed(target):
+    """True when a pending update changes any field the duplicate fingerprint is built from."""
+    attrs = inspect(target).attrs
+    return any(getattr(attrs, field).history.has_changes() for field in FINGERPRINT_FIELDS)
+
+@event.listens_for(Transaction, 'before_update')
+def _refresh_transaction_fingerprint(mapper, connection, target):
+    # Historical duplicates keep the id-salted fingerprint from the
+    # a5a66cc6c9d4 migration until one of its fields is actually edited
+    if fingerprint_fields_changed(target):
+        target.fingerprint = transaction_fingerprint(
+            target.user_id, target.date, target.description, target.amount, target.account_source
+        )
+
+# Substring search over descriptions for rule previews. SQLite keeps an FTS5
+# trigram table over transactions.description, synced by triggers; Postgres
+# uses a pg_trgm GIN index on lower(description). Neither is expressible as a
+# model, so both are created alongside the transactions table (and by the
+# e7b3d5a9c281 migration for existing databases). SQLite builds without FTS5
+# or the trigram tokenizer (3.34+) and Postgres roles that may not create
+# extensions go without the index; rule previews then scan instead.
+DESCRIPTION_FTS_TABLE = 'transactions_description_fts'
+DESCRIPTION_TRGM_INDEX = 'ix_transactions_description_trgm'
+
+SQLITE_DESCRIPTION_SEARCH_DDL = [
+    f"CREATE VIRTUAL TABLE {DESCRIPTION_FTS_TABLE} USING fts5("
+    f"description, content='transactions', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER {DESCRIPTION_FTS_TABLE}_ai AFTER INSERT ON transactions BEGIN "
+    f"INSERT INTO {DESCRIPTION_FTS_TABLE}(rowid, description) VALUES (new.id, new.description); END",
+    f"CREATE TRIGGER {DESCRIPTION_FTS_TABLE}_ad AFTER DELETE ON transactions BEGIN "
+    f"INSERT INTO {DESCRIPTION_FTS_TABLE}({DESCRIPTION_FTS_TABLE}, rowid, description) "
+    f"VALUES ('delete', old.id, old.description); END",
+    f"CREATE TRIGGER {DESCRIPTION_FTS_TABLE}_au AFTER UPDATE OF description ON transactions BEGIN "
+    f"INSERT INTO {DESCRIPTION_FTS_TABLE}({DESCRIPTION_FTS_TABLE}, rowid, description) "
+    f"VALUES ('delete', old.id, old.description); "
+    f"INSERT INTO {DESCRIPTION_FTS_TABLE}(rowid, description) VALUES (new.id, new.description); END",
+]
+
+POSTGRESQL_DESCRIPTION_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX {DESCRIPTION_TRGM_INDEX} ON transactions USING gin (lower(description) gin_trgm_ops)",
+]
+
+@event.listens_for(Transaction.__table__, 'after_create')
+def _create_description_search_index(target, connection, **kw):
+    statements = {
+        'sqlite': SQLITE_DESCRIPTION_SEARCH_DDL,
+        'postgresql': POSTGRESQL_DESCRIPTION_SEARCH_DDL,
+    }.get(connection.dialect.name, [])
+    if not statements:
+        return
+    # In a savepoint, so a failed statement (which aborts the whole
+    # transaction on Postgres) leaves the rest of the schema intact
+    try:
+        with connection.begin_nested():
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+    except DBAPIError as e:
+        logger.warning(f"Rule previews will scan descriptions, the search index could not be created: {e.orig}")
+
+event.listen(Transaction.__table__, 'before_drop',
+             DDL(f"DROP TABLE IF EXISTS {DESCRIPTION_FTS_TABLE}").execute_if(dialect='sqlite'))
+
 class Budget(db.Model):
+    """
+    A category's budget from (year, month) onwards, until a later row for the
+    same category supersedes it. See budgets.effective_budgets.
+    """
     __tablename__ = 'budgets'
     id = db.Column(db.Integer, primary_key=True)
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
@@ -98,8 +270,12 @@ class Budget(db.Model):
     year = db.Column(db.Integer, nullable=False)
     budgeted_amount = db.Column(db.Float, nullable=False, default=0.0)
 
-    # Ensure unique budget per category per month/year per user
-    __table_args__ = (db.UniqueConstraint('category_id', 'month', 'year', 'user_id', name='_category_month_year_user_uc'),)
+    __table_args__ = (
+        # Ensure unique budget per category per month/year per user
+        db.UniqueConstraint('category_id', 'month', 'year', 'user_id', name='_category_month_year_user_uc'),
+        # A month's budget is the latest row at or before it for each category
+        db.Index('ix_budgets_category_id_year_month', 'category_id', 'year', 'month'),
+    )
 
     def __repr__(self):
         return f'<Budget {self.category.name if self.category else "No Category"} {self.year}-{self.month:02d} ${self.budgeted_amount}>'
@@ -112,4 +288,25 @@ class Budget(db.Model):
             'month': self.month,
             'year': self.year,
             'budgeted_amount': self.budgeted_amount
-        }
\ No newline at end of file
+        }
+
+class MonthlyCategoryTotal(db.Model):
+    """
+    Rollup of transactions per user, month and category (NULL for uncategorized),
+    kept up to date by rollup.py whenever transactions change.
+    """
+    __tablename__ = 'monthly_category_totals'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)  # 1-12
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id', ondelete='CASCADE'), nullable=True)
+    income_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of positive amounts
+    expense_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of negative amounts
+    txn_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Rows are replaced per (user, month), and read per user and month
+    __table_args__ = (db.Index('ix_monthly_category_totals_user_id_year_month', 'user_id', 'year', 'month'),)
+
+    def __repr__(self):
+        return f'<MonthlyCategoryTotal {self.year}-{self.month:02d} category={self.category_id} count={self.txn_count}>'
@@ -0,0 +1,112 @@
+import base64
+import binascii
+import json
+from datetime import date
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import contains_eager
+
+from models import Category, Transaction
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+SORT_COLUMNS = ('date', 'description', 'amount', 'account_source', 'category')
+SORT_ORDERS = ('asc', 'desc')
+# JSON type of each sort's cursor value; dates travel as ISO strings
+_CURSOR_VALUE_TYPES = {
+    'date': str, 'description': str, 'amount': (int, float), 'account_source': str, 'category': str,
+}
+
+
+def _sort_expression(sort_by):
+    # Every column sort is served by a (user_id, <column>, id) index; category
+    # sorts on the joined name and is sorted within the month instead
+    if sort_by == 'category':
+        return func.coalesce(Category.name, 'Uncategorized')
+    return {
+        'date': Transaction.date,
+        'description': Transaction.description,
+        'amount': Transaction.amount,
+        'account_source': Transaction.account_source,
+    }[sort_by]
+
+
+def _sort_value(transaction, sort_by):
+    if sort_by == 'category':
+        return transaction.category.name if transaction.category else 'Uncategorized'
+    value = getattr(transaction, sort_by)
+    return value.isoformat() if sort_by == 'date' else value
+
+
+def encode_cursor(sort_by, sort_order, sort_value, transaction_id):
+    """Opaque cursor pointing just after one row of a sorted listing."""
+    payload = json.dumps([sort_by, sort_order, sort_value, transaction_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _is_json_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor, sort_by, sort_order):
+    """Returns (sort_value, transaction_id); raises ValueError for malformed cursors or another sort."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort_by, cursor_sort_order, sort_value, transaction_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if (cursor_sort_by, cursor_sort_order) != (sort_by, sort_order) or not _is_json_int(transaction_id):
+        raise ValueError("Cursor does not belong to this sort order")
+
+    # Checked before it reaches the query, where a list or dict would only fail in the driver
+    if isinstance(sort_value, bool) or not isinstance(sort_value, _CURSOR_VALUE_TYPES[sort_by]):
+        raise ValueError(f"Invalid cursor: bad {sort_by} value")
+    if sort_by == 'date':
+        try:
+            sort_value = date.fromisoformat(sort_value)
+        except ValueError as e:
+            raise ValueError(f"Invalid cursor: {e}")
+    return sort_value, transaction_id
+
+
+def keyset_query(user_id, start_date, end_date, sort_by='date', sort_order='desc', cursor=None):
+    """
+    Query for a user's transactions in [start_date, end_date), sorted by
+    sort_by with id as the tiebreak, starting just after cursor.
+
+    Pages are keyset-based: the cursor holds the sort value and id of the last
+    row of the previous page, and the next page starts with a (sort value, id)
+    row comparison instead of an OFFSET, so every page costs the same.
+    Categories are joined and eager-loaded for the category column.
+    """
+    sort_expression = _sort_expression(sort_by)
+    descending = sort_order == 'desc'
+
+    query = Transaction.query.outerjoin(Category).options(
+        contains_eager(Transaction.category)
+    ).filter(
+        Transaction.date >= start_date,
+        Transaction.date < end_date,
+        Transaction.user_id == user_id
+    )
+
+    if cursor is not None:
+        sort_value, transaction_id = decode_cursor(cursor, sort_by, sort_order)
+        position = tuple_(sort_expression, Transaction.id)
+        query = query.filter(position < tuple_(sort_value, transaction_id) if descending
+                             else position > tuple_(sort_value, transaction_id))
+
+    if descending:
+        return query.order_by(sort_expression.desc(), Transaction.id.desc())
+    return query.order_by(sort_expression.asc(), Transaction.id.asc())
+
+
+def transactions_page(user_id, start_date, end_date, sort_by='date', sort_order='desc', cursor=None, limit=PAGE_SIZE):
+    """Returns (transactions, next_cursor) for one page of keyset_query; next_cursor is None on the last page."""
+    # One extra row tells whether there is a next page
+    transactions = keyset_query(user_id, start_date, end_date, sort_by, sort_order, cursor).limit(limit + 1).all()
+    if len(transactions) <= limit:
+        return transactions, None
+    transactions = transactions[:limit]
+    last = transactions[-1]
+    return transactions, encode_cursor(sort_by, sort_order, _sort_value(last, sort_by), last.id)
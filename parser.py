@@ -1,400 +1,515 @@
 import csv
-from datetime import datetime
+import io
+import os
+import re
+import shutil
+import tempfile
+from contextlib import ExitStack, contextmanager
+from datetime import date, datetime
+from itertools import chain, islice
 import logging
 # from app import db # This line causes circular import and is not needed here
-from models import Transaction, Category
-from categorizer import assign_category # Import the new categorizer function
+from models import Transaction
+from categorizer import assign_categories # Batch categorizer, one rule load per file
+from instrumentation import track_queries
+from metrics import IMPORT_PARSE_ERRORS, IMPORT_ROWS_CATEGORIZED, IMPORT_ROWS_PARSED, registry as metrics
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Helper to convert amount strings from CSVs
-def _parse_amount(debit_str, credit_str=None):
-    debit = 0.0
-    if debit_str:
-        try:
-            debit = float(debit_str.strip().replace('-', '').replace(',', '')) # Handle potential commas or negative signs if present
-        except ValueError as e:
-            logger.debug(f"Error parsing debit amount '{debit_str}': {e}")
-            pass # Or log error
+DEFAULT_BATCH_SIZE = 500
+# Non-seekable uploads are buffered in memory up to this size before spilling to disk
+SPOOL_MAX_SIZE = 1024 * 1024
 
-    credit = 0.0
-    if credit_str:
+@contextmanager
+def open_statement(source):
+    """
+    Yields a seekable text stream over a statement. source can be a file path,
+    a binary file-like object such as Werkzeug's FileStorage.stream, or a text
+    stream. Non-seekable binary streams are copied into a SpooledTemporaryFile,
+    which only touches disk past SPOOL_MAX_SIZE.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'r', encoding='utf-8-sig', newline='') as f: # utf-8-sig to handle potential BOM
+            yield f
+        return
+
+    is_text = isinstance(source, io.TextIOBase)
+    with ExitStack() as stack:
+        stream = source
+        if not (hasattr(stream, 'seekable') and stream.seekable()):
+            spool_options = {'mode': 'w+', 'newline': ''} if is_text else {'mode': 'w+b'}
+            stream = stack.enter_context(tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, **spool_options))
+            shutil.copyfileobj(source, stream)
+        stream.seek(0)
+
+        if is_text:
+            yield stream
+            return
+
+        text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
         try:
-            credit = float(credit_str.strip().replace(',', ''))
-        except ValueError as e:
-            logger.debug(f"Error parsing credit amount '{credit_str}': {e}")
-            pass # Or log error
+            yield text_stream
+        finally:
+            # Leave the underlying binary stream open, only the wrapper is ours
+            text_stream.detach()
+
+def iter_batches(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """Groups an iterable of parsed rows into lists of at most batch_size rows."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def categorize_batch(batch, user_id=None):
+    """Fills in category_id for a batch of parsed rows with one batch categorizer call."""
+    category_ids = assign_categories((txn['description'] for txn in batch), user_id)
+    for txn, category_id in zip(batch, category_ids):
+        txn['category_id'] = category_id
+    metrics.inc(IMPORT_ROWS_CATEGORIZED, sum(1 for category_id in category_ids if category_id is not None))
+    return batch
+
+# Characters dropped from amounts that float() rejects: thousands separators,
+# currency symbols, stray quotes and spaces. Debits also drop their sign.
+_AMOUNT_NOISE = str.maketrans('', '', ',$" ')
+_DEBIT_NOISE = str.maketrans('', '', ',$" -')
+
+def _to_amount(amount_str, unsigned=False):
+    """
+    Converts an amount string to a float in a single pass (one translate, one
+    float call), or returns None when it is blank or not a number.
+    """
+    if not amount_str:
+        return None
+    try:
+        return float(amount_str.translate(_DEBIT_NOISE if unsigned else _AMOUNT_NOISE))
+    except ValueError:
+        return None
 
-    if debit > 0:
+# Helper to convert amount strings from CSVs
+def _parse_amount(debit_str, credit_str=None):
+    debit = _to_amount(debit_str, unsigned=True)
+    if debit and debit > 0:
         return -debit # Expenses are negative
-    elif credit > 0:
+    credit = _to_amount(credit_str)
+    if credit and credit > 0:
         return credit
     return 0.0
 
-def _parse_td_common(file_path, account_source, user_id=None):
-    transactions = []
-    try:
-        with open(file_path, 'r', encoding='utf-8-sig') as f: # utf-8-sig to handle potential BOM
-            reader = csv.reader(f)
-            row_count = 0
-            for row in reader:
-                row_count += 1
-                if not row or len(row) < 3: # Basic check for valid row
-                    logger.debug(f"Skipping invalid row {row_count}: {row}")
-                    continue
-                try:
-                    date_str = row[0].strip()
-                    description = row[1].strip()
-                    # Debit in col 2 (index), Credit in col 4 (index) for some TD files
-                    # Or Debit in col 2, Credit in col 3 for others
-                    debit_val = row[2].strip() if len(row) > 2 else None
-                    credit_val = row[4].strip() if len(row) > 4 else (row[3].strip() if len(row) > 3 and debit_val and not row[3].strip() else None)
-
-                    logger.debug(f"Processing row {row_count}:")
-                    logger.debug(f"  Date: {date_str}")
-                    logger.debug(f"  Description: {description}")
-                    logger.debug(f"  Debit: {debit_val}")
-                    logger.debug(f"  Credit: {credit_val}")
-
-                    # Refined logic for TD files where debit is one col, credit is another, and one is blank
-                    # td-cb-may-accountactivity.csv: Date,Desc,Debit,,Credit,Balance (0,1,2,3,4,5)
-                    # td-in-may-accountactivity.csv: Date,Desc,Debit,,Credit,Balance (0,1,2,3,4,5)
-                    if len(row) >= 5 and row[3] == '' : # Debit in col 2, Credit in col 4
-                         amount = _parse_amount(row[2], row[4])
-                    elif len(row) >= 4: # Debit in col 2, Credit in col 3
-                         amount = _parse_amount(row[2], row[3])
-                    else:
-                        logger.debug(f"  Skipping: Not enough columns")
-                        continue # Not enough columns
-
-                    logger.debug(f"  Calculated amount: {amount}")
-
-                    if amount == 0.0 and not description.lower().startswith("payment - thank you"): # Avoid zero amount unless it is a known non-monetary like a payment confirmation
-                         # Check if it's a payment thank you, those can have 0 if we only look at one side
-                        is_payment = description.lower().startswith("payment - thank you")
-                        if not is_payment and (not row[2] or not row[4] if len(row) >=5 else not row[3]): # If it's not a payment and one of the amount columns is empty, it might be bad data
-                             logger.debug(f"  Skipping: Zero amount non-payment transaction")
-                             pass # Continue if amount is zero unless it's a clear payment line
-
-                    if date_str and description and amount != 0.0:
-                        try:
-                            transaction_date = datetime.strptime(date_str, '%m/%d/%Y').date()
-                            category_name = assign_category(description, user_id)
-                            logger.debug(f"  Assigned category: {category_name}")
-
-                            transactions.append({
-                                'date': transaction_date,
-                                'description': description,
-                                'amount': amount,
-                                'account_source': account_source,
-                                'category_name': category_name
-                            })
-                            logger.debug(f"  Transaction added successfully")
-                        except ValueError as e:
-                            logger.error(f"  Error parsing date '{date_str}': {e}")
-                            continue
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Error processing row {row_count} {row}: {e}")
-                    continue
-    except Exception as e:
-        logger.error(f"Error reading TD Common file {file_path}: {e}")
-
-    logger.info(f"Parsed {len(transactions)} transactions from TD Common file")
-    return transactions
-
-def _parse_td_chequing_new(file_path, account_source, user_id=None):
-    transactions = []
-    try:
-        with open(file_path, 'r', encoding='utf-8-sig') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if not row or len(row) < 3:
-                    continue
-                try:
-                    date_str = row[0].strip()
-                    description = row[1].strip()
-                    debit_val = row[2].strip()
-                    credit_val = row[3].strip() if len(row) > 3 else None
-
-                    amount = _parse_amount(debit_val, credit_val)
-
-                    if date_str and description and amount != 0.0:
-                        transaction_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                        category_name = assign_category(description, user_id)
-                        transactions.append({
-                            'date': transaction_date,
-                            'description': description,
-                            'amount': amount,
-                            'account_source': account_source,
-                            'category_name': category_name
-                        })
-                except (IndexError, ValueError) as e:
-                    print(f"Skipping row in TD Chequing due to error: {row} - {e}")
-                    continue
-    except Exception as e:
-        print(f"Error reading TD Chequing file {file_path}: {e}")
-    return transactions
-
-def _parse_amex(file_path, account_source, user_id=None):
-    transactions = []
-    try:
-        with open(file_path, 'r', encoding='utf-8-sig') as f:
-            reader = csv.reader(f)
-
-            # Read first line and check if it's a header or "Table 1"
-            try:
-                first_line = next(reader)
-                header = first_line
-
-                # If the first line is 'Table 1', read the next line as header
-                if len(first_line) > 0 and first_line[0].strip().lower() == 'table 1':
-                    try:
-                        header = next(reader)  # Read the actual header row
-                    except StopIteration:
-                        return []  # File only had 'Table 1' or was empty after that
+# --- Statement format registry ---
+# Every supported format registers a detector. A detector looks at the first
+# SAMPLE_ROWS rows of a file (and its name) and returns a StatementLayout when it
+# recognises the file. The layout fixes the header rows, the columns and the
+# date format once per file, so its row converter never probes formats per row.
+# When the sampled dates read the same in two formats (01/02/2024 with no day
+# above 12) parse_statement looks further ahead until a row settles the format.
+
+SAMPLE_ROWS = 20
+MAX_HEADER_ROWS = 2
+# Rows held back at most while waiting for a date that settles an ambiguous format
+MAX_DATE_LOOKAHEAD_ROWS = 5000
+DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%d %b %Y', '%d %B %Y']
+AMEX_DATE_FORMATS = ['%d %b %Y', '%d %B %Y', '%m/%d/%Y', '%Y-%m-%d']
+
+_STATEMENT_FORMATS = []
+
+class StatementLayout:
+    """What sniffing decided about one statement file."""
+
+    def __init__(self, format_name, account_source, header_rows, convert_row, date_parser=None):
+        self.format_name = format_name
+        self.account_source = account_source
+        self.header_rows = header_rows  # Rows at the top of the file that are not transactions
+        self.convert_row = convert_row  # csv row -> transaction dict, or None to skip the row
+        self.date_parser = date_parser  # The DateParser convert_row uses, if any
+
+    def __repr__(self):
+        return f'<StatementLayout {self.format_name} ({self.account_source})>'
+
+def register_format(detector):
+    """Registers a format detector. Detectors are tried in registration order."""
+    _STATEMENT_FORMATS.append(detector)
+    return detector
+
+def detect_layout(sample, original_filename):
+    """Returns the StatementLayout of the first format recognising the sample rows, or None."""
+    for detector in _STATEMENT_FORMATS:
+        layout = detector(sample, original_filename)
+        if layout is not None:
+            return layout
+    return None
+
+def _filename_tokens(original_filename):
+    """Splits a filename into lower-case words and numbers, e.g. td-cb-may2025.csv -> td, cb, may, 2025."""
+    stem = os.path.splitext(original_filename.lower())[0]
+    return set(re.findall(r'[a-z]+|[0-9]+', stem))
+
+def _date_readings(date_str, formats):
+    """Maps each of the formats that parses date_str to the date it reads."""
+    readings = {}
+    for date_format in formats:
+        try:
+            readings[date_format] = datetime.strptime(date_str, date_format).date()
+        except ValueError:
+            pass
+    return readings
 
-            except StopIteration:
-                return []  # Empty file
+def _rank_date_formats(date_strings, formats=DATE_FORMATS):
+    """
+    Returns the formats that parse any of the sampled dates, best first:
+    formats proven by a date no other format parses, then by the number of
+    sampled dates they parse, earliest format first on ties.
+    """
+    counts = dict.fromkeys(formats, 0)
+    proven = set()
+    for date_str in date_strings:
+        readings = _date_readings(date_str, formats)
+        for date_format in readings:
+            counts[date_format] += 1
+        if len(readings) == 1:
+            proven.update(readings)
+    ranked = [date_format for date_format in formats if counts[date_format]]
+    return sorted(ranked, key=lambda date_format: (date_format not in proven, -counts[date_format]))
+
+def _sniff_date_format(date_strings, formats=DATE_FORMATS):
+    """Returns the best format for the sampled dates (see _rank_date_formats), or None."""
+    ranked = _rank_date_formats(date_strings, formats)
+    return ranked[0] if ranked else None
+
+_MONTHS = {}
+for _number, (_abbr, _name) in enumerate(zip(
+        ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'],
+        ['january', 'february', 'march', 'april', 'may', 'june', 'july', 'august',
+         'september', 'october', 'november', 'december']), start=1):
+    _MONTHS[_abbr] = _MONTHS[_name] = _number
+_MONTHS['sept'] = 9
+
+_SLASH_DATE = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})$')
+_NAMED_MONTH_DATE = re.compile(r'(\d{1,2}) ([A-Za-z]+) (\d{4})$')
+
+def _decode_iso(date_str):
+    return date.fromisoformat(date_str)
+
+def _decode_month_day_year(date_str):
+    month, day, year = _SLASH_DATE.match(date_str).groups()
+    return date(int(year), int(month), int(day))
+
+def _decode_day_month_year(date_str):
+    day, month, year = _SLASH_DATE.match(date_str).groups()
+    return date(int(year), int(month), int(day))
+
+def _decode_named_month(date_str):
+    day, month, year = _NAMED_MONTH_DATE.match(date_str).groups()
+    return date(int(year), _MONTHS[month.lower()], int(day))
+
+# Decoders for the formats sniffing can lock in; anything else falls back to strptime
+_DATE_DECODERS = {
+    '%Y-%m-%d': _decode_iso,
+    '%m/%d/%Y': _decode_month_day_year,
+    '%d/%m/%Y': _decode_day_month_year,
+    '%d %b %Y': _decode_named_month,
+    '%d %B %Y': _decode_named_month,
+}
+
+def _date_parser(date_format):
+    """
+    Returns a date_str -> date function for one date format of a file.
+    Known formats are decoded with a precompiled regex, date.fromisoformat or
+    a month lookup table instead of strptime, and each distinct date string is
+    decoded once per file since statements repeat the same dates many times.
+    Strings the fast decoder does not handle (e.g. unpadded ISO dates) go
+    through strptime, which still raises ValueError for bad dates.
+    """
+    decode = _DATE_DECODERS.get(date_format)
+    decoded = {}
 
-            # Find column indices dynamically from header
+    def parse_date(date_str):
+        value = decoded.get(date_str)
+        if value is None:
             try:
-                date_col = header.index('Date')
-                desc_col = header.index('Description')
-                amount_col = header.index('Amount')
-            except ValueError:
-                logger.error(f"Amex file {file_path} has missing expected columns in header: {header}")
-                return []
-
-            for row in reader:
-                if not row or len(row) <= max(date_col, desc_col, amount_col):
-                    continue
-                try:
-                    date_str = row[date_col].strip()
-                    description = row[desc_col].strip()
-                    amount_str = row[amount_col].strip()
-
-                    # Skip empty rows or rows with empty amounts
-                    if not date_str or not description or not amount_str:
-                        continue
-
-                                        # Handle negative amounts that are already prefixed with minus
-                    # Remove $ symbol and commas, handle negative signs
-                    amount_clean = amount_str.replace('$', '').replace(',', '').strip()
-
-                    # Check if it's a payment (credit) - these come with negative amounts or payment descriptions
-                    is_payment = 'PAYMENT RECEIVED' in description.upper() or 'PAYMENT' in description.upper()
-
-                    # Parse the amount (including negative sign if present)
-                    amount = float(amount_clean) if amount_clean else 0.0
-
-                    # For payments that come as negative in the CSV, make them positive (credits to account)
-                    # For regular charges, make them negative (expenses)
-                    if is_payment and amount < 0:
-                        amount = -amount  # Convert negative payment to positive credit
-                    elif not is_payment and amount > 0:
-                        amount = -amount  # Convert positive charge to negative expense
-
-                    if date_str and description and amount != 0.0:
-                                                # Try different date formats for AmEx
-                        transaction_date = None
-
-                        # Clean the date string first - remove periods from month abbreviations
-                        clean_date_str = date_str.replace('.', '')
-
-                        date_formats = ['%d %b %Y', '%d %B %Y', '%m/%d/%Y', '%Y-%m-%d']
-
-                        for date_format in date_formats:
-                            try:
-                                transaction_date = datetime.strptime(clean_date_str, date_format).date()
-                                logger.debug(f"Successfully parsed AmEx date '{date_str}' (cleaned: '{clean_date_str}') with format: {date_format}")
-                                break
-                            except ValueError:
-                                continue
-
-                        if transaction_date is None:
-                            logger.error(f"Could not parse AmEx date '{date_str}' with any known format")
-                            continue
-
-                        category_name = assign_category(description, user_id)
-                        transactions.append({
-                            'date': transaction_date,
-                            'description': description,
-                            'amount': amount,
-                            'account_source': account_source,
-                            'category_name': category_name
-                        })
-                        logger.debug(f"Added AmEx transaction: {description}, ${amount}")
-
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Skipping row in Amex due to error: {row} - {e}")
-                    continue
-    except Exception as e:
-        logger.error(f"Error reading Amex file {file_path}: {e}")
-    return transactions
-
-def _parse_td_generic(file_path, account_source, user_id=None):
+                value = decode(date_str)
+            except (AttributeError, KeyError, TypeError, ValueError):
+                # No decoder, no regex match, unknown month name or out of range
+                value = datetime.strptime(date_str, date_format).date()
+            decoded[date_str] = value
+        return value
+    return parse_date
+
+class DateParser:
     """
-    Generic TD parser that handles both date formats:
-    - YYYY-MM-DD (like accountactivity.csv)
-    - MM/DD/YYYY (like older TD exports)
-    Format: Date, Description, Debit, Credit, Balance
+    Parses the dates of one statement, starting from the best format for the
+    sampled dates. Rivals are lower ranked formats that parse every sampled
+    date too but read some of them as other days, e.g. %d/%m/%Y for a sample
+    of 01/02/2024 style dates. While there are rivals each new date is also
+    tried with them: the leading format is dropped once a date (13/02/2024)
+    rules it out, and the format is settled when one format is left. A date
+    the settled format rejects is tried with the other sampled formats
+    before the row is given up on.
     """
-    transactions = []
-    try:
-        with open(file_path, 'r', encoding='utf-8-sig') as f:
-            reader = csv.reader(f)
-            row_count = 0
-            for row in reader:
-                row_count += 1
-                if not row or len(row) < 3:
-                    logger.debug(f"Skipping invalid row {row_count}: {row}")
-                    continue
-                try:
-                    date_str = row[0].strip().strip('"')  # Remove quotes
-                    description = row[1].strip().strip('"')  # Remove quotes
-                    debit_val = row[2].strip().strip('"') if len(row) > 2 else None
-                    credit_val = row[3].strip().strip('"') if len(row) > 3 else None
-                    # Column 4 is balance, not credit - ignore it
-
-                    logger.debug(f"Processing row {row_count}:")
-                    logger.debug(f"  Date: {date_str}")
-                    logger.debug(f"  Description: {description}")
-                    logger.debug(f"  Debit: {debit_val}")
-                    logger.debug(f"  Credit: {credit_val}")
-
-                    # Calculate amount - debit and credit are in separate columns
-                    amount = _parse_amount(debit_val, credit_val)
-
-                    logger.debug(f"  Calculated amount: {amount}")
-
-                    if date_str and description and amount != 0.0:
-                        # Try different date formats
-                        transaction_date = None
-                        date_formats = ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y']
-
-                        for date_format in date_formats:
-                            try:
-                                transaction_date = datetime.strptime(date_str, date_format).date()
-                                logger.debug(f"  Successfully parsed date with format: {date_format}")
-                                break
-                            except ValueError:
-                                continue
-
-                        if transaction_date is None:
-                            logger.error(f"  Could not parse date '{date_str}' with any known format")
-                            continue
-
-                        category_name = assign_category(description, user_id)
-                        logger.debug(f"  Assigned category: {category_name}")
-
-                        transactions.append({
-                            'date': transaction_date,
-                            'description': description,
-                            'amount': amount,
-                            'account_source': account_source,
-                            'category_name': category_name
-                        })
-                        logger.debug(f"  Transaction added successfully")
-
-                except (IndexError, ValueError) as e:
-                    logger.error(f"Error processing row {row_count} {row}: {e}")
-                    continue
-    except Exception as e:
-        logger.error(f"Error reading TD Generic file {file_path}: {e}")
-
-    logger.info(f"Parsed {len(transactions)} transactions from TD Generic file")
-    return transactions
-
-def process_uploaded_file(file_path, original_filename, user_id=None):
-    logger.info(f"Processing file: {original_filename}")
-    original_filename_lower = original_filename.lower()
-    parsed_txns = []
 
-    # First, try to detect file type by examining the header
-    amex_file = False
+    def __init__(self, date_strings, formats=DATE_FORMATS):
+        self.candidates = _rank_date_formats(date_strings, formats) or formats[:1]
+        self.date_format = self.candidates[0]
+        self._parse = _date_parser(self.date_format)
+        sample = [_date_readings(date_str, self.candidates) for date_str in date_strings]
+        sample = [readings for readings in sample if self.date_format in readings]
+        self.rivals = [
+            date_format for date_format in self.candidates[1:]
+            if all(date_format in readings for readings in sample)
+            and any(readings[date_format] != readings[self.date_format] for readings in sample)
+        ]
+        self._checked = set()
+
+    @property
+    def settled(self):
+        """False while another format could still read the dates seen so far differently."""
+        return not self.rivals
+
+    def __call__(self, date_str):
+        if self.rivals and date_str not in self._checked:
+            self._check_rivals(date_str)
+        try:
+            return self._parse(date_str)
+        except ValueError:
+            for date_format in self.candidates:
+                if date_format != self.date_format:
+                    try:
+                        return datetime.strptime(date_str, date_format).date()
+                    except ValueError:
+                        pass
+            raise
+
+    def _check_rivals(self, date_str):
+        self._checked.add(date_str)
+        contenders = [self.date_format] + self.rivals
+        readings = _date_readings(date_str, contenders)
+        if not readings:
+            return  # Not a date in any of them, the row is skipped
+        contenders = [date_format for date_format in contenders if date_format in readings]
+        if contenders[0] != self.date_format:
+            self.date_format = contenders[0]
+            self._parse = _date_parser(self.date_format)
+        self.rivals = contenders[1:]
+
+@register_format
+def _detect_amex(sample, original_filename):
+    """American Express: a header row, optionally after a 'Table 1' line, with Date, Description and Amount."""
+    header_rows = 0
+    if sample and sample[0] and sample[0][0].strip().lower() == 'table 1':
+        header_rows = 1
+    if len(sample) <= header_rows:
+        return None
+
+    header = sample[header_rows]
+    if not ('amex' in original_filename.lower() or 'Cardmember' in header or 'Foreign Spend Amount' in header):
+        return None
     try:
-        with open(file_path, 'r', encoding='utf-8-sig') as f:
-            reader = csv.reader(f)
-            first_line = next(reader, [])
-            # Check if it's an AmEx file by looking for characteristic columns
-            if (len(first_line) > 4 and
-                'Date' in first_line and
-                'Description' in first_line and
-                'Amount' in first_line and
-                ('Cardmember' in first_line or 'Foreign Spend Amount' in first_line)):
-                amex_file = True
-    except Exception as e:
-        logger.warning(f"Could not examine file header for type detection: {e}")
-
-    if 'amex' in original_filename_lower or amex_file:
-        logger.info(f"Processing as Amex file")
-        parsed_txns = _parse_amex(file_path, 'American Express', user_id)
-    elif 'td' in original_filename_lower:
-        # Try to differentiate TD file types
-        # Most TD files use the Common format with MM/DD/YYYY dates
-        # Only use the Chequing format if specifically indicated
-        if 'chequing' in original_filename_lower or 'chq' in original_filename_lower:
-            logger.info(f"Processing as TD Chequing file")
-            parsed_txns = _parse_td_chequing_new(file_path, 'TD Chequing', user_id)
-        else:
-            # Default to TD Common parser for most TD files
-            if 'cb' in original_filename_lower:
-                account_name = 'TD Credit Card'
-            elif 'in' in original_filename_lower:
-                account_name = 'TD Account IN'
-            else:
-                account_name = 'TD Account'  # Generic TD account
-            logger.info(f"Processing as TD Common file: {account_name}")
-            parsed_txns = _parse_td_common(file_path, account_name, user_id)
-    elif ('accountactivity' in original_filename_lower or
-          'account_activity' in original_filename_lower or
-          'statement' in original_filename_lower or
-          'export' in original_filename_lower):
-        # Generic TD/bank export files
-        logger.info(f"Processing as generic TD/bank export file")
-        parsed_txns = _parse_td_generic(file_path, 'TD Account', user_id)
-    else:
-        # Try the generic TD parser as a fallback for unknown CSV files
-        logger.info(f"Unknown file type '{original_filename}', trying generic TD parser as fallback")
-        parsed_txns = _parse_td_generic(file_path, 'Bank Account', user_id)
-
-    logger.info(f"Parsed {len(parsed_txns)} transactions")
-
-    # Convert parsed data to Transaction objects
+        date_col = header.index('Date')
+        desc_col = header.index('Description')
+        amount_col = header.index('Amount')
+    except ValueError:
+        logger.error(f"Amex file has missing expected columns in header: {header}")
+        return None
+
+    # Month abbreviations come with periods ("01 Dec. 2024"), which strptime does not accept
+    sampled_dates = [row[date_col].strip().replace('.', '') for row in sample[header_rows + 1:] if len(row) > date_col]
+    parse_date = DateParser(sampled_dates, AMEX_DATE_FORMATS)
+    min_columns = max(date_col, desc_col, amount_col) + 1
+
+    def convert_row(row):
+        if len(row) < min_columns:
+            return None
+        date_str = row[date_col].strip()
+        description = row[desc_col].strip()
+        amount_str = row[amount_col].strip()
+        if not date_str or not description or not amount_str:
+            return None
+
+        # Remove $ symbol and commas, keep the sign
+        amount = _to_amount(amount_str)
+        if amount is None:
+            raise ValueError(f"invalid amount '{amount_str}'")
+
+        # Payments come as negative amounts and are credits to the account,
+        # regular charges are positive and become negative expenses
+        is_payment = 'PAYMENT' in description.upper()
+        if is_payment and amount < 0:
+            amount = -amount
+        elif not is_payment and amount > 0:
+            amount = -amount
+        if amount == 0.0:
+            return None
+
+        return {
+            'date': parse_date(date_str.replace('.', '')),
+            'description': description,
+            'amount': amount,
+            'account_source': 'American Express'
+        }
+
+    return StatementLayout('amex', 'American Express', header_rows + 1, convert_row, parse_date)
+
+def _debit_credit_account_source(original_filename):
+    """Bank files do not name their account, so it still comes from the filename."""
+    tokens = _filename_tokens(original_filename)
+    original_filename_lower = original_filename.lower()
+    if 'td' in tokens:
+        if 'chequing' in original_filename_lower or 'chq' in tokens:
+            return 'TD Chequing'
+        if 'cb' in tokens:
+            return 'TD Credit Card'
+        if 'in' in tokens:
+            return 'TD Account IN'
+        return 'TD Account'
+    if any(hint in original_filename_lower for hint in ('accountactivity', 'account_activity', 'statement', 'export')):
+        return 'TD Account'
+    return 'Bank Account'
+
+@register_format
+def _detect_debit_credit(sample, original_filename):
+    """
+    Bank exports with Date, Description, Debit, Credit[, Balance] columns, with or
+    without a header row (TD chequing, savings and credit card files). Some TD
+    exports leave column 3 empty and put credits in column 4:
+    Date, Description, Debit, , Credit, Balance.
+    """
+    header_rows = None
+    for index, row in enumerate(sample[:MAX_HEADER_ROWS + 1]):
+        if row and _sniff_date_format([row[0].strip().strip('"')]):
+            header_rows = index
+            break
+    if header_rows is None:
+        return None
+
+    data = [row for row in sample[header_rows:] if row]
+    if max(len(row) for row in data) < 3:
+        return None
+
+    parse_date = DateParser([row[0].strip().strip('"') for row in data])
+    credit_col = 4 if all(len(row) >= 6 and not row[3].strip() for row in data) else 3
+
+    def convert_row(row):
+        if len(row) < 3:
+            return None
+        date_str = row[0].strip().strip('"')
+        description = row[1].strip().strip('"')
+        debit_val = row[2]
+        credit_val = row[credit_col] if len(row) > credit_col else None
+
+        amount = _parse_amount(debit_val, credit_val)
+        if not date_str or not description or amount == 0.0:
+            return None
+
+        return {
+            'date': parse_date(date_str),
+            'description': description,
+            'amount': amount,
+            'account_source': account_source
+        }
+
+    account_source = _debit_credit_account_source(original_filename)
+    return StatementLayout('debit_credit', account_source, header_rows, convert_row, parse_date)
+
+def process_uploaded_file(source, original_filename, user_id=None, stats=None):
+    """
+    Parses an uploaded statement into unsaved, categorized Transaction objects.
+    This materializes the whole file; imports should stream through
+    importer.import_statement instead. If a stats dict is given it is filled
+    with the number of parsed rows and the number of database round trips made.
+    """
     transaction_objects = []
-    if parsed_txns:
-        from extensions import db
-        for txn_data in parsed_txns:
-            try:
-                # Get the category_id from the category_name for this specific user
-                category_name = txn_data.pop('category_name', None)
-                category_id = None
-                if category_name and user_id:
-                    category = db.session.query(Category).filter(
-                        Category.name == category_name,
-                        Category.user_id == user_id
-                    ).first()
-                    if category:
-                        category_id = category.id
-                        logger.debug(f"Found category_id {category_id} for category '{category_name}'")
-                    else:
-                        logger.warning(f"No category found for name '{category_name}' for user {user_id}")
-
-                # Create the transaction with the category_id
-                transaction = Transaction(
+    with track_queries() as queries:
+        for batch in iter_batches(parse_statement(source, original_filename)):
+            for txn_data in categorize_batch(batch, user_id):
+                transaction_objects.append(Transaction(
                     date=txn_data['date'],
                     description=txn_data['description'],
                     amount=txn_data['amount'],
                     account_source=txn_data['account_source'],
-                    category_id=category_id
-                )
-                transaction_objects.append(transaction)
-                logger.debug(f"Created transaction object: {transaction.description}, {transaction.amount}, {transaction.category_id}")
-            except Exception as e:
-                logger.error(f"Error creating transaction object: {e}")
-                continue
-
-    logger.info(f"Created {len(transaction_objects)} transaction objects")
-    return transaction_objects
\ No newline at end of file
+                    category_id=txn_data['category_id']
+                ))
+
+    logger.info(f"Import of {original_filename} made {queries.count} database round trips")
+    if stats is not None:
+        stats['parsed'] = len(transaction_objects)
+        stats['db_round_trips'] = queries.count
+    return transaction_objects
+
+def _settle_date_format(layout, numbered_rows):
+    """
+    Yields the (row number, row) pairs of a statement. While the layout's date
+    format is ambiguous the rows are held back and run through its row
+    converter, so their dates can settle the format, and are only released
+    once it is settled, MAX_DATE_LOOKAHEAD_ROWS rows are held or the file
+    ends. That way the rows before the first telling date are parsed in the
+    right format too.
+    """
+    date_parser = layout.date_parser
+    if date_parser is not None and not date_parser.settled:
+        held = []
+        for numbered_row in numbered_rows:
+            held.append(numbered_row)
+            if numbered_row[1]:
+                try:
+                    layout.convert_row(numbered_row[1])
+                except (IndexError, ValueError):
+                    pass  # Reported when the row is converted for real
+            if date_parser.settled or len(held) >= MAX_DATE_LOOKAHEAD_ROWS:
+                break
+        if not date_parser.settled:
+            logger.warning(f"Dates are ambiguous after {len(held)} rows, reading them as {date_parser.date_format}")
+        yield from held
+    yield from numbered_rows
+
+def parse_statement(source, original_filename):
+    """
+    Yields the parsed rows of a statement one at a time. source is anything
+    open_statement accepts: a path, an upload stream or a text stream. The
+    format is detected from the first SAMPLE_ROWS rows, which are then parsed
+    along with the rest of the file.
+    """
+    logger.info(f"Processing file: {original_filename}")
+    format_name = 'unknown'
+    parsed_count = error_count = 0
+    try:
+        with open_statement(source) as stream:
+            try:
+                reader = csv.reader(stream)
+                sample = list(islice(reader, SAMPLE_ROWS))
+                layout = detect_layout(sample, original_filename)
+                if layout is None:
+                    logger.warning(f"Could not recognise the format of '{original_filename}'")
+                    error_count += 1
+                    return
+                format_name = layout.format_name
+                logger.info(f"Processing as {layout.format_name} file: {layout.account_source}")
+
+                convert_row = layout.convert_row
+                rows = enumerate(chain(sample[layout.header_rows:], reader), start=layout.header_rows + 1)
+                for row_number, row in _settle_date_format(layout, rows):
+                    if not row:
+                        continue
+                    try:
+                        txn = convert_row(row)
+                    except (IndexError, ValueError) as e:
+                        logger.error(f"Skipping row {row_number} {row}: {e}")
+                        error_count += 1
+                        continue
+                    if txn is not None:
+                        parsed_count += 1
+                        yield txn
+            except (csv.Error, UnicodeDecodeError) as e:
+                logger.error(f"Error reading {original_filename}: {e}")
+                error_count += 1
+                return
+
+        logger.info(f"Parsed {parsed_count} transactions from {original_filename}")
+    finally:
+        # Counted once per file, also when the consumer stops early
+        metrics.inc(IMPORT_ROWS_PARSED, parsed_count, format=format_name)
+        metrics.inc(IMPORT_PARSE_ERRORS, error_count, format=format_name)
@@ -0,0 +1,112 @@
+import cProfile
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_QUERY_PARAM = 'profile'
+PROFILE_FILE_HEADER = 'X-Profile-File'
+DEFAULT_MIN_INTERVAL = 60.0
+
+
+class RequestProfiler:
+    """
+    WSGI middleware that runs single requests under cProfile on demand.
+
+    A request is profiled when PROFILING_ENABLED is set and it carries the
+    PROFILING_TOKEN secret in the X-Profile-Token header or the ?profile= query
+    parameter. The whole request is profiled, from routing and login to the
+    view (e.g. upload_file -> import_statement -> parser and categorizer) and
+    the response body. One .prof file per request is written to PROFILES_DIR
+    and named in the X-Profile-File response header.
+
+    At most one request per PROFILING_MIN_INTERVAL seconds is profiled per
+    process, and never two at once; other requests run normally, so leaving
+    it enabled in production is safe.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self._lock = threading.Lock()
+        self._last_profile = None
+        app.wsgi_app = self
+
+    def _requested(self, environ):
+        config = self.app.config
+        token = config.get('PROFILING_TOKEN')
+        if not config.get('PROFILING_ENABLED') or not token:
+            return False
+        supplied = environ.get('HTTP_' + PROFILE_HEADER.upper().replace('-', '_'))
+        if supplied is None:
+            supplied = parse_qs(environ.get('QUERY_STRING', '')).get(PROFILE_QUERY_PARAM, [None])[0]
+        return supplied is not None and hmac.compare_digest(supplied.encode(), token.encode())
+
+    def _acquire_slot(self):
+        """Claims the profiler unless it is busy or was used less than PROFILING_MIN_INTERVAL ago."""
+        if not self._lock.acquire(blocking=False):
+            return False
+        min_interval = self.app.config.get('PROFILING_MIN_INTERVAL', DEFAULT_MIN_INTERVAL)
+        now = time.monotonic()
+        if self._last_profile is not None and now - self._last_profile < min_interval:
+            self._lock.release()
+            return False
+        self._last_profile = now
+        return True
+
+    def _profile_path(self, environ):
+        directory = self.app.config.get('PROFILES_DIR') or os.path.join(self.app.instance_path, 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        path = re.sub(r'[^A-Za-z0-9]+', '_', environ.get('PATH_INFO', '')).strip('_') or 'root'
+        timestamp = time.strftime('%Y%m%d-%H%M%S')
+        name = f"{timestamp}-{environ.get('REQUEST_METHOD', 'GET')}-{path[:60]}-{os.getpid()}-{time.time_ns() % 1000000}.prof"
+        return os.path.join(directory, name)
+
+    def __call__(self, environ, start_response):
+        if not self._requested(environ):
+            return self.wsgi_app(environ, start_response)
+        if not self._acquire_slot():
+            logger.info(f"Profiling skipped for {environ.get('PATH_INFO')}: rate limited")
+            return self.wsgi_app(environ, start_response)
+
+        try:
+            path = self._profile_path(environ)
+
+            def start_profiled_response(status, headers, exc_info=None):
+                headers.append((PROFILE_FILE_HEADER, os.path.basename(path)))
+                return start_response(status, headers, exc_info)
+
+            body = []
+
+            def run_request():
+                app_iter = self.wsgi_app(environ, start_profiled_response)
+                try:
+                    body.extend(app_iter)
+                finally:
+                    if hasattr(app_iter, 'close'):
+                        app_iter.close()
+
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+            try:
+                profile.runcall(run_request)
+            finally:
+                profile.dump_stats(path)
+                logger.info(f"Profiled {environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')} "
+                            f"in {(time.perf_counter() - started) * 1000:.1f}ms: {path}")
+            return body
+        finally:
+            self._lock.release()
+
+
+def init_profiling(app):
+    """Installs the on-demand request profiler; it stays inactive unless PROFILING_ENABLED is set."""
+    app.config.setdefault('PROFILING_ENABLED', False)
+    app.config.setdefault('PROFILING_MIN_INTERVAL', DEFAULT_MIN_INTERVAL)
+    return RequestProfiler(app)
@@ -0,0 +1,143 @@
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, or_, select, update
+
+from categorizer import compile_keyword, get_rule_matcher, keyword_like_pattern
+from dashboard_cache import invalidate_dashboard_cache
+from extensions import db
+from models import Transaction
+from rollup import month_of, refresh_monthly_totals
+
+# --- Re-applying rules after a rule change ---
+# A rule can only change the category of transactions whose description
+# matches its keyword (the new one, or the old one when it was edited or
+# deleted). Those descriptions are found with a LIKE scan of
+# ix_transactions_user_id_description_id and checked with the keyword's regex
+# (SQLite only folds ASCII case in lower() and LIKE, so non-ASCII keywords are
+# left to the regex alone), each distinct description is run through the
+# user's compiled RuleMatcher once, and the transactions are
+# updated in batches of descriptions per resulting category. Small sets are
+# done within the request; larger ones are queued to a background worker.
+
+RECATEGORIZE_SYNC_LIMIT = 2000
+RECATEGORIZE_BATCH_SIZE = 500
+
+# One worker: jobs for the same user run in order and never race each other
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recategorize')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _candidate_filter(keyword_patterns):
+    like = or_(*(func.lower(Transaction.description).like(keyword_like_pattern(pattern), escape='\\')
+                 for pattern in keyword_patterns))
+    if db.engine.dialect.name == 'postgresql' or all(pattern.isascii() for pattern in keyword_patterns):
+        return like
+    return None
+
+
+def _candidate_descriptions(user_id, keyword_patterns):
+    """Returns {description: transaction count} for the user's descriptions matching any of the keyword patterns."""
+    query = select(Transaction.description, func.count()).where(
+        Transaction.user_id == user_id
+    ).group_by(Transaction.description)
+    candidate_filter = _candidate_filter(keyword_patterns)
+    if candidate_filter is not None:
+        query = query.where(candidate_filter)
+    keywords = [compile_keyword(pattern) for pattern in keyword_patterns]
+    return {description: count for description, count in db.session.execute(query)
+            if any(keyword.search(description.lower()) for keyword in keywords)}
+
+
+def count_candidates(user_id, keyword_patterns):
+    """Returns how many of the user's transactions match any of the keyword patterns."""
+    return sum(_candidate_descriptions(user_id, keyword_patterns).values())
+
+
+def recategorize_matching(user_id, keyword_patterns, preserve_manual=False):
+    """
+    Re-runs the user's rules on the transactions matching any of the keyword
+    patterns and updates those whose category changes. With preserve_manual,
+    categories assigned by hand are left alone. Refreshes the monthly rollup;
+    the caller commits. Returns the number of transactions updated.
+    """
+    descriptions = _candidate_descriptions(user_id, keyword_patterns)
+
+    matcher = get_rule_matcher(user_id)
+    descriptions_by_category = defaultdict(list)
+    for description in descriptions:
+        match = matcher.match(description)
+        descriptions_by_category[match[0] if match else None].append(description)
+
+    updated = 0
+    months = set()
+    for category_id, category_descriptions in descriptions_by_category.items():
+        for start in range(0, len(category_descriptions), RECATEGORIZE_BATCH_SIZE):
+            stmt = update(Transaction).where(
+                Transaction.user_id == user_id,
+                Transaction.description.in_(category_descriptions[start:start + RECATEGORIZE_BATCH_SIZE]),
+                Transaction.category_id.is_distinct_from(category_id)
+            ).values(category_id=category_id, category_manual=False).returning(Transaction.date)
+            if preserve_manual:
+                stmt = stmt.where(Transaction.category_manual.is_(False))
+            dates = db.session.execute(stmt, execution_options={'synchronize_session': False}).scalars().all()
+            updated += len(dates)
+            months.update(month_of(user_id, day) for day in set(dates))
+
+    refresh_monthly_totals(months)
+    return updated
+
+
+def _run_job(app, user_id, keyword_patterns, preserve_manual):
+    with app.app_context():
+        try:
+            updated = recategorize_matching(user_id, keyword_patterns, preserve_manual)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error re-categorizing transactions for user {user_id}: {e}")
+            raise
+        finally:
+            db.session.remove()
+        invalidate_dashboard_cache(user_id)
+        app.logger.info(f"Re-categorized {updated} transactions for user {user_id} in the background")
+        return updated
+
+
+def recategorize_in_background(app, user_id, keyword_patterns, preserve_manual=False):
+    """Queues recategorize_matching on the background worker. Returns its Future."""
+    future = _executor.submit(_run_job, app, user_id, list(keyword_patterns), preserve_manual)
+    with _pending_lock:
+        _pending.add(future)
+    future.add_done_callback(_discard_pending)
+    return future
+
+
+def _discard_pending(future):
+    with _pending_lock:
+        _pending.discard(future)
+
+
+def wait_for_background_jobs(timeout=None):
+    """Blocks until every queued re-categorization has finished (used by tests and CLI commands)."""
+    with _pending_lock:
+        futures = list(_pending)
+    for future in futures:
+        future.exception(timeout)
+
+
+def recategorize_after_rule_change(app, user_id, keyword_patterns, preserve_manual=False, sync_limit=RECATEGORIZE_SYNC_LIMIT):
+    """
+    Re-applies the rules to the transactions a rule change can affect, given
+    the rule's old and/or new keyword patterns. Up to sync_limit candidates
+    are updated now and left for the caller to commit; more are queued to the
+    background worker. Returns a summary for the API response.
+    """
+    candidates = count_candidates(user_id, keyword_patterns)
+    if candidates > sync_limit:
+        recategorize_in_background(app, user_id, keyword_patterns, preserve_manual)
+        return {'status': 'queued', 'candidates': candidates}
+    updated = recategorize_matching(user_id, keyword_patterns, preserve_manual) if candidates else 0
+    return {'status': 'done', 'candidates': candidates, 'updated': updated}
@@ -0,0 +1,161 @@
+from datetime import date
+
+from sqlalchemy import Integer, case, cast, delete, event, extract, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import MonthlyCategoryTotal, Transaction
+
+# --- monthly_category_totals maintenance ---
+# The rollup holds one row per (user, month, category) with income and expense
+# sums and a transaction count. Whenever transactions change, every touched
+# (user, year, month) is recomputed from the raw transactions of that month
+# (delete + INSERT ... SELECT, served by ix_transactions_user_id_date_id), so the
+# rollup never drifts the way running deltas can.
+#
+# The trade-off: a one-row edit re-reads every transaction of its month rather
+# than adding a per-row delta (income, expense, count) with an upsert. That
+# costs two statements per touched month, with the SELECT bounded by one
+# user's month of transactions (an index range scan of a few hundred rows),
+# and in exchange no path has to work out exact old and new values: category
+# moves, date moves across months, bulk Core statements and cascades all just
+# name the months they touched, float sums are recomputed instead of
+# accumulating rounding error, and a missed or repeated refresh is harmless.
+#
+# Changes made through the ORM unit of work (session.add/delete, attribute
+# edits, cascades) are picked up automatically after each flush. Bulk
+# statements that bypass it (Core inserts, Query.delete()) must call
+# refresh_monthly_totals or rebuild_monthly_totals themselves.
+
+rollup = MonthlyCategoryTotal.__table__
+transactions = Transaction.__table__
+
+
+def month_of(user_id, day):
+    return (user_id, day.year, day.month)
+
+
+def month_bounds(year, month):
+    """Returns (start_date, end_date) of a month, end_date being the first day of the next month."""
+    start_date = date(year, month, 1)
+    end_date = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start_date, end_date
+
+
+def _aggregate_columns():
+    return [
+        transactions.c.category_id,
+        func.coalesce(func.sum(case((transactions.c.amount > 0, transactions.c.amount), else_=0.0)), 0.0),
+        func.coalesce(func.sum(case((transactions.c.amount < 0, transactions.c.amount), else_=0.0)), 0.0),
+        func.count(transactions.c.id),
+    ]
+
+
+def refresh_monthly_totals(months, connection=None):
+    """
+    Recomputes the rollup rows of each (user_id, year, month) in months from
+    the raw transactions. Runs in the caller's transaction (the session's
+    connection unless one is given); the caller commits. Costs a DELETE and
+    an INSERT ... SELECT over the month's transactions per month, however
+    few of its rows changed (see the trade-off above).
+    """
+    connection = connection if connection is not None else db.session.connection()
+    for user_id, year, month in sorted(set(months)):
+        start_date, end_date = month_bounds(year, month)
+        connection.execute(delete(rollup).where(
+            rollup.c.user_id == user_id, rollup.c.year == year, rollup.c.month == month
+        ))
+        aggregate = select(
+            transactions.c.user_id,
+            cast(year, Integer),
+            cast(month, Integer),
+            *_aggregate_columns()
+        ).where(
+            transactions.c.user_id == user_id,
+            transactions.c.date >= start_date,
+            transactions.c.date < end_date
+        ).group_by(transactions.c.user_id, transactions.c.category_id)
+        connection.execute(insert(rollup).from_select(
+            ['user_id', 'year', 'month', 'category_id', 'income_sum', 'expense_sum', 'txn_count'], aggregate
+        ))
+
+
+def _grouped_totals(user_id=None):
+    """The rollup as it should be, computed from the raw transactions."""
+    year = cast(extract('year', transactions.c.date), Integer)
+    month = cast(extract('month', transactions.c.date), Integer)
+    query = select(transactions.c.user_id, year, month, *_aggregate_columns()).group_by(
+        transactions.c.user_id, year, month, transactions.c.category_id
+    )
+    if user_id is not None:
+        query = query.where(transactions.c.user_id == user_id)
+    return query
+
+
+def rebuild_monthly_totals(user_id=None, connection=None):
+    """Recomputes the whole rollup, or one user's part of it, from the raw transactions. The caller commits."""
+    connection = connection if connection is not None else db.session.connection()
+    stale = delete(rollup)
+    if user_id is not None:
+        stale = stale.where(rollup.c.user_id == user_id)
+    connection.execute(stale)
+    connection.execute(insert(rollup).from_select(
+        ['user_id', 'year', 'month', 'category_id', 'income_sum', 'expense_sum', 'txn_count'],
+        _grouped_totals(user_id)
+    ))
+
+
+def verify_monthly_totals(user_id=None, connection=None):
+    """
+    Compares the rollup with the raw transactions. Returns a list of
+    (user_id, year, month, category_id, expected, actual) mismatches, where
+    expected/actual are (income_sum, expense_sum, txn_count) or None.
+    """
+    connection = connection if connection is not None else db.session.connection()
+
+    def totals_by_key(rows):
+        return {(row[0], row[1], row[2], row[3]): (round(row[4], 2), round(row[5], 2), row[6]) for row in rows}
+
+    expected = totals_by_key(connection.execute(_grouped_totals(user_id)))
+    stored_query = select(
+        rollup.c.user_id, rollup.c.year, rollup.c.month, rollup.c.category_id,
+        rollup.c.income_sum, rollup.c.expense_sum, rollup.c.txn_count
+    )
+    if user_id is not None:
+        stored_query = stored_query.where(rollup.c.user_id == user_id)
+    actual = totals_by_key(connection.execute(stored_query))
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual), key=lambda k: (k[0], k[1], k[2], k[3] or 0)):
+        if expected.get(key) != actual.get(key):
+            mismatches.append((*key, expected.get(key), actual.get(key)))
+    return mismatches
+
+
+def _touched_months(session):
+    months = set()
+    for obj in session.new:
+        if isinstance(obj, Transaction) and obj.user_id is not None:
+            months.add(month_of(obj.user_id, obj.date or date.today()))
+    for obj in session.deleted:
+        if isinstance(obj, Transaction):
+            months.add(month_of(obj.user_id, obj.date))
+    for obj in session.dirty:
+        if not isinstance(obj, Transaction) or not session.is_modified(obj):
+            continue
+        months.add(month_of(obj.user_id, obj.date))
+        # A transaction moved to another month or user also changes its old month
+        state = inspect(obj)
+        old_dates = state.attrs.date.history.deleted or [obj.date]
+        old_users = state.attrs.user_id.history.deleted or [obj.user_id]
+        for old_user in old_users:
+            for old_date in old_dates:
+                months.add(month_of(old_user, old_date))
+    return months
+
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_rollup_after_flush(session, flush_context):
+    months = _touched_months(session)
+    if months:
+        refresh_monthly_totals(months, session.connection())
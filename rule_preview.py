@@ -0,0 +1,149 @@
+import threading
+
+from sqlalchemy import column, func, select, table, text
+from sqlalchemy.exc import OperationalError
+
+from categorizer import compile_keyword, keyword_like_pattern
+from extensions import db
+from models import DESCRIPTION_FTS_TABLE, DESCRIPTION_TRGM_INDEX, Category, Transaction
+
+# --- Rule impact preview ---
+# Shows which of a user's transactions a keyword would match before it is
+# saved as a rule. The database narrows the user's descriptions down with its
+# substring index (FTS5 trigram on SQLite, pg_trgm on Postgres) and returns
+# them grouped by (description, category); the grouped candidates are then
+# checked with the same regex the RuleMatcher uses, so the preview agrees
+# with assign_category exactly. Without a usable index (or for keywords with
+# no three character run) the candidates come from a LIKE scan instead.
+
+PREVIEW_SAMPLE_SIZE = 20
+MAX_PREVIEW_SAMPLE_SIZE = 100
+# FTS5 trigram can only look up literal runs of at least this many characters
+TRIGRAM_LENGTH = 3
+
+_description_fts = table(DESCRIPTION_FTS_TABLE, column('rowid'), column('description'))
+
+# Which index each database has, keyed by database url
+_index_cache = {}
+_index_cache_lock = threading.Lock()
+
+
+def description_search_index():
+    """Returns 'fts5' or 'pg_trgm' when the database has the description search index, else None."""
+    key = str(db.engine.url)
+    if key in _index_cache:
+        return _index_cache[key]
+
+    dialect_name = db.engine.dialect.name
+    index = None
+    if dialect_name == 'sqlite':
+        # Reading the table also catches databases whose index was built by a
+        # SQLite with FTS5 but are opened by one without it
+        try:
+            db.session.execute(select(_description_fts.c.rowid).limit(0))
+            index = 'fts5'
+        except OperationalError:
+            index = None
+    elif dialect_name == 'postgresql':
+        found = db.session.execute(
+            text("SELECT 1 FROM pg_indexes WHERE indexname = :name"), {'name': DESCRIPTION_TRGM_INDEX}
+        ).first()
+        index = 'pg_trgm' if found else None
+
+    with _index_cache_lock:
+        _index_cache[key] = index
+    return index
+
+
+def fts_match_query(keyword_pattern):
+    """
+    Converts a rule keyword to an FTS5 trigram MATCH query requiring each
+    literal part of the keyword, or None when no part is long enough to be
+    looked up.
+    """
+    parts = [part for part in keyword_pattern.lower().split('*') if len(part) >= TRIGRAM_LENGTH]
+    if not parts:
+        return None
+    return ' AND '.join('"' + part.replace('"', '""') + '"' for part in parts)
+
+
+def _candidate_filter(keyword_pattern, index):
+    if index == 'fts5':
+        match_query = fts_match_query(keyword_pattern)
+        if match_query is not None:
+            return Transaction.id.in_(
+                select(_description_fts.c.rowid).where(_description_fts.c.description.match(match_query))
+            ), 'fts5'
+    like = func.lower(Transaction.description).like(keyword_like_pattern(keyword_pattern), escape='\\')
+    if index == 'pg_trgm':
+        return like, 'pg_trgm'
+    # SQLite only folds ASCII case in lower() and LIKE, so non-ASCII keywords
+    # are left to the regex alone
+    return (like if keyword_pattern.isascii() else None), 'scan'
+
+
+def candidates_query(user_id, keyword_pattern):
+    """
+    Returns the query for (description, category_id, category name, count)
+    of the user's transactions that may match the keyword, and the index it
+    uses: 'fts5', 'pg_trgm' or 'scan'.
+    """
+    candidate_filter, index = _candidate_filter(keyword_pattern, description_search_index())
+    query = select(
+        Transaction.description, Transaction.category_id, Category.name, func.count()
+    ).outerjoin(Category, Transaction.category_id == Category.id).where(
+        Transaction.user_id == user_id
+    ).group_by(Transaction.description, Transaction.category_id, Category.name)
+    if candidate_filter is not None:
+        query = query.where(candidate_filter)
+    return query, index
+
+
+def preview_rule(user_id, keyword_pattern, sample_size=PREVIEW_SAMPLE_SIZE):
+    """
+    Returns the number of the user's transactions the keyword would match,
+    the matches per current category and a sample of the matching
+    transactions, most recent first, taken from the most common descriptions.
+    """
+    keyword = compile_keyword(keyword_pattern)
+    query, index = candidates_query(user_id, keyword_pattern)
+
+    match_count = 0
+    by_category = {}
+    count_by_description = {}
+    for description, category_id, category_name, count in db.session.execute(query):
+        if not keyword.search(description.lower()):
+            continue
+        match_count += count
+        category = by_category.setdefault(category_id, {
+            'category_id': category_id, 'category': category_name or 'Uncategorized', 'count': 0
+        })
+        category['count'] += count
+        count_by_description[description] = count_by_description.get(description, 0) + count
+
+    sample = []
+    if count_by_description and sample_size:
+        sample_descriptions = sorted(count_by_description, key=count_by_description.get, reverse=True)[:sample_size]
+        rows = db.session.execute(select(
+            Transaction.id, Transaction.date, Transaction.description, Transaction.amount,
+            Transaction.category_id, Category.name
+        ).outerjoin(Category, Transaction.category_id == Category.id).where(
+            Transaction.user_id == user_id,
+            Transaction.description.in_(sample_descriptions)
+        ).order_by(Transaction.date.desc(), Transaction.id.desc()).limit(sample_size))
+        sample = [{
+            'id': row.id,
+            'date': row.date.isoformat(),
+            'description': row.description,
+            'amount': row.amount,
+            'category_id': row.category_id,
+            'category': row.name or 'Uncategorized'
+        } for row in rows]
+
+    return {
+        'keyword_pattern': keyword_pattern,
+        'match_count': match_count,
+        'categories': sorted(by_category.values(), key=lambda category: (-category['count'], category['category'])),
+        'sample': sample,
+        'index': index
+    }
@@ -3,6 +3,7 @@ Tests for budget management functionality
 """
 import pytest
 import json
+import models
 from models import Budget, Category, User
 from extensions import db
 
@@ -502,18 +503,17 @@ class TestBudgetIntegration:
         assert data['budgets_updated'] == 0
         assert data['target_months'] == 2
 
-        # Verify budgets were created for February and March 2024
-        with app.app_context():
-            feb_budgets = Budget.query.filter_by(month=2, year=2024, user_id=test_user).all()
-            mar_budgets = Budget.query.filter_by(month=3, year=2024, user_id=test_user).all()
+        # Verify February and March 2024 have the January budgets
+        feb_budgets = auth_client.get('/api/budgets/2024/2').get_json()
+        mar_budgets = auth_client.get('/api/budgets/2024/3').get_json()
 
-            assert len(feb_budgets) == 2
-            assert len(mar_budgets) == 2
+        assert len(feb_budgets) == 2
+        assert len(mar_budgets) == 2
 
-            # Check amounts are correct
-            amounts = [b.budgeted_amount for b in feb_budgets + mar_budgets]
-            assert 500.00 in amounts
-            assert 200.00 in amounts
+        # Check amounts are correct
+        amounts = [b['budgeted_amount'] for b in feb_budgets + mar_budgets]
+        assert 500.00 in amounts
+        assert 200.00 in amounts
 
     def test_carry_over_budgets_update_existing(self, app, auth_client, test_user):
         """Test that carry-over updates existing budgets."""
@@ -554,15 +554,9 @@ class TestBudgetIntegration:
         assert data['budgets_created'] == 0
         assert data['budgets_updated'] == 1
 
-        # Verify existing budget was updated
-        with app.app_context():
-            updated_budget = Budget.query.filter_by(
-                category_id=category_id,
-                month=2,
-                year=2024,
-                user_id=test_user
-            ).first()
-            assert updated_budget.budgeted_amount == 300.00
+        # Verify February now has the January budget
+        feb_budgets = auth_client.get('/api/budgets/2024/2').get_json()
+        assert [(b['category_id'], b['budgeted_amount']) for b in feb_budgets] == [(category_id, 300.00)]
 
     def test_carry_over_budgets_no_source_budgets(self, auth_client):
         """Test carry-over when no source budgets exist."""
@@ -599,4 +593,355 @@ class TestBudgetIntegration:
             'source_year': 2024,
             'target_months': 61
         })
-        assert response.status_code == 400
\ No newline at end of file
+        assert response.status_code == 400
+
+
+    def test_carry_over_wraps_year_and_mixes_created_and_updated(self, app, auth_client, test_user):
+        """Test carry-over into the next year with some target budgets already set."""
+        with app.app_context():
+            rent = Category(name='Rent', user_id=test_user)
+            food = Category(name='Food', user_id=test_user)
+            db.session.add_all([rent, food])
+            db.session.flush()
+            db.session.add_all([
+                Budget(category_id=rent.id, month=11, year=2024, budgeted_amount=1500.00, user_id=test_user),
+                Budget(category_id=food.id, month=11, year=2024, budgeted_amount=400.00, user_id=test_user),
+                Budget(category_id=food.id, month=1, year=2025, budgeted_amount=50.00, user_id=test_user),
+                # Outside the target range, left alone
+                Budget(category_id=food.id, month=3, year=2025, budgeted_amount=75.00, user_id=test_user),
+            ])
+            db.session.commit()
+
+        response = auth_client.post('/api/budgets/carry-over', json={
+            'source_month': 11,
+            'source_year': 2024,
+            'target_months': 3
+        })
+
+        data = response.get_json()
+        assert data['budgets_created'] == 5
+        assert data['budgets_updated'] == 1
+
+        def budgets_in(year, month):
+            return {b['category_name']: b['budgeted_amount']
+                    for b in auth_client.get(f'/api/budgets/{year}/{month}').get_json()}
+
+        for year, month in [(2024, 12), (2025, 1), (2025, 2)]:
+            assert budgets_in(year, month) == {'Rent': 1500.00, 'Food': 400.00}
+        assert budgets_in(2025, 3) == {'Rent': 1500.00, 'Food': 75.00}
+
+    def test_carry_over_statement_count_independent_of_months(self, app, auth_client, test_user, query_counter):
+        """Test that carrying over 60 months issues as many statements as 1 month."""
+        with app.app_context():
+            categories = [Category(name=f'Carry {i}', user_id=test_user) for i in range(5)]
+            db.session.add_all(categories)
+            db.session.flush()
+            db.session.add_all([Budget(category_id=category.id, month=6, year=2024, budgeted_amount=10.0 * (i + 1),
+                                       user_id=test_user) for i, category in enumerate(categories)])
+            db.session.commit()
+
+        def carry_over(target_months):
+            with query_counter() as counter:
+                response = auth_client.post('/api/budgets/carry-over', json={
+                    'source_month': 6, 'source_year': 2024, 'target_months': target_months
+                })
+            assert response.status_code == 200
+            return counter.count, response.get_json()
+
+        one_month_count, _ = carry_over(1)
+        five_years_count, data = carry_over(60)
+
+        assert one_month_count == five_years_count
+        assert data['budgets_created'] == 5 * 60
+        assert data['budgets_updated'] == 0
+        with app.app_context():
+            # Carried over budgets are inherited, not copied
+            assert Budget.query.filter_by(user_id=test_user).count() == 5
+
+class TestBulkBudgets:
+    """Test setting many budgets at once with /api/budgets/bulk."""
+
+    def add_categories(self, user_id, count):
+        categories = [Category(name=f'Bulk Category {i}', user_id=user_id) for i in range(count)]
+        db.session.add_all(categories)
+        db.session.commit()
+        return [category.id for category in categories]
+
+    def test_bulk_creates_and_updates_budgets(self, app, auth_client, test_user):
+        """Test that new budgets are inserted and existing ones updated in place."""
+        with app.app_context():
+            category_ids = self.add_categories(test_user, 3)
+            db.session.add(Budget(category_id=category_ids[0], month=12, year=2024,
+                                  budgeted_amount=500.00, user_id=test_user))
+            db.session.commit()
+            existing_id = Budget.query.filter_by(category_id=category_ids[0]).one().id
+
+        response = auth_client.post('/api/budgets/bulk', json={'budgets': [
+            {'category_id': category_id, 'month': 12, 'year': 2024, 'budgeted_amount': 100.0 * (i + 1)}
+            for i, category_id in enumerate(category_ids)
+        ]})
+
+        assert response.status_code == 200
+        assert response.get_json() == {'budgets_saved': 3}
+        with app.app_context():
+            budgets = {b.category_id: b for b in Budget.query.filter_by(user_id=test_user).all()}
+            assert len(budgets) == 3
+            assert budgets[category_ids[0]].id == existing_id
+            assert [budgets[category_id].budgeted_amount for category_id in category_ids] == [100.0, 200.0, 300.0]
+
+    def test_bulk_without_on_conflict_support(self, app, auth_client, test_user, monkeypatch):
+        """Test that the upsert falls back to updating and adding rows without INSERT ... ON CONFLICT."""
+        monkeypatch.setattr(models, 'ON_CONFLICT_DIALECTS', ())
+        with app.app_context():
+            category_ids = self.add_categories(test_user, 2)
+            db.session.add(Budget(category_id=category_ids[0], month=12, year=2024,
+                                  budgeted_amount=500.00, user_id=test_user))
+            db.session.commit()
+
+        response = auth_client.post('/api/budgets/bulk', json={'budgets': [
+            {'category_id': category_id, 'month': 12, 'year': 2024, 'budgeted_amount': 75.0}
+            for category_id in category_ids
+        ]})
+
+        assert response.get_json() == {'budgets_saved': 2}
+        with app.app_context():
+            assert sorted((b.category_id, b.budgeted_amount) for b in Budget.query.filter_by(user_id=test_user)) == [
+                (category_ids[0], 75.0), (category_ids[1], 75.0)
+            ]
+
+    def test_bulk_clear_uses_constant_queries(self, app, auth_client, test_user, query_counter):
+        """Test that clearing 20 budgets costs the same statements as clearing 2."""
+        with app.app_context():
+            category_ids = self.add_categories(test_user, 20)
+
+        def clear(ids):
+            with query_counter() as counter:
+                response = auth_client.post('/api/budgets/bulk', json={'budgets': [
+                    {'category_id': category_id, 'month': 12, 'year': 2024, 'budgeted_amount': 0}
+                    for category_id in ids
+                ]})
+            assert response.status_code == 200
+            return counter.count
+
+        assert clear(category_ids[:2]) == clear(category_ids)
+
+    def test_bulk_last_duplicate_entry_wins(self, app, auth_client, test_user):
+        """Test repeated category/month/year entries in one request."""
+        with app.app_context():
+            category_id = self.add_categories(test_user, 1)[0]
+
+        response = auth_client.post('/api/budgets/bulk', json={'budgets': [
+            {'category_id': category_id, 'month': 1, 'year': 2025, 'budgeted_amount': 10},
+            {'category_id': category_id, 'month': 1, 'year': 2025, 'budgeted_amount': 20},
+        ]})
+
+        assert response.get_json() == {'budgets_saved': 1}
+        with app.app_context():
+            assert Budget.query.filter_by(category_id=category_id).one().budgeted_amount == 20.0
+
+    def test_bulk_rejects_other_users_category(self, app, auth_client, test_user, test_user2):
+        """Test that one foreign category rejects the whole request."""
+        with app.app_context():
+            own_id = self.add_categories(test_user, 1)[0]
+            other_id = self.add_categories(test_user2, 1)[0]
+
+        response = auth_client.post('/api/budgets/bulk', json={'budgets': [
+            {'category_id': own_id, 'month': 12, 'year': 2024, 'budgeted_amount': 50},
+            {'category_id': other_id, 'month': 12, 'year': 2024, 'budgeted_amount': 50},
+        ]})
+
+        assert response.status_code == 404
+        with app.app_context():
+            assert Budget.query.count() == 0
+
+    @pytest.mark.parametrize('entry, message', [
+        ({'month': 12, 'year': 2024, 'budgeted_amount': 5}, 'category_id is required'),
+        ({'category_id': 1, 'month': 13, 'year': 2024, 'budgeted_amount': 5}, 'Month must be between 1 and 12'),
+        ({'category_id': 1, 'month': 12, 'year': 1999, 'budgeted_amount': 5}, 'Year must be between 2000 and 2100'),
+        ({'category_id': 1, 'month': 12, 'year': 2024, 'budgeted_amount': -5}, 'Budget amount cannot be negative'),
+        ({'category_id': 1, 'month': 12, 'year': 2024, 'budgeted_amount': 'lots'}, 'invalid number'),
+        ({'category_id': 1, 'month': 12, 'year': 2024, 'budgeted_amount': True}, 'invalid number'),
+        ({'category_id': 5.7, 'month': 12, 'year': 2024, 'budgeted_amount': 5}, 'category_id must be an integer'),
+        ({'category_id': '5', 'month': 12, 'year': 2024, 'budgeted_amount': 5}, 'category_id must be an integer'),
+        ({'category_id': 1, 'month': True, 'year': 2024, 'budgeted_amount': 5}, 'month must be an integer'),
+        ({'category_id': 1, 'month': 12, 'year': 2024.5, 'budgeted_amount': 5}, 'year must be an integer'),
+    ])
+    def test_bulk_validation(self, auth_client, entry, message):
+        """Test that an invalid entry rejects the request and names the entry."""
+        response = auth_client.post('/api/budgets/bulk', json={'budgets': [entry]})
+
+        assert response.status_code == 400
+        assert response.get_json()['error'] == f'budgets[0]: {message}'
+
+    def test_bulk_malformed_entry_writes_nothing(self, app, auth_client, test_user):
+        """Test that a float category id in a later entry is named and rejects the whole request."""
+        with app.app_context():
+            category_id = self.add_categories(test_user, 1)[0]
+
+        response = auth_client.post('/api/budgets/bulk', json={'budgets': [
+            {'category_id': category_id, 'month': 12, 'year': 2024, 'budgeted_amount': 50},
+            {'category_id': category_id + 0.7, 'month': 12, 'year': 2024, 'budgeted_amount': 50},
+        ]})
+
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'budgets[1]: category_id must be an integer'
+        with app.app_context():
+            assert Budget.query.count() == 0
+
+    def test_bulk_requires_budgets_list(self, auth_client):
+        """Test a body without a budgets list."""
+        response = auth_client.post('/api/budgets/bulk', json={'category_id': 1})
+
+        assert response.status_code == 400
+
+    def test_bulk_invalidates_dashboard_cache(self, app, auth_client, test_user):
+        """Test that the dashboard shows budgets saved in bulk."""
+        with app.app_context():
+            category_id = self.add_categories(test_user, 1)[0]
+        auth_client.get('/2024/12')
+
+        auth_client.post('/api/budgets/bulk', json={'budgets': [
+            {'category_id': category_id, 'month': 12, 'year': 2024, 'budgeted_amount': 432.10}
+        ]})
+
+        assert b'432.10' in auth_client.get('/2024/12').data
+
+
+class TestEffectiveBudgets:
+    """Test that a budget applies from its month until a later budget supersedes it."""
+
+    def add_budgets(self, user_id, category_name, entries, is_fixed_cost=False):
+        """Adds a category with a budget per (year, month, amount) entry."""
+        category = Category(name=category_name, user_id=user_id, is_fixed_cost=is_fixed_cost)
+        db.session.add(category)
+        db.session.flush()
+        db.session.add_all([Budget(category_id=category.id, year=year, month=month, budgeted_amount=amount,
+                                   user_id=user_id) for year, month, amount in entries])
+        db.session.commit()
+        return category.id
+
+    def budgets_in(self, auth_client, year, month):
+        return {b['category_name']: b['budgeted_amount']
+                for b in auth_client.get(f'/api/budgets/{year}/{month}').get_json()}
+
+    def test_budget_applies_until_superseded(self, app, auth_client, test_user):
+        """Test months before, between and after two budgets."""
+        with app.app_context():
+            self.add_budgets(test_user, 'Groceries', [(2024, 1, 100.00), (2024, 4, 150.00)])
+
+        assert self.budgets_in(auth_client, 2023, 12) == {}
+        assert self.budgets_in(auth_client, 2024, 1) == {'Groceries': 100.00}
+        assert self.budgets_in(auth_client, 2024, 3) == {'Groceries': 100.00}
+        assert self.budgets_in(auth_client, 2024, 4) == {'Groceries': 150.00}
+        assert self.budgets_in(auth_client, 2026, 7) == {'Groceries': 150.00}
+
+    def test_get_budgets_reports_effective_from(self, app, auth_client, test_user):
+        """Test that an inherited budget names the month it was set in."""
+        with app.app_context():
+            self.add_budgets(test_user, 'Rent', [(2024, 11, 1500.00)])
+
+        budget = auth_client.get('/api/budgets/2025/2').get_json()[0]
+
+        assert (budget['year'], budget['month']) == (2025, 2)
+        assert (budget['effective_from_year'], budget['effective_from_month']) == (2024, 11)
+
+    def test_set_budget_applies_to_later_months(self, app, auth_client, test_user):
+        """Test that a budget set in one month shows up in the following months."""
+        with app.app_context():
+            category_id = self.add_budgets(test_user, 'Dining', [])
+
+        auth_client.post('/api/budgets', json={'category_id': category_id, 'month': 5, 'year': 2024,
+                                               'budgeted_amount': 80.00})
+
+        assert self.budgets_in(auth_client, 2024, 4) == {}
+        assert self.budgets_in(auth_client, 2024, 9) == {'Dining': 80.00}
+
+    def test_carry_over_keeps_budget_after_range(self, app, auth_client, test_user):
+        """Test that a budget set inside the carried-over months still applies after them."""
+        with app.app_context():
+            self.add_budgets(test_user, 'Utilities', [(2024, 1, 100.00), (2024, 2, 200.00)])
+
+        response = auth_client.post('/api/budgets/carry-over', json={
+            'source_month': 1, 'source_year': 2024, 'target_months': 2
+        })
+
+        assert response.get_json()['budgets_updated'] == 1
+        assert self.budgets_in(auth_client, 2024, 2) == {'Utilities': 100.00}
+        assert self.budgets_in(auth_client, 2024, 3) == {'Utilities': 100.00}
+        assert self.budgets_in(auth_client, 2024, 4) == {'Utilities': 200.00}
+
+    def test_carry_over_from_inherited_budget(self, app, auth_client, test_user):
+        """Test carrying over a month whose budget was set earlier."""
+        with app.app_context():
+            self.add_budgets(test_user, 'Transit', [(2024, 1, 90.00), (2024, 6, 120.00)])
+
+        response = auth_client.post('/api/budgets/carry-over', json={
+            'source_month': 3, 'source_year': 2024, 'target_months': 12
+        })
+
+        assert response.status_code == 200
+        assert self.budgets_in(auth_client, 2024, 6) == {'Transit': 90.00}
+        assert self.budgets_in(auth_client, 2025, 3) == {'Transit': 90.00}
+        assert self.budgets_in(auth_client, 2025, 4) == {'Transit': 120.00}
+
+    def test_stopped_budget_is_left_out_after_a_gap(self, app, auth_client, test_user):
+        """Test that a 0 budget means no budget in the months after it, until a new one is set."""
+        with app.app_context():
+            self.add_budgets(test_user, 'Gym', [(2024, 1, 50.00), (2024, 3, 0.0), (2024, 9, 60.00)])
+            self.add_budgets(test_user, 'Rent', [(2024, 1, 1500.00)], is_fixed_cost=True)
+
+        assert self.budgets_in(auth_client, 2024, 2) == {'Gym': 50.00, 'Rent': 1500.00}
+        assert self.budgets_in(auth_client, 2024, 3) == {'Rent': 1500.00}
+        assert self.budgets_in(auth_client, 2024, 6) == {'Rent': 1500.00}
+        assert self.budgets_in(auth_client, 2024, 10) == {'Gym': 60.00, 'Rent': 1500.00}
+        dashboard = auth_client.get('/2024/6').data.split(b'budget-planning')[0]
+        assert b'Gym' not in dashboard
+
+    def test_carry_over_keeps_stopped_budget_after_range(self, app, auth_client, test_user):
+        """Test that a budget stopped inside the carried-over months stays stopped after them."""
+        with app.app_context():
+            self.add_budgets(test_user, 'Gym', [(2024, 1, 50.00), (2024, 2, 0.0)])
+
+        auth_client.post('/api/budgets/carry-over', json={'source_month': 1, 'source_year': 2024, 'target_months': 2})
+
+        assert self.budgets_in(auth_client, 2024, 3) == {'Gym': 50.00}
+        assert self.budgets_in(auth_client, 2024, 4) == {}
+
+    def test_dashboard_shows_inherited_budget(self, app, auth_client, test_user):
+        """Test the home page budget section for a month without its own budget."""
+        with app.app_context():
+            self.add_budgets(test_user, 'Groceries', [(2024, 1, 345.67)])
+
+        response = auth_client.get('/2024/8')
+
+        assert b'345.67' in response.data
+
+    def test_fixed_costs_analysis_includes_budgets(self, app, auth_client, test_user):
+        """Test the budgeted totals of fixed and variable categories."""
+        with app.app_context():
+            self.add_budgets(test_user, 'Rent', [(2024, 1, 1500.00)], is_fixed_cost=True)
+            self.add_budgets(test_user, 'Dining', [(2024, 1, 100.00), (2024, 6, 0.0)])
+            self.add_budgets(test_user, 'Groceries', [(2024, 3, 400.00)])
+
+        data = auth_client.get('/api/fixed-costs-analysis/2024/7').get_json()
+
+        assert data['fixed_costs']['budgeted'] == 1500.00
+        assert data['variable_costs']['budgeted'] == 400.00
+
+    def test_effective_lookup_statement_count_independent_of_history(self, app, auth_client, test_user,
+                                                                     query_counter):
+        """Test that years of budget history cost no extra statements."""
+        with app.app_context():
+            self.add_budgets(test_user, 'Short', [(2024, 1, 10.0)])
+
+        with query_counter() as counter:
+            auth_client.get('/api/budgets/2024/6')
+        short_history = counter.count
+
+        with app.app_context():
+            self.add_budgets(test_user, 'Long', [(year, month, float(month)) for year in range(2020, 2025)
+                                                 for month in range(1, 13)])
+        with query_counter() as counter:
+            auth_client.get('/api/budgets/2024/6')
+
+        assert counter.count == short_history
@@ -0,0 +1,256 @@
+"""
+Tests for POST /api/transactions/bulk
+"""
+import pytest
+from datetime import date
+from sqlalchemy.exc import OperationalError
+from models import Transaction, Category
+from extensions import db
+from rollup import verify_monthly_totals
+
+
+@pytest.fixture
+def bulk_data(app, test_user, test_user2):
+    """Amazon, grocery and payroll transactions over two months, plus another user's Amazon purchase."""
+    with app.app_context():
+        shopping = Category(name='Shopping', user_id=test_user)
+        groceries = Category(name='Groceries', user_id=test_user)
+        other_category = Category(name='Theirs', user_id=test_user2)
+        db.session.add_all([shopping, groceries, other_category])
+        db.session.flush()
+        transactions = [
+            Transaction(date=date(2024, 11, 5), description='AMAZON.CA*2K4', amount=-25.00,
+                        account_source='Amex', user_id=test_user),
+            Transaction(date=date(2024, 12, 1), description='Amazon Mktp CA*8J1', amount=-40.00,
+                        account_source='Amex', user_id=test_user),
+            Transaction(date=date(2024, 12, 3), description='AMAZON.CA*9Q2', amount=-15.50,
+                        account_source='TD Chequing', category_id=groceries.id, user_id=test_user),
+            Transaction(date=date(2024, 12, 4), description='SUPERSTORE #1234', amount=-80.00,
+                        account_source='TD Chequing', category_id=groceries.id, user_id=test_user),
+            Transaction(date=date(2024, 12, 15), description='PAYROLL DEPOSIT', amount=2500.00,
+                        account_source='TD Chequing', user_id=test_user),
+            Transaction(date=date(2024, 12, 2), description='AMAZON.CA*OTHER', amount=-9.99,
+                        account_source='Amex', user_id=test_user2),
+        ]
+        db.session.add_all(transactions)
+        db.session.commit()
+        return {
+            'shopping': shopping.id, 'groceries': groceries.id, 'other_category': other_category.id,
+            'ids': [t.id for t in transactions[:5]], 'other_user_id': transactions[5].id,
+        }
+
+
+def descriptions_in(category_id, user_id):
+    return sorted(t.description for t in Transaction.query.filter_by(category_id=category_id, user_id=user_id))
+
+
+class TestBulkRecategorize:
+    """Test recategorizing many transactions at once."""
+
+    def test_recategorize_by_description_pattern(self, app, auth_client, test_user, bulk_data):
+        """Test a wildcard description filter, matched like a rule, case-insensitively."""
+        response = auth_client.post('/api/transactions/bulk', json={
+            'action': 'recategorize',
+            'filter': {'description': 'amazon*ca'},
+            'category_id': bulk_data['shopping']
+        })
+
+        assert response.status_code == 200
+        assert response.get_json() == {'action': 'recategorize', 'affected': 3}
+        with app.app_context():
+            assert descriptions_in(bulk_data['shopping'], test_user) == [
+                'AMAZON.CA*2K4', 'AMAZON.CA*9Q2', 'Amazon Mktp CA*8J1'
+            ]
+            other = db.session.get(Transaction, bulk_data['other_user_id'])
+            assert other.category_id is None
+
+    def test_recategorize_by_combined_filter(self, app, auth_client, test_user, bulk_data):
+        """Test date range, account and current category filters together."""
+        response = auth_client.post('/api/transactions/bulk', json={
+            'action': 'recategorize',
+            'filter': {'start_date': '2024-12-01', 'end_date': '2025-01-01',
+                       'account_source': 'TD Chequing', 'category_id': bulk_data['groceries']},
+            'category_id': bulk_data['shopping']
+        })
+
+        assert response.get_json()['affected'] == 2
+        with app.app_context():
+            assert descriptions_in(bulk_data['groceries'], test_user) == []
+
+    def test_uncategorize_by_ids(self, app, auth_client, test_user, bulk_data):
+        """Test category_id null on an id list, ignoring another user's id."""
+        response = auth_client.post('/api/transactions/bulk', json={
+            'action': 'recategorize',
+            'ids': bulk_data['ids'][2:4] + [bulk_data['other_user_id']],
+            'category_id': None
+        })
+
+        assert response.get_json()['affected'] == 2
+        with app.app_context():
+            assert descriptions_in(None, test_user) == [
+                'AMAZON.CA*2K4', 'AMAZON.CA*9Q2', 'Amazon Mktp CA*8J1', 'PAYROLL DEPOSIT', 'SUPERSTORE #1234'
+            ]
+
+    def test_recategorize_by_non_ascii_description(self, app, auth_client, test_user, bulk_data):
+        """Test a keyword whose case SQLite's lower() and LIKE do not fold, e.g. CAFÉ."""
+        with app.app_context():
+            db.session.add_all([
+                Transaction(date=date(2024, 12, 9), description='CAFÉ DEPOT #3', amount=-7.0,
+                            account_source='Amex', user_id=test_user),
+                Transaction(date=date(2024, 12, 10), description='Café Olé', amount=-3.0,
+                            account_source='Amex', user_id=test_user),
+            ])
+            db.session.commit()
+
+        response = auth_client.post('/api/transactions/bulk', json={
+            'action': 'recategorize', 'filter': {'description': 'café'}, 'category_id': bulk_data['shopping']
+        })
+
+        assert response.get_json() == {'action': 'recategorize', 'affected': 2}
+        with app.app_context():
+            assert descriptions_in(bulk_data['shopping'], test_user) == ['CAFÉ DEPOT #3', 'Café Olé']
+
+    def test_recategorize_to_other_users_category(self, auth_client, bulk_data):
+        """Test that the target category must belong to the user."""
+        response = auth_client.post('/api/transactions/bulk', json={
+            'action': 'recategorize', 'ids': bulk_data['ids'], 'category_id': bulk_data['other_category']
+        })
+
+        assert response.status_code == 404
+
+    def test_recategorize_uses_constant_statements(self, app, auth_client, test_user, bulk_data, query_counter):
+        """Test that 300 transactions over the same two months take as many statements as 2."""
+        with app.app_context():
+            db.session.add_all([Transaction(date=date(2024, 11 + i % 2, 1 + i % 28), description=f'AMAZON MKTP {i}',
+                                            amount=-1.0 - i, account_source='Amex', user_id=test_user)
+                                for i in range(300)])
+            db.session.commit()
+
+        def recategorize(pattern):
+            with query_counter() as counter:
+                response = auth_client.post('/api/transactions/bulk', json={
+                    'action': 'recategorize', 'filter': {'description': pattern}, 'category_id': bulk_data['shopping']
+                })
+            return response.get_json()['affected'], counter.count
+
+        few, few_count = recategorize('amazon.ca')
+        many, many_count = recategorize('amazon mktp')
+
+        assert (few, many) == (2, 301)
+        assert few_count == many_count
+
+
+class TestBulkDeleteAndUpdate:
+    """Test deleting and editing many transactions at once."""
+
+    def test_delete_by_filter(self, app, auth_client, test_user, bulk_data):
+        """Test deleting the transactions of one account in a date range."""
+        response = auth_client.post('/api/transactions/bulk', json={
+            'action': 'delete', 'filter': {'account_source': 'Amex', 'start_date': '2024-11-01'}
+        })
+
+        assert response.get_json() == {'action': 'delete', 'affected': 2}
+        with app.app_context():
+            assert Transaction.query.filter_by(user_id=test_user).count() == 3
+            assert db.session.get(Transaction, bulk_data['other_user_id']) is not None
+
+    def test_update_fields_recomputes_fingerprints(self, app, auth_client, test_user, bulk_data):
+        """Test renaming an account, after which the old transaction can be imported again."""
+        response = auth_client.post('/api/transactions/bulk', json={
+            'action': 'update', 'filter': {'account_source': 'Amex'}, 'fields': {'account_source': 'Amex Gold'}
+        })
+
+        assert response.get_json() == {'action': 'update', 'affected': 2}
+        with app.app_context():
+            assert Transaction.query.filter_by(user_id=test_user, account_source='Amex Gold').count() == 2
+            # The old fingerprint is free again
+            db.session.add(Transaction(date=date(2024, 11, 5), description='AMAZON.CA*2K4', amount=-25.00,
+                                       account_source='Amex', user_id=test_user))
+            db.session.commit()
+
+    def test_update_rejects_duplicates(self, app, auth_client, test_user, bulk_data):
+        """Test that an update creating duplicates changes nothing."""
+        response = auth_client.post('/api/transactions/bulk', json={
+            'action': 'update', 'ids': bulk_data['ids'][1:3],
+            'fields': {'description': 'AMAZON', 'amount': -10.0, 'date': '2024-12-01', 'account_source': 'Amex'}
+        })
+
+        assert response.status_code == 409
+        with app.app_context():
+            assert Transaction.query.filter_by(description='AMAZON').count() == 0
+
+    def test_update_rejects_duplicate_of_existing(self, app, auth_client, test_user, bulk_data):
+        """Test an update that would copy a transaction outside the selection."""
+        response = auth_client.post('/api/transactions/bulk', json={
+            'action': 'update', 'ids': [bulk_data['ids'][2]],
+            'fields': {'description': 'SUPERSTORE #1234', 'amount': -80.00, 'date': '2024-12-04'}
+        })
+
+        assert response.status_code == 409
+
+    def test_rollup_stays_consistent(self, app, auth_client, test_user, bulk_data):
+        """Test the monthly totals after moving, recategorizing and deleting in bulk."""
+        auth_client.post('/api/transactions/bulk', json={
+            'action': 'update', 'ids': bulk_data['ids'][:2], 'fields': {'date': '2025-01-10'}
+        })
+        auth_client.post('/api/transactions/bulk', json={
+            'action': 'recategorize', 'filter': {'description': 'amazon'}, 'category_id': bulk_data['shopping']
+        })
+        auth_client.post('/api/transactions/bulk', json={
+            'action': 'delete', 'filter': {'description': 'payroll'}
+        })
+
+        with app.app_context():
+            assert verify_monthly_totals(test_user) == []
+
+    def test_dashboard_reflects_bulk_changes(self, app, auth_client, test_user, bulk_data):
+        """Test that bulk writes invalidate the cached dashboard."""
+        assert b'Shopping' not in auth_client.get('/2024/12').data.split(b'budget-planning')[0]
+
+        auth_client.post('/api/transactions/bulk', json={
+            'action': 'recategorize', 'filter': {'description': 'amazon'}, 'category_id': bulk_data['shopping']
+        })
+
+        assert b'Shopping' in auth_client.get('/2024/12').data.split(b'budget-planning')[0]
+
+    @pytest.mark.parametrize('body', [
+        {'action': 'archive', 'ids': [1]},
+        {'action': 'delete'},
+        {'action': 'delete', 'ids': [1], 'filter': {'account_source': 'Amex'}},
+        {'action': 'delete', 'filter': {}},
+        {'action': 'delete', 'filter': {'merchant': 'x'}},
+        {'action': 'delete', 'filter': {'start_date': '12/01/2024'}},
+        {'action': 'delete', 'ids': ['1']},
+        {'action': 'recategorize', 'ids': [1]},
+        {'action': 'update', 'ids': [1], 'fields': {'category_id': 3}},
+        {'action': 'update', 'ids': [1], 'fields': {'description': ' '}},
+        {'action': 'delete', 'ids': [True]},
+        {'action': 'delete', 'filter': {'category_id': True}},
+        {'action': 'delete', 'filter': {'description': 5}},
+        {'action': 'recategorize', 'ids': [1], 'category_id': True},
+    ])
+    def test_invalid_requests_return_400(self, auth_client, bulk_data, body):
+        """Test invalid actions, selections and fields."""
+        response = auth_client.post('/api/transactions/bulk', json=body)
+
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+
+    def test_database_errors_are_rolled_back(self, app, auth_client, test_user, bulk_data, monkeypatch):
+        """Test that a failing statement returns a JSON error and leaves the transactions alone."""
+        def fail(*args):
+            raise OperationalError('DELETE FROM transactions', {}, Exception('database is locked'))
+        monkeypatch.setattr('app.delete_transactions', fail)
+
+        response = auth_client.post('/api/transactions/bulk', json={'action': 'delete', 'ids': bulk_data['ids']})
+
+        assert response.status_code == 500
+        assert response.get_json() == {'error': 'Failed to delete transactions'}
+        with app.app_context():
+            assert Transaction.query.filter_by(user_id=test_user).count() == 5
+
+    def test_requires_login(self, client):
+        """Test that the endpoint requires authentication."""
+        response = client.post('/api/transactions/bulk', json={'action': 'delete', 'ids': [1]})
+
+        assert response.status_code == 302
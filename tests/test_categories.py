@@ -387,4 +387,115 @@ class TestCategoryIntegration:
 
             updated_transaction = Transaction.query.get(transaction_id)
             assert updated_transaction is not None
-            assert updated_transaction.category_id is None
\ No newline at end of file
+            assert updated_transaction.category_id is None
+
+class TestRuleMatcher:
+    """Test the compiled per-user rule matcher used by the categorizer."""
+
+    def test_longest_rule_wins(self, app, test_user):
+        """Test that the longest matching rule decides the category."""
+        from categorizer import assign_category
+
+        with app.app_context():
+            general = Category(name='General', user_id=test_user)
+            groceries = Category(name='Groceries', user_id=test_user)
+            db.session.add_all([general, groceries])
+            db.session.flush()
+            db.session.add(Rule(keyword_pattern='wal-mart', category_id=general.id))
+            db.session.add(Rule(keyword_pattern='wal-mart groceries', category_id=groceries.id))
+            db.session.commit()
+
+            assert assign_category('WAL-MART GROCERIES #123', test_user) == 'Groceries'
+            assert assign_category('WAL-MART STORE #123', test_user) == 'General'
+            assert assign_category('Unknown merchant', test_user) is None
+
+    def test_wildcard_rule_matches(self, app, test_user):
+        """Test that * in a keyword matches any run of characters."""
+        from categorizer import assign_category
+
+        with app.app_context():
+            category = Category(name='Subscriptions', user_id=test_user)
+            db.session.add(category)
+            db.session.flush()
+            db.session.add(Rule(keyword_pattern='hp *instant ink', category_id=category.id))
+            db.session.commit()
+
+            assert assign_category('HP *Instant Ink Canada', test_user) == 'Subscriptions'
+            assert assign_category('Payment to HP for instant ink service', test_user) == 'Subscriptions'
+            assert assign_category('Instant ink from HP', test_user) is None
+
+    def test_rule_changes_invalidate_cached_matcher(self, app, auth_client, test_user):
+        """Test that rule endpoints invalidate the user's compiled matcher."""
+        from categorizer import assign_category
+
+        with app.app_context():
+            category = Category(name='Coffee', user_id=test_user)
+            db.session.add(category)
+            db.session.commit()
+            category_id = category.id
+            assert assign_category('STARBUCKS #42', test_user) is None
+
+        response = auth_client.post(f'/api/categories/{category_id}/rules',
+                                  json={'keyword_pattern': 'starbucks'})
+        assert response.status_code == 201
+        rule_id = json.loads(response.data)['rules'][0]['id']
+
+        with app.app_context():
+            assert assign_category('STARBUCKS #42', test_user) == 'Coffee'
+
+        response = auth_client.put(f'/api/categories/{category_id}',
+                                 json={'name': 'Cafe'})
+        assert response.status_code == 200
+        with app.app_context():
+            assert assign_category('STARBUCKS #42', test_user) == 'Cafe'
+
+        response = auth_client.delete(f'/api/rules/{rule_id}')
+        assert response.status_code == 200
+        with app.app_context():
+            assert assign_category('STARBUCKS #42', test_user) is None
+
+    def test_rule_changes_from_another_worker_rebuild_matcher(self, app, test_user, test_user2):
+        """Test that a cached matcher is rebuilt after a rule change that did not invalidate this process."""
+        from categorizer import assign_category
+
+        with app.app_context():
+            category = Category(name='Coffee', user_id=test_user)
+            db.session.add(category)
+            db.session.commit()
+            category_id = category.id
+            assert assign_category('STARBUCKS #42', test_user) is None
+
+        # Another worker's request: committed without touching this process's cache
+        with app.app_context():
+            db.session.add(Rule(keyword_pattern='starbucks', category_id=category_id))
+            db.session.commit()
+        with app.app_context():
+            assert assign_category('STARBUCKS #42', test_user) == 'Coffee'
+
+        with app.app_context():
+            db.session.get(Category, category_id).name = 'Cafe'
+            db.session.commit()
+        with app.app_context():
+            assert assign_category('STARBUCKS #42', test_user) == 'Cafe'
+            versions = dict(db.session.query(User.id, User.rules_version))
+            assert versions[test_user2] == 0
+
+    def test_assign_categories_batch(self, app, test_user, test_user2):
+        """Test that batch categorization returns ids aligned with the input."""
+        from categorizer import assign_categories
+
+        with app.app_context():
+            groceries = Category(name='Groceries', user_id=test_user)
+            other_users = Category(name='Groceries', user_id=test_user2)
+            db.session.add_all([groceries, other_users])
+            db.session.flush()
+            db.session.add(Rule(keyword_pattern='superstore', category_id=groceries.id))
+            db.session.add(Rule(keyword_pattern='superstore', category_id=other_users.id))
+            db.session.commit()
+
+            descriptions = ['SUPERSTORE #1', 'NETFLIX', 'SUPERSTORE #1', 'superstore #2']
+            assert assign_categories(descriptions, test_user) == [
+                groceries.id, None, groceries.id, groceries.id
+            ]
+            assert assign_categories(['SUPERSTORE #1'], test_user2) == [other_users.id]
+            assert assign_categories([], test_user) == []
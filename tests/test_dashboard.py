@@ -0,0 +1,194 @@
+"""
+Tests for the dashboard aggregation behind the home page
+"""
+from datetime import date
+from models import Transaction, Category, Budget
+from extensions import db
+from dashboard import build_dashboard
+import pytest
+from dashboard_cache import LRUBackend, SQLiteBackend, dashboard_cache_key, init_dashboard_cache
+
+
+def add_transactions(user_id, category_id, amounts, day=date(2024, 12, 1), prefix='TXN'):
+    for i, amount in enumerate(amounts):
+        db.session.add(Transaction(
+            date=day, description=f'{prefix} {i}', amount=amount,
+            account_source='Test Account', category_id=category_id, user_id=user_id
+        ))
+
+
+class TestDashboardAggregation:
+    """Test that dashboard numbers are computed from grouped queries."""
+
+    def test_totals_per_category_and_budget(self, app, test_user, test_user2):
+        """Test income, expenses, category totals, top spending and budget progress."""
+        with app.app_context():
+            groceries = Category(name='Groceries', user_id=test_user)
+            dining = Category(name='Dining', user_id=test_user)
+            other_user_category = Category(name='Groceries', user_id=test_user2)
+            db.session.add_all([groceries, dining, other_user_category])
+            db.session.flush()
+
+            add_transactions(test_user, groceries.id, [-100.00, -50.00, 20.00], prefix='GROCERY')
+            add_transactions(test_user, dining.id, [-30.00], prefix='DINING')
+            add_transactions(test_user, None, [2000.00, -5.00], prefix='MISC')
+            add_transactions(test_user, groceries.id, [-999.00], day=date(2024, 11, 30), prefix='LAST MONTH')
+            add_transactions(test_user2, other_user_category.id, [-777.00], prefix='OTHER USER')
+            db.session.add(Budget(category_id=groceries.id, month=12, year=2024, budgeted_amount=100.00, user_id=test_user))
+            db.session.add(Budget(category_id=dining.id, month=12, year=2024, budgeted_amount=50.00, user_id=test_user))
+            db.session.commit()
+
+            dashboard = build_dashboard(test_user, 2024, 12)
+
+            assert dashboard['category_totals'] == {'Groceries': -130.00, 'Dining': -30.00, 'Uncategorized': 1995.00}
+            assert dashboard['transaction_count'] == 6
+            assert dashboard['total_income'] == 2020.00
+            assert dashboard['total_expenses'] == 185.00
+            assert dashboard['net_amount'] == 1835.00
+            assert dashboard['top_spending_categories'] == [('Groceries', 150.00), ('Dining', 30.00), ('Uncategorized', 5.00)]
+            assert dashboard['expense_chart_data']['labels'] == ['Groceries', 'Dining', 'Uncategorized']
+            assert dashboard['budget_data']['Groceries']['spent'] == 130.00
+            assert dashboard['budget_data']['Groceries']['over_budget'] is True
+            assert dashboard['budget_data']['Dining']['remaining'] == 20.00
+            assert dashboard['budget_summary']['total_budgeted'] == 150.00
+            assert dashboard['budget_summary']['total_spent'] == 160.00
+
+    def test_empty_month(self, app, test_user):
+        """Test a month without transactions or budgets."""
+        with app.app_context():
+            dashboard = build_dashboard(test_user, 2024, 12)
+
+            assert dashboard['category_totals'] == {}
+            assert dashboard['total_income'] == 0
+            assert dashboard['top_spending_categories'] == []
+            assert dashboard['budget_summary']['overall_percentage'] == 0
+
+    def test_query_count_independent_of_transactions(self, app, test_user, test_category, query_counter):
+        """Test that the dashboard runs two queries however many transactions exist."""
+        with app.app_context():
+            add_transactions(test_user, test_category, [-1.00] * 5, prefix='FEW')
+            db.session.commit()
+            with query_counter() as few:
+                build_dashboard(test_user, 2024, 12)
+
+            add_transactions(test_user, test_category, [-1.00] * 200, prefix='MANY')
+            db.session.commit()
+            with query_counter() as many:
+                dashboard = build_dashboard(test_user, 2024, 12)
+
+            assert few.count == many.count == 2
+            assert dashboard['category_totals']['Test Category'] == -205.00
+
+    def test_home_page_renders_dashboard(self, app, auth_client, test_user, test_category):
+        """Test that the home page shows the aggregated numbers."""
+        with app.app_context():
+            add_transactions(test_user, test_category, [-42.50, 1000.00], prefix='HOME')
+            db.session.commit()
+
+        response = auth_client.get('/2024/12')
+
+        assert response.status_code == 200
+        assert b'42.50' in response.data
+        assert b'1000.00' in response.data
+
+
+class TestDashboardCache:
+    """Test caching of the home page dashboard and its invalidation."""
+
+    def test_repeat_visit_served_from_cache(self, app, auth_client, test_user, test_category, query_counter):
+        """Test that a second visit skips the dashboard queries."""
+        with query_counter() as first:
+            auth_client.get('/2024/12')
+        with query_counter() as second:
+            response = auth_client.get('/2024/12')
+
+        assert response.status_code == 200
+        assert second.count < first.count
+
+    def test_writes_through_routes_invalidate(self, app, auth_client, test_user, test_category):
+        """Test that transaction, budget and category changes show up immediately."""
+        auth_client.get('/2024/12')
+
+        auth_client.post('/add-transaction', data={
+            'date': '2024-12-01', 'description': 'CACHED SPEND', 'amount': '-42.50',
+            'account_source': 'Test Account', 'category_id': test_category
+        })
+        assert b'42.50' in auth_client.get('/2024/12').data
+
+        auth_client.post('/api/budgets', json={
+            'category_id': test_category, 'month': 12, 'year': 2024, 'budgeted_amount': 987.00
+        })
+        assert b'987.00' in auth_client.get('/2024/12').data
+
+        auth_client.post('/api/categories', json={'name': 'Brand New Category'})
+        assert b'Brand New Category' in auth_client.get('/2024/12').data
+
+    def test_invalidation_is_per_user(self):
+        """Test that invalidating one user keeps other users' entries."""
+        cache = LRUBackend()
+        cache.set(1, '2024-12', {'user': 1})
+        cache.set(2, '2024-12', {'user': 2})
+
+        cache.invalidate_user(1)
+
+        assert cache.get(1, '2024-12') is None
+        assert cache.get(2, '2024-12') == {'user': 2}
+
+    def test_lru_evicts_least_recently_used_and_expires(self):
+        """Test LRU eviction and TTL expiry."""
+        cache = LRUBackend(max_entries=2)
+        cache.set(1, 'a', 'A')
+        cache.set(1, 'b', 'B')
+        cache.get(1, 'a')
+        cache.set(1, 'c', 'C')
+
+        assert cache.get(1, 'b') is None
+        assert cache.get(1, 'a') == 'A'
+
+        expired = LRUBackend(ttl=-1)
+        expired.set(1, 'a', 'A')
+        assert expired.get(1, 'a') is None
+
+    def test_sqlite_backend_shared_between_workers(self, tmp_path):
+        """Test that two backends on one file (two workers) see each other's writes and invalidations."""
+        path = str(tmp_path / 'cache' / 'dashboard_cache.db')
+        worker1, worker2 = SQLiteBackend(path), SQLiteBackend(path)
+
+        worker1.set(1, '2024-12', {'top_spending_categories': [('Groceries', 10.0)]})
+        assert worker2.get(1, '2024-12') == {'top_spending_categories': [['Groceries', 10.0]]}
+
+        worker2.invalidate_user(1)
+        assert worker1.get(1, '2024-12') is None
+
+    @pytest.mark.parametrize('backend', ['lru', 'sqlite'])
+    def test_late_set_after_invalidation_is_never_read(self, tmp_path, backend):
+        """Test that a dashboard built before a write and stored after its invalidation is not served."""
+        cache = LRUBackend() if backend == 'lru' else SQLiteBackend(str(tmp_path / 'dashboard_cache.db'))
+        generation = cache.generation(1)
+
+        cache.invalidate_user(1)
+        cache.set(1, dashboard_cache_key(2024, 12, generation), {'stale': True})
+
+        assert cache.get(1, dashboard_cache_key(2024, 12, cache.generation(1))) is None
+
+    @pytest.mark.parametrize('backend', ['lru', 'sqlite'])
+    def test_generations_are_never_reused(self, tmp_path, backend):
+        """Test that invalidating and clearing always move users to unused generations."""
+        cache = LRUBackend() if backend == 'lru' else SQLiteBackend(str(tmp_path / 'dashboard_cache.db'))
+        before = cache.generation(1)
+
+        cache.invalidate_user(1)
+        invalidated = cache.generation(1)
+        cache.clear()
+
+        assert len({before, invalidated, cache.generation(1)}) == 3
+        # Users never invalidated move on too
+        assert cache.generation(2) == cache.generation(1) != before
+
+    def test_lru_refused_with_several_workers(self, app, monkeypatch):
+        """Test that the per-process backend is not used when gunicorn runs several workers."""
+        monkeypatch.setenv('WEB_CONCURRENCY', '4')
+        app.config['DASHBOARD_CACHE'] = 'lru'
+
+        with pytest.raises(ValueError):
+            init_dashboard_cache(app)
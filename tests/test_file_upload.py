@@ -4,6 +4,7 @@ Tests for file upload functionality
 import pytest
 import io
 import json
+import models
 from models import Transaction, Category, Rule, User
 from extensions import db
 
@@ -92,6 +93,42 @@ class TestCSVFileUpload:
             final_count = Transaction.query.filter_by(user_id=test_user).count()
             assert final_count == initial_count
 
+    def test_upload_skips_duplicates_within_same_file(self, app, auth_client, test_user):
+        """Test that a row repeated inside one file is only inserted once."""
+        csv_content = """Date,Description,Debit,Credit,Balance
+2024-12-01,REPEATED ROW,-50.00,,1000.00
+2024-12-01,REPEATED ROW,-50.00,,950.00
+2024-12-02,OTHER ROW,-10.00,,940.00
+"""
+        csv_file = io.BytesIO(csv_content.encode('utf-8'))
+        response = auth_client.post('/upload', data={
+            'file': (csv_file, 'repeated.csv')
+        }, follow_redirects=True)
+
+        assert response.status_code == 200
+        assert b'Successfully processed 2 new transactions. Skipped 1 duplicate transactions.' in response.data
+        with app.app_context():
+            assert Transaction.query.filter_by(user_id=test_user, description='REPEATED ROW').count() == 1
+
+    def test_upload_without_on_conflict_support(self, app, auth_client, test_user, monkeypatch):
+        """Test that duplicates are skipped on databases without INSERT ... ON CONFLICT."""
+        monkeypatch.setattr(models, 'ON_CONFLICT_DIALECTS', ())
+        csv_content = """Date,Description,Debit,Credit,Balance
+2024-12-01,REPEATED ROW,-50.00,,1000.00
+2024-12-01,REPEATED ROW,-50.00,,950.00
+2024-12-02,OTHER ROW,-10.00,,940.00
+"""
+
+        first = auth_client.post('/upload', data={'file': (io.BytesIO(csv_content.encode('utf-8')), 'first.csv')},
+                                 follow_redirects=True)
+        second = auth_client.post('/upload', data={'file': (io.BytesIO(csv_content.encode('utf-8')), 'second.csv')},
+                                  follow_redirects=True)
+
+        assert b'Successfully processed 2 new transactions. Skipped 1 duplicate transactions.' in first.data
+        assert b'Skipped 3 duplicate transactions.' in second.data
+        with app.app_context():
+            assert Transaction.query.filter_by(user_id=test_user).count() == 2
+
     def test_upload_malformed_csv_handles_errors(self, auth_client):
         """Test that malformed CSV is handled gracefully."""
         malformed_csv = """Date,Description,Amount
@@ -317,4 +354,290 @@ class TestFileUploadIntegration:
         with app.app_context():
             transaction = Transaction.query.filter_by(description='WALMART SUPERCENTER').first()
             assert transaction is not None
-            assert transaction.category_id == category_id
\ No newline at end of file
+            assert transaction.category_id == category_id
+
+class TestImportRoundTrips:
+    """Test that statement imports do a bounded number of database round trips."""
+
+    def test_process_uploaded_file_round_trips_independent_of_rows(self, app, test_user, tmp_path):
+        """Test that categorizing parsed rows does not query once per row."""
+        from parser import process_uploaded_file
+
+        with app.app_context():
+            category = Category(name='Groceries', user_id=test_user)
+            db.session.add(category)
+            db.session.flush()
+            db.session.add(Rule(keyword_pattern='superstore', category_id=category.id))
+            db.session.commit()
+            category_id = category.id
+
+        lines = ["Date,Description,Debit,Credit,Balance"]
+        for i in range(200):
+            lines.append(f"2024-12-{i % 28 + 1:02d},SUPERSTORE #{i},-{i + 1}.00,,1000.00")
+        csv_file = tmp_path / "statement.csv"
+        csv_file.write_text("\n".join(lines) + "\n")
+
+        with app.app_context():
+            stats = {}
+            transactions = process_uploaded_file(str(csv_file), 'statement.csv', test_user, stats=stats)
+            assert len(transactions) == 200
+            assert all(t.category_id == category_id for t in transactions)
+            assert stats['parsed'] == 200
+            # The rules version check and the rules themselves
+            assert stats['db_round_trips'] <= 2
+
+    def test_save_transactions_uses_constant_statements(self, app, test_user, query_counter):
+        """Test that duplicate detection and insert do not scale with row count."""
+        from datetime import date
+        from importer import save_transactions
+
+        with app.app_context():
+            db.session.add(Transaction(date=date(2024, 12, 1), description='EXISTING',
+                                       amount=-5.0, account_source='TD', user_id=test_user))
+            db.session.commit()
+
+            rows = [
+                {'date': date(2024, 12, 1 + i % 28), 'description': f'ROW {i}',
+                 'amount': -float(i + 1), 'account_source': 'TD'}
+                for i in range(300)
+            ]
+            rows.append({'date': date(2024, 12, 1), 'description': 'EXISTING',
+                         'amount': -5.0, 'account_source': 'TD'})
+
+            with query_counter() as counter:
+                added_count, duplicate_count = save_transactions(rows, test_user)
+                db.session.commit()
+
+            assert (added_count, duplicate_count) == (300, 1)
+            assert counter.count <= 3
+            assert Transaction.query.filter_by(user_id=test_user).count() == 301
+
+    def test_import_statement_streams_in_batches(self, app, test_user, tmp_path):
+        """Test that the import pipeline parses lazily and inserts batch by batch."""
+        import inspect
+        from importer import import_statement
+        from parser import parse_statement
+
+        with app.app_context():
+            category = Category(name='Groceries', user_id=test_user)
+            db.session.add(category)
+            db.session.flush()
+            db.session.add(Rule(keyword_pattern='superstore', category_id=category.id))
+            db.session.commit()
+            category_id = category.id
+
+        lines = ["Date,Description,Debit,Credit,Balance"]
+        for i in range(95):
+            lines.append(f"2024-11-{i % 28 + 1:02d},SUPERSTORE #{i},-{i + 1}.00,,1000.00")
+        lines.append("2024-11-01,SUPERSTORE #0,-1.00,,1000.00")  # repeat of the first row
+        csv_file = tmp_path / "statement.csv"
+        csv_file.write_text("\n".join(lines) + "\n")
+
+        assert inspect.isgenerator(parse_statement(str(csv_file), 'statement.csv'))
+
+        with app.app_context():
+            stats = import_statement(str(csv_file), 'statement.csv', test_user, batch_size=10)
+            db.session.commit()
+
+            assert stats['parsed'] == 96
+            assert stats['added'] == 95
+            assert stats['duplicates'] == 1
+            # One rules version check and rule load plus one insert per batch of 10,
+            # then one rollup refresh (delete + insert) for the single month touched
+            assert stats['db_round_trips'] <= 2 + 10 + 2
+            assert Transaction.query.filter_by(user_id=test_user, category_id=category_id).count() == 95
+
+
+class TestStatementStreams:
+    """Test that statements are parsed from streams without temp files."""
+
+    AMEX_CSV = ("Date,Date Processed,Description,Cardmember,Amount\n"
+                "01 Dec. 2024,02 Dec. 2024,COFFEE SHOP,JANE DOE,4.50\n")
+
+    class NonSeekableStream(io.RawIOBase):
+        """Binary stream that can only be read forwards, like a socket."""
+
+        def __init__(self, data):
+            self._buffer = io.BytesIO(data)
+
+        def readable(self):
+            return True
+
+        def readinto(self, b):
+            chunk = self._buffer.read(len(b))
+            b[:len(chunk)] = chunk
+            return len(chunk)
+
+    def test_parse_from_binary_stream_detects_amex_header(self):
+        """Test that header sniffing rewinds the stream before parsing."""
+        from parser import parse_statement
+
+        stream = io.BytesIO(('﻿' + self.AMEX_CSV).encode('utf-8'))
+        rows = list(parse_statement(stream, 'upload.csv'))
+
+        assert len(rows) == 1
+        assert rows[0]['account_source'] == 'American Express'
+        assert rows[0]['amount'] == -4.50
+        assert not stream.closed
+
+    def test_parse_from_non_seekable_and_text_streams(self):
+        """Test that non-seekable and text sources are accepted."""
+        from parser import parse_statement
+
+        from_raw = list(parse_statement(self.NonSeekableStream(self.AMEX_CSV.encode('utf-8')), 'upload.csv'))
+        from_text = list(parse_statement(io.StringIO(self.AMEX_CSV), 'upload.csv'))
+
+        assert from_raw == from_text
+        assert from_raw[0]['description'] == 'COFFEE SHOP'
+
+    def test_upload_does_not_write_to_disk(self, app, auth_client, test_user, monkeypatch):
+        """Test that the upload route never saves the file."""
+        from werkzeug.datastructures import FileStorage
+
+        def fail_save(*args, **kwargs):
+            raise AssertionError('upload should be parsed from the request stream')
+        monkeypatch.setattr(FileStorage, 'save', fail_save)
+
+        csv_content = """Date,Description,Debit,Credit,Balance
+2024-12-01,STREAMED ROW,-25.50,,1000.00
+"""
+        response = auth_client.post('/upload', data={
+            'file': (io.BytesIO(csv_content.encode('utf-8')), 'accountactivity.csv')
+        })
+
+        assert response.status_code == 302
+        with app.app_context():
+            assert Transaction.query.filter_by(user_id=test_user, description='STREAMED ROW').count() == 1
+
+
+class TestStatementFormatDetection:
+    """Test the header-sniffing statement format registry."""
+
+    def test_td_credit_column_layout_detected_once_per_file(self):
+        """Test TD files with credits in column 4 and an empty column 3."""
+        from parser import parse_statement
+
+        csv_content = ("12/01/2024,GROCERY STORE,25.50,,,974.50\n"
+                       "12/02/2024,PAYROLL,,,2000.00,2974.50\n")
+        rows = list(parse_statement(io.StringIO(csv_content), 'td-cb-dec-accountactivity.csv'))
+
+        assert [row['amount'] for row in rows] == [-25.50, 2000.00]
+        assert all(row['account_source'] == 'TD Credit Card' for row in rows)
+
+    def test_account_source_uses_filename_words_not_substrings(self):
+        """Test that invoice.csv is not mistaken for a TD 'IN' account."""
+        from parser import detect_layout
+
+        sample = [['2024-12-01', 'COFFEE', '4.50', '', '100.00']]
+        assert detect_layout(sample, 'invoice.csv').account_source == 'Bank Account'
+        assert detect_layout(sample, 'td_in_dec.csv').account_source == 'TD Account IN'
+        assert detect_layout(sample, 'TD_Chequing_Dec.csv').account_source == 'TD Chequing'
+        assert detect_layout(sample, 'accountactivity.csv').account_source == 'TD Account'
+
+    def test_date_format_sniffed_from_sample(self):
+        """Test that day-first dates are recognised from the sampled rows."""
+        from datetime import date
+        from parser import parse_statement
+
+        csv_content = ("Date,Description,Debit,Credit,Balance\n"
+                       "01/12/2024,FIRST,10.00,,90.00\n"
+                       "25/12/2024,SECOND,10.00,,80.00\n")
+        rows = list(parse_statement(io.StringIO(csv_content), 'export.csv'))
+
+        assert [row['date'] for row in rows] == [date(2024, 12, 1), date(2024, 12, 25)]
+
+    def test_ambiguous_leading_dates_settled_by_later_rows(self):
+        """Test a day-first file whose first SAMPLE_ROWS rows all fall on days up to 12."""
+        from datetime import date, timedelta
+        from parser import SAMPLE_ROWS, parse_statement
+
+        days = [date(2024, 2, 1) + timedelta(days=i // 2) for i in range(56)]
+        assert all(day.day <= 12 for day in days[:SAMPLE_ROWS])
+        csv_content = ''.join(f"{day.strftime('%d/%m/%Y')},PURCHASE {i},10.00,,\n" for i, day in enumerate(days))
+
+        rows = list(parse_statement(io.StringIO(csv_content), 'export.csv'))
+
+        assert [row['date'] for row in rows] == days
+
+    def test_proven_date_format_preferred_over_count(self):
+        """Test that one unambiguous day-first date outweighs rows readable either way."""
+        from parser import DATE_FORMATS, _sniff_date_format
+
+        assert _sniff_date_format(['01/02/2024', '02/02/2024', '25/01/2024'], DATE_FORMATS) == '%d/%m/%Y'
+        assert _sniff_date_format(['01/02/2024', '02/02/2024']) == '%m/%d/%Y'
+
+    def test_rows_in_another_sampled_format_fall_back(self):
+        """Test that a row the chosen format rejects is tried with the other sampled formats."""
+        from datetime import date
+        from parser import DateParser
+
+        parse_date = DateParser(['2024-12-01', '2024-12-02', '12/25/2024'])
+
+        assert parse_date.date_format == '%Y-%m-%d'
+        assert parse_date('12/26/2024') == date(2024, 12, 26)
+        with pytest.raises(ValueError):
+            parse_date('not a date')
+
+    def test_unrecognised_file_yields_nothing(self):
+        """Test that files no detector recognises produce no rows."""
+        from parser import detect_layout, parse_statement
+
+        assert detect_layout([['This is not a CSV file']], 'notes.txt') is None
+        assert list(parse_statement(io.StringIO('This is not a CSV file\n'), 'notes.txt')) == []
+
+
+class TestStatementValueDecoding:
+    """Test the per-file date decoders and the amount normalizer."""
+
+    @pytest.mark.parametrize('date_format,date_str', [
+        ('%Y-%m-%d', '2024-12-01'),
+        ('%Y-%m-%d', '2024-1-5'),
+        ('%m/%d/%Y', '12/01/2024'),
+        ('%m/%d/%Y', '1/5/2024'),
+        ('%d/%m/%Y', '01/12/2024'),
+        ('%d %b %Y', '01 Dec 2024'),
+        ('%d %b %Y', '5 sep 2024'),
+        ('%d %B %Y', '01 December 2024'),
+    ])
+    def test_date_decoders_match_strptime(self, date_format, date_str):
+        """Test that fast decoders agree with strptime, including unpadded dates."""
+        from datetime import datetime
+        from parser import _date_parser
+
+        assert _date_parser(date_format)(date_str) == datetime.strptime(date_str, date_format).date()
+
+    @pytest.mark.parametrize('date_format,date_str', [
+        ('%m/%d/%Y', '13/01/2024'),
+        ('%Y-%m-%d', 'not-a-date'),
+        ('%d %b %Y', '01 Foo 2024'),
+    ])
+    def test_date_decoders_reject_invalid_dates(self, date_format, date_str):
+        """Test that invalid dates still raise ValueError so the row is skipped."""
+        from parser import _date_parser
+
+        with pytest.raises(ValueError):
+            _date_parser(date_format)(date_str)
+
+    def test_parse_amount(self):
+        """Test debit/credit normalization in a single pass."""
+        from parser import _parse_amount
+
+        assert _parse_amount('1,234.50', '') == -1234.50
+        assert _parse_amount('-25.50', None) == -25.50
+        assert _parse_amount(' $25.50 ', None) == -25.50
+        assert _parse_amount('', '"2,000.00"') == 2000.00
+        assert _parse_amount('', '-5.00') == 0.0
+        assert _parse_amount('abc', 'xyz') == 0.0
+        assert _parse_amount('', None) == 0.0
+
+    def test_amex_amount_with_symbol_and_sign(self):
+        """Test that Amex amounts keep their sign through the normalizer."""
+        from parser import parse_statement
+
+        csv_content = ("Date,Date Processed,Description,Cardmember,Amount\n"
+                       '01 Dec. 2024,02 Dec. 2024,COFFEE SHOP,JANE DOE,"$1,004.50"\n'
+                       '03 Dec. 2024,03 Dec. 2024,PAYMENT RECEIVED,JANE DOE,-$500.00\n'
+                       '04 Dec. 2024,04 Dec. 2024,BROKEN ROW,JANE DOE,n/a\n')
+        rows = list(parse_statement(io.StringIO(csv_content), 'amex.csv'))
+
+        assert [row['amount'] for row in rows] == [-1004.50, 500.00]
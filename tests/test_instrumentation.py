@@ -0,0 +1,106 @@
+"""
+Tests for per-request SQL instrumentation
+"""
+import logging
+from sqlalchemy import text
+from extensions import db
+from instrumentation import RequestQueryStats, parameter_shape, track_queries
+
+
+class TestRequestQueryStats:
+    """Test the per-request statement statistics."""
+
+    def test_keeps_only_the_slowest_statements(self):
+        """Test that count and total time cover all statements but only the slowest are kept."""
+        stats = RequestQueryStats()
+        for duration, statement in [(0.001, 'A'), (0.005, 'B'), (0.002, 'C'), (0.004, 'D'), (0.003, 'E')]:
+            stats.record(statement, duration)
+
+        assert stats.count == 5
+        assert round(stats.total_time, 6) == 0.015
+        assert [statement for _, statement in stats.slowest] == ['B', 'D', 'E']
+
+    def test_parameter_shape_hides_values(self):
+        """Test that parameter shapes describe types, not values."""
+        assert parameter_shape(('secret@example.com', 3)) == '(str, int)'
+        assert parameter_shape({'email': 'secret@example.com'}) == '{email: str}'
+        assert parameter_shape([(1, 2.5), (2, 3.5)], executemany=True) == '2 x (int, float)'
+
+
+class TestTrackQueries:
+    """Test counting the statements of a block with the engine-wide listeners."""
+
+    def test_counts_statements_outside_a_request(self, app):
+        """Test nested blocks, e.g. an import run from a CLI command."""
+        with app.app_context():
+            with track_queries() as outer:
+                db.session.execute(text('SELECT 1'))
+                with track_queries() as inner:
+                    db.session.execute(text('SELECT 2'))
+
+        assert (outer.count, inner.count) == (2, 1)
+        assert outer.total_time >= inner.total_time > 0
+
+    def test_adds_no_engine_listeners(self, app):
+        """Test that a block does not listen on the engine itself, unlike the tests' query_counter."""
+        with app.app_context():
+            listeners = len(db.engine.dispatch.before_cursor_execute)
+            with track_queries():
+                assert len(db.engine.dispatch.before_cursor_execute) == listeners
+                db.session.execute(text('SELECT 1'))
+
+    def test_import_reports_its_statements(self, auth_client, caplog):
+        """Test that the upload's import log line carries its round trips and database time."""
+        import io
+        caplog.set_level(logging.INFO)
+        csv_content = b"2024-12-01,COFFEE,4.50,,100.00\n"
+
+        auth_client.post('/upload', data={'file': (io.BytesIO(csv_content), 'export.csv')},
+                         content_type='multipart/form-data')
+
+        assert any('Imported export.csv: 1 parsed' in record.message and 'database round trips (' in record.message
+                   for record in caplog.records)
+
+
+class TestRequestInstrumentation:
+    """Test the Server-Timing header and request/slow-query logging."""
+
+    def test_server_timing_header(self, auth_client):
+        """Test that responses report statement count and database time."""
+        response = auth_client.get('/api/categories')
+
+        server_timing = response.headers['Server-Timing']
+        assert server_timing.startswith('db;dur=')
+        assert 'queries"' in server_timing
+        assert 'app;dur=' in server_timing
+
+    def test_structured_request_log(self, auth_client, caplog):
+        """Test the per-request key=value log line."""
+        with caplog.at_level(logging.INFO):
+            auth_client.get('/api/categories')
+
+        lines = [record.getMessage() for record in caplog.records if record.getMessage().startswith('request ')]
+        assert len(lines) == 1
+        assert 'endpoint=get_categories' in lines[0]
+        assert 'status=200' in lines[0]
+        assert 'queries=' in lines[0] and 'db_ms=' in lines[0]
+
+    def test_slow_query_logged_with_route_and_parameter_shape(self, app, auth_client, caplog):
+        """Test that statements over the threshold are logged without their values."""
+        app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+
+        with caplog.at_level(logging.WARNING):
+            auth_client.get('/api/budgets/2024/12')
+
+        slow = [record.getMessage() for record in caplog.records if record.getMessage().startswith('Slow query')]
+        assert any('endpoint=get_budgets' in line and 'FROM budgets' in line for line in slow)
+        assert all('params=' in line for line in slow)
+
+    def test_slow_query_log_can_be_disabled(self, app, auth_client, caplog):
+        """Test that a None threshold turns slow-query logging off."""
+        app.config['SLOW_QUERY_THRESHOLD_MS'] = None
+
+        with caplog.at_level(logging.WARNING):
+            auth_client.get('/api/categories')
+
+        assert not [record for record in caplog.records if record.getMessage().startswith('Slow query')]
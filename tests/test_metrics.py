@@ -0,0 +1,151 @@
+"""
+Tests for the Prometheus /metrics endpoint
+"""
+import io
+import json
+import os
+from metrics import EXITED_FILE, MetricsRegistry, LATENCY_BUCKETS, render_prometheus
+
+
+def scrape(app, client):
+    """GET /metrics the way Prometheus does, with the METRICS_TOKEN bearer token."""
+    app.config['METRICS_TOKEN'] = 'scrape-secret'
+    return client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).get_data(as_text=True)
+
+
+def other_worker_snapshot(requests):
+    return {
+        'counters': [['budgetly_http_requests_total', {'endpoint': 'home', 'method': 'GET', 'status': '200'}, requests]],
+        'histograms': [['budgetly_http_request_duration_seconds', {'endpoint': 'home', 'method': 'GET'},
+                        [requests] + [0] * len(LATENCY_BUCKETS) + [0.01]]],
+    }
+
+
+def metric_value(text, line_prefix):
+    """Returns the value of the first exposition line starting with line_prefix."""
+    for line in text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+class TestMetricsEndpoint:
+    """Test request and import metrics exported on /metrics."""
+
+    def test_request_counters_and_latency_histogram(self, auth_client):
+        """Test per-endpoint request counts and latency histograms."""
+        auth_client.get('/api/categories')
+        auth_client.get('/api/categories')
+        auth_client.get('/api/budgets/2024/13')
+
+        text = auth_client.get('/metrics').get_data(as_text=True)
+
+        assert '# TYPE budgetly_http_request_duration_seconds histogram' in text
+        assert metric_value(text, 'budgetly_http_requests_total{endpoint="get_categories",method="GET",status="200"}') == 2
+        assert metric_value(text, 'budgetly_http_request_duration_seconds_count{endpoint="get_categories",method="GET"}') == 2
+        assert metric_value(text, 'budgetly_http_request_duration_seconds_bucket{endpoint="get_categories",method="GET",le="+Inf"}') == 2
+
+    def test_unmatched_paths_share_one_series(self, app, client):
+        """Test that 404s are not labelled by path."""
+        client.get('/no-such-page-1')
+        client.get('/no-such-page-2')
+
+        text = scrape(app, client)
+
+        assert metric_value(text, 'budgetly_http_requests_total{endpoint="unmatched",method="GET",status="404"}') == 2
+        assert 'no-such-page' not in text
+
+    def test_import_counters(self, app, auth_client, test_user, test_category_with_rules):
+        """Test rows parsed, categorized, duplicates skipped and parse errors."""
+        csv_content = """Date,Description,Debit,Credit,Balance
+2024-12-01,SUPERSTORE #123,25.50,,1000.00
+2024-12-01,SUPERSTORE #123,25.50,,1000.00
+2024-12-02,UNKNOWN SHOP,10.00,,990.00
+not-a-date,BROKEN ROW,1.00,,989.00
+"""
+        auth_client.post('/upload', data={'file': (io.BytesIO(csv_content.encode('utf-8')), 'accountactivity.csv')})
+
+        text = auth_client.get('/metrics').get_data(as_text=True)
+
+        assert metric_value(text, 'budgetly_import_rows_parsed_total{format="debit_credit"}') == 3
+        assert metric_value(text, 'budgetly_import_rows_categorized_total') == 2
+        assert metric_value(text, 'budgetly_import_duplicates_skipped_total') == 1
+        assert metric_value(text, 'budgetly_import_parse_errors_total{format="debit_credit"}') == 1
+
+    def test_metrics_summed_across_worker_processes(self, app, client):
+        """Test that files written by other worker processes are aggregated."""
+        os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+        with open(os.path.join(app.config['METRICS_DIR'], 'metrics-999999.json'), 'w') as f:
+            json.dump(other_worker_snapshot(5), f)
+
+        text = scrape(app, client)
+
+        assert metric_value(text, 'budgetly_http_requests_total{endpoint="home",method="GET",status="200"}') == 5
+        assert metric_value(text, 'budgetly_http_request_duration_seconds_count{endpoint="home",method="GET"}') == 5
+
+    def test_requires_login_without_token(self, client):
+        """Test that without a METRICS_TOKEN anonymous requests are sent to the login page."""
+        assert client.get('/metrics').status_code == 302
+
+    def test_logged_in_users_can_read_without_token(self, auth_client):
+        """Test that without a METRICS_TOKEN logged-in users can read the metrics."""
+        assert auth_client.get('/metrics').status_code == 200
+
+    def test_requires_token_when_configured(self, app, client):
+        """Test that scrapers need the bearer token once METRICS_TOKEN is set."""
+        app.config['METRICS_TOKEN'] = 'scrape-secret'
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+
+
+class TestMetricsRegistry:
+    """Test the registry and the text exposition format."""
+
+    def test_histogram_buckets_are_cumulative(self, tmp_path):
+        """Test bucket placement, cumulative counts and sums."""
+        registry = MetricsRegistry()
+        for value in (0.001, 0.005, 0.3, 60.0):
+            registry.observe('budgetly_http_request_duration_seconds', value, endpoint='home', method='GET')
+
+        text = render_prometheus(*registry.collect(str(tmp_path)))
+
+        prefix = 'budgetly_http_request_duration_seconds'
+        assert metric_value(text, f'{prefix}_bucket{{endpoint="home",method="GET",le="0.005"}}') == 2
+        assert metric_value(text, f'{prefix}_bucket{{endpoint="home",method="GET",le="0.5"}}') == 3
+        assert metric_value(text, f'{prefix}_bucket{{endpoint="home",method="GET",le="+Inf"}}') == 4
+        assert metric_value(text, f'{prefix}_count{{endpoint="home",method="GET"}}') == 4
+        assert round(metric_value(text, f'{prefix}_sum{{endpoint="home",method="GET"}}'), 3) == 60.306
+
+    def test_label_values_are_escaped(self, tmp_path):
+        """Test escaping of quotes and backslashes in label values."""
+        registry = MetricsRegistry()
+        registry.inc('budgetly_import_rows_parsed_total', 3, format='a"b\\c')
+
+        text = render_prometheus(*registry.collect(str(tmp_path)))
+
+        assert 'budgetly_import_rows_parsed_total{format="a\\"b\\\\c"} 3' in text
+
+    def test_restarted_worker_with_reused_pid_keeps_old_counts(self, tmp_path):
+        """Test that a new process with an exited worker's pid writes its own file."""
+        first = MetricsRegistry()
+        first.inc('budgetly_import_duplicates_skipped_total', 2)
+        first.flush(str(tmp_path))
+
+        second = MetricsRegistry()  # Same pid, started later
+        second.inc('budgetly_import_duplicates_skipped_total', 3)
+        counters, _ = second.collect(str(tmp_path))
+
+        assert counters[('budgetly_import_duplicates_skipped_total', ())] == 5
+
+    def test_exited_worker_files_are_folded_together(self, tmp_path):
+        """Test that files of processes no longer running are merged once and removed."""
+        for name, requests in [('metrics-999998-1.json', 2), ('metrics-999999.json', 5)]:
+            with open(tmp_path / name, 'w') as f:
+                json.dump(other_worker_snapshot(requests), f)
+        registry = MetricsRegistry()
+
+        key = ('budgetly_http_requests_total', (('endpoint', 'home'), ('method', 'GET'), ('status', '200')))
+        assert registry.collect(str(tmp_path))[0][key] == 7
+        assert registry.collect(str(tmp_path))[0][key] == 7
+        assert {path.name for path in tmp_path.glob('metrics-*.json')} == {EXITED_FILE, registry._file_name}
@@ -0,0 +1,200 @@
+"""
+Tests for keyset pagination of the transactions page and /api/transactions/<year>/<month>
+"""
+import pytest
+from sqlalchemy.dialects import postgresql
+from datetime import date
+from models import Transaction, Category
+from extensions import db
+from pagination import SORT_COLUMNS, encode_cursor, keyset_query, transactions_page
+from tests.test_query_plans import query_plan
+
+
+def add_month_of_transactions(user_id):
+    """Adds 23 December 2024 transactions with many repeated sort values, a third of them uncategorized."""
+    groceries = Category(name='Groceries', user_id=user_id)
+    dining = Category(name='Dining', user_id=user_id)
+    db.session.add_all([groceries, dining])
+    db.session.flush()
+    for i in range(23):
+        db.session.add(Transaction(
+            date=date(2024, 12, 1 + i % 4),
+            description=f'SHOP {i % 5}',
+            amount=-10.00 * (i % 3) if i % 7 else 25.00,
+            account_source=['TD Chequing', 'Amex'][i % 2],
+            category_id=[groceries.id, dining.id, None][i % 3],
+            user_id=user_id
+        ))
+    # Another month and another user's data must never show up
+    db.session.add(Transaction(date=date(2024, 11, 30), description='NOVEMBER', amount=-1.00,
+                               account_source='Amex', user_id=user_id))
+    db.session.commit()
+
+
+def expected_order(user_id, sort_by, sort_order):
+    """The full month sorted in Python: sort value, then id, both in sort_order."""
+    transactions = Transaction.query.filter(
+        Transaction.user_id == user_id,
+        Transaction.date >= date(2024, 12, 1),
+        Transaction.date < date(2025, 1, 1)
+    ).all()
+
+    def sort_key(t):
+        value = (t.category.name if t.category else 'Uncategorized') if sort_by == 'category' else getattr(t, sort_by)
+        return (value, t.id)
+
+    return [t.id for t in sorted(transactions, key=sort_key, reverse=sort_order == 'desc')]
+
+
+class TestTransactionsPage:
+    """Test paging through a month with transactions_page."""
+
+    @pytest.mark.parametrize('sort_order', ['asc', 'desc'])
+    @pytest.mark.parametrize('sort_by', SORT_COLUMNS)
+    def test_pages_cover_month_in_sort_order(self, app, test_user, sort_by, sort_order):
+        """Test that consecutive pages return every row once, in the same order as one sorted query."""
+        with app.app_context():
+            add_month_of_transactions(test_user)
+
+            seen, cursor = [], None
+            while True:
+                page, cursor = transactions_page(
+                    test_user, date(2024, 12, 1), date(2025, 1, 1), sort_by, sort_order, cursor=cursor, limit=5
+                )
+                assert len(page) <= 5
+                seen.extend(t.id for t in page)
+                if cursor is None:
+                    break
+
+            assert seen == expected_order(test_user, sort_by, sort_order)
+            assert len(seen) == len(set(seen)) == 23
+
+    def test_last_full_page_has_no_cursor(self, app, test_user):
+        """Test that a page ending exactly at the last row does not point to an empty page."""
+        with app.app_context():
+            add_month_of_transactions(test_user)
+
+            page, cursor = transactions_page(test_user, date(2024, 12, 1), date(2025, 1, 1), limit=23)
+
+            assert len(page) == 23
+            assert cursor is None
+
+    def test_pages_use_no_offset(self, app, test_user):
+        """Test that later pages seek past the cursor instead of skipping rows with OFFSET."""
+        with app.app_context():
+            cursor = encode_cursor('date', 'desc', '2024-12-02', 5)
+            query = keyset_query(test_user, date(2024, 12, 1), date(2025, 1, 1), cursor=cursor).limit(101)
+
+            # SQLite always renders LIMIT with an OFFSET, so check the Postgres SQL
+            sql = str(query.statement.compile(dialect=postgresql.dialect()))
+
+            assert '(transactions.date, transactions.id) < (' in sql
+            assert 'OFFSET' not in sql
+
+    def test_cursor_from_another_sort_is_rejected(self, app, test_user):
+        """Test that a cursor is only valid for the sort it was issued for."""
+        with app.app_context():
+            cursor = encode_cursor('amount', 'asc', -10.0, 1)
+
+            with pytest.raises(ValueError):
+                transactions_page(test_user, date(2024, 12, 1), date(2025, 1, 1), 'amount', 'desc', cursor=cursor)
+
+    @pytest.mark.parametrize('sort_by, sort_value, transaction_id', [
+        ('date', 5, 1),
+        ('date', 'yesterday', 1),
+        ('date', None, 1),
+        ('amount', '-10.0', 1),
+        ('amount', True, 1),
+        ('description', {'a': 1}, 1),
+        ('account_source', ['Amex'], 1),
+        ('category', 'Dining', True),
+    ])
+    def test_malformed_cursor_values_are_rejected(self, app, test_user, sort_by, sort_value, transaction_id):
+        """Test that a cursor's value must have its sort column's type."""
+        with app.app_context():
+            cursor = encode_cursor(sort_by, 'desc', sort_value, transaction_id)
+
+            with pytest.raises(ValueError):
+                transactions_page(test_user, date(2024, 12, 1), date(2025, 1, 1), sort_by, 'desc', cursor=cursor)
+
+    @pytest.mark.parametrize('sort_by', ['date', 'description', 'amount', 'account_source'])
+    def test_column_sorts_are_served_by_index_order(self, app, test_user, sort_by):
+        """Test that a keyset page reads rows in index order, without sorting the month."""
+        with app.app_context():
+            sort_value = {'date': '2024-12-02', 'amount': -10.0}.get(sort_by, 'x')
+            cursor = encode_cursor(sort_by, 'desc', sort_value, 5)
+            query = keyset_query(test_user, date(2024, 12, 1), date(2025, 1, 1), sort_by, 'desc', cursor).limit(101)
+
+            plan = query_plan(query)
+
+            assert any(f'ix_transactions_user_id_{sort_by}_id' in line for line in plan), plan
+            assert not any('TEMP B-TREE' in line for line in plan), plan
+
+
+class TestTransactionsPageApi:
+    """Test the JSON endpoint the transactions page loads further pages from."""
+
+    def test_api_pages_through_month(self, app, auth_client, test_user):
+        """Test following next_cursor until the last page."""
+        with app.app_context():
+            add_month_of_transactions(test_user)
+            expected = expected_order(test_user, 'category', 'asc')
+
+        seen, cursor = [], ''
+        while True:
+            response = auth_client.get(
+                f'/api/transactions/2024/12?sort_by=category&sort_order=asc&limit=10&cursor={cursor}'
+            )
+            assert response.status_code == 200
+            data = response.get_json()
+            seen.extend(data['transactions'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+
+        assert [t['id'] for t in seen] == expected
+        assert {t['category_name'] for t in seen} == {'Dining', 'Groceries', 'Uncategorized'}
+        assert 'NOVEMBER' not in {t['description'] for t in seen}
+
+    def test_api_only_returns_own_transactions(self, app, auth_client, test_user, test_user2):
+        """Test that another user's transactions are not listed."""
+        with app.app_context():
+            add_month_of_transactions(test_user2)
+
+        response = auth_client.get('/api/transactions/2024/12')
+
+        assert response.status_code == 200
+        assert response.get_json() == {'transactions': [], 'next_cursor': None}
+
+    @pytest.mark.parametrize('query_string', [
+        'sort_by=fingerprint',
+        'sort_order=sideways',
+        'limit=0',
+        'limit=100000',
+        'cursor=not-a-cursor',
+        f"cursor={encode_cursor('date', 'desc', 5, 1)}",
+    ])
+    def test_api_rejects_invalid_parameters(self, auth_client, query_string):
+        """Test that bad sort, limit or cursor parameters return 400."""
+        response = auth_client.get(f'/api/transactions/2024/12?{query_string}')
+
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+
+    def test_api_requires_login(self, client):
+        """Test that the endpoint requires authentication."""
+        response = client.get('/api/transactions/2024/12')
+
+        assert response.status_code == 302
+
+    def test_page_renders_first_page_with_load_more(self, app, auth_client, test_user):
+        """Test that the transactions page renders one page and offers the rest."""
+        app.config['TRANSACTIONS_PAGE_SIZE'] = 10
+        with app.app_context():
+            add_month_of_transactions(test_user)
+
+        response = auth_client.get('/transactions/2024/12')
+
+        assert response.status_code == 200
+        assert response.data.count(b'<td>SHOP ') == 10
+        assert b'id="loadMoreTransactions"' in response.data
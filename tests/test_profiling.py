@@ -0,0 +1,78 @@
+"""
+Tests for the on-demand request profiler
+"""
+import io
+import os
+import pstats
+import pytest
+
+
+@pytest.fixture
+def profiling_app(app, tmp_path):
+    """The app with profiling enabled and profiles written to a temporary directory."""
+    app.config.update({
+        'PROFILING_ENABLED': True,
+        'PROFILING_TOKEN': 'admin-secret',
+        'PROFILES_DIR': str(tmp_path),
+        'PROFILING_MIN_INTERVAL': 0,
+    })
+    return app
+
+
+def profile_files(app):
+    return sorted(os.listdir(app.config['PROFILES_DIR']))
+
+
+class TestRequestProfiler:
+    """Test that requests are profiled only when asked to and allowed."""
+
+    def test_upload_profiled_end_to_end(self, profiling_app, auth_client):
+        """Test that a profiled upload covers the import pipeline."""
+        csv_content = "Date,Description,Debit,Credit,Balance\n2024-12-01,PROFILED ROW,25.50,,1000.00\n"
+        response = auth_client.post('/upload', headers={'X-Profile-Token': 'admin-secret'}, data={
+            'file': (io.BytesIO(csv_content.encode('utf-8')), 'accountactivity.csv')
+        })
+
+        files = profile_files(profiling_app)
+        assert response.status_code == 302
+        assert response.headers['X-Profile-File'] == files[0]
+        assert '-POST-upload-' in files[0] and files[0].endswith('.prof')
+        functions = {name for _, _, name in pstats.Stats(os.path.join(profiling_app.config['PROFILES_DIR'], files[0])).stats}
+        assert {'upload_file', 'import_statement', 'parse_statement', 'assign_categories'} <= functions
+
+    def test_query_parameter_trigger(self, profiling_app, auth_client):
+        """Test the ?profile= query parameter."""
+        response = auth_client.get('/api/categories?profile=admin-secret')
+
+        assert response.status_code == 200
+        assert 'X-Profile-File' in response.headers
+        assert len(profile_files(profiling_app)) == 1
+
+    def test_not_profiled_without_valid_token(self, profiling_app, auth_client):
+        """Test that missing or wrong tokens do not profile."""
+        auth_client.get('/api/categories')
+        response = auth_client.get('/api/categories', headers={'X-Profile-Token': 'guess'})
+
+        assert 'X-Profile-File' not in response.headers
+        assert profile_files(profiling_app) == []
+
+    def test_not_profiled_when_disabled(self, profiling_app, auth_client):
+        """Test that the token does nothing while profiling is disabled."""
+        profiling_app.config['PROFILING_ENABLED'] = False
+
+        response = auth_client.get('/api/categories', headers={'X-Profile-Token': 'admin-secret'})
+
+        assert 'X-Profile-File' not in response.headers
+        assert profile_files(profiling_app) == []
+
+    def test_rate_limited(self, profiling_app, auth_client):
+        """Test that only one request per interval is profiled."""
+        profiling_app.config['PROFILING_MIN_INTERVAL'] = 3600
+
+        first = auth_client.get('/api/categories', headers={'X-Profile-Token': 'admin-secret'})
+        second = auth_client.get('/api/categories', headers={'X-Profile-Token': 'admin-secret'})
+
+        assert 'X-Profile-File' in first.headers
+        assert 'X-Profile-File' not in second.headers
+        assert second.status_code == 200
+        assert len(profile_files(profiling_app)) == 1
@@ -0,0 +1,114 @@
+"""
+Tests that hot endpoints issue a constant number of SQL statements (no N+1 lazy loads)
+"""
+import warnings
+from datetime import date
+from sqlalchemy.exc import LegacyAPIWarning
+from models import Transaction, Category, Rule, Budget
+from extensions import db
+from dashboard_cache import invalidate_dashboard_cache
+
+
+def add_user_data(user_id, count, prefix):
+    """Adds count categories, each with two rules, a budget and two transactions in December 2024."""
+    for i in range(count):
+        category = Category(name=f'{prefix} Category {i}', user_id=user_id)
+        db.session.add(category)
+        db.session.flush()
+        db.session.add_all([
+            Rule(keyword_pattern=f'{prefix.lower()} shop {i}', category_id=category.id),
+            Rule(keyword_pattern=f'{prefix.lower()} store {i}', category_id=category.id),
+            Budget(category_id=category.id, month=12, year=2024, budgeted_amount=100.00, user_id=user_id),
+        ])
+        for j in range(2):
+            db.session.add(Transaction(
+                date=date(2024, 12, 1 + j), description=f'{prefix} SHOP {i}-{j}', amount=-10.00 - j,
+                account_source='Test Account', category_id=category.id, user_id=user_id
+            ))
+    db.session.commit()
+    # Written outside the app's routes, so drop the cached dashboard explicitly
+    invalidate_dashboard_cache(user_id)
+
+
+class TestConstantQueryCounts:
+    """Test that query counts do not grow with categories, rules or transactions."""
+
+    ENDPOINTS = [
+        '/2024/12',
+        '/transactions/2024/12',
+        '/transactions/2024/12?sort_by=category&sort_order=asc',
+        '/api/transactions/2024/12?sort_by=amount&sort_order=asc',
+        '/api/categories',
+        '/api/budgets/2024/12',
+    ]
+
+    def count_queries(self, auth_client, query_counter):
+        counts = {}
+        for endpoint in self.ENDPOINTS:
+            with query_counter() as counter:
+                response = auth_client.get(endpoint)
+            assert response.status_code == 200, endpoint
+            counts[endpoint] = counter.count
+        return counts
+
+    def test_query_count_independent_of_data_size(self, app, auth_client, test_user, query_counter):
+        """Test each endpoint with 2 and then 20 categories."""
+        with app.app_context():
+            add_user_data(test_user, 2, 'Small')
+        small = self.count_queries(auth_client, query_counter)
+
+        with app.app_context():
+            add_user_data(test_user, 18, 'Large')
+        large = self.count_queries(auth_client, query_counter)
+
+        assert small == large
+
+    def test_rule_endpoints_independent_of_rules(self, app, auth_client, test_user, query_counter):
+        """Test updating and deleting a rule with 2 and then 20 rules in its category."""
+        def rule_counts(prefix, rule_count):
+            with app.app_context():
+                category = Category(name=f'{prefix} Rules', user_id=test_user)
+                db.session.add(category)
+                db.session.flush()
+                rules = [Rule(keyword_pattern=f'{prefix.lower()} shop {i}', category_id=category.id)
+                         for i in range(rule_count)]
+                db.session.add_all(rules)
+                db.session.commit()
+                updated_id, deleted_id = rules[0].id, rules[1].id
+
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', LegacyAPIWarning)
+                with query_counter() as updated:
+                    response = auth_client.put(f'/api/rules/{updated_id}',
+                                               json={'keyword_pattern': f'{prefix.lower()} market'})
+                assert len(response.get_json()['rules']) == rule_count
+                with query_counter() as deleted:
+                    response = auth_client.delete(f'/api/rules/{deleted_id}')
+                assert len(response.get_json()['rules']) == rule_count - 1
+            return updated.count, deleted.count
+
+        assert rule_counts('Small', 2) == rule_counts('Large', 20)
+
+    def test_transactions_page_shows_eager_loaded_categories(self, app, auth_client, test_user):
+        """Test that category names still render after eager loading."""
+        with app.app_context():
+            add_user_data(test_user, 1, 'Eager')
+            db.session.add(Transaction(
+                date=date(2024, 12, 5), description='NO CATEGORY', amount=-1.00,
+                account_source='Test Account', user_id=test_user
+            ))
+            db.session.commit()
+
+        response = auth_client.get('/transactions/2024/12?sort_by=category&sort_order=desc')
+
+        assert b'Eager Category 0' in response.data
+        assert b'Uncategorized' in response.data
+
+    def test_categories_api_includes_rules(self, app, auth_client, test_user):
+        """Test that selectin-loaded rules are serialized with their category."""
+        with app.app_context():
+            add_user_data(test_user, 3, 'Api')
+
+        categories = auth_client.get('/api/categories').get_json()
+
+        assert [len(category['rules']) for category in categories] == [2, 2, 2]
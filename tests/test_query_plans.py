@@ -0,0 +1,105 @@
+"""
+Tests that the hot queries are served by indexes rather than full table scans
+"""
+from datetime import date
+from sqlalchemy import extract, func
+from models import Transaction, Category, Rule, Budget
+from extensions import db
+from budgets import effective_budgets_query
+from rule_preview import candidates_query
+
+
+def query_plan(query):
+    """Returns the EXPLAIN QUERY PLAN detail lines for an ORM query on SQLite."""
+    statement = getattr(query, 'statement', query)
+    compiled = statement.compile(dialect=db.engine.dialect)
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', parameters).all()
+    return [row[-1] for row in rows]
+
+
+def assert_uses_index(plan, table, index):
+    """Asserts the plan searches table through index and never scans the table."""
+    assert any(line.startswith(f'SEARCH {table} USING') and index in line for line in plan), plan
+    assert not any(line == f'SCAN {table}' for line in plan), plan
+
+
+class TestHotQueryPlans:
+    """Test that each hot query shape uses an index (SQLite EXPLAIN QUERY PLAN)."""
+
+    def test_monthly_transactions_use_user_date_index(self, app, test_user):
+        """Test the home()/transactions() month filter."""
+        with app.app_context():
+            query = Transaction.query.filter(
+                Transaction.date >= date(2024, 12, 1),
+                Transaction.date < date(2025, 1, 1),
+                Transaction.user_id == test_user
+            ).order_by(Transaction.date.desc())
+
+            plan = query_plan(query)
+
+            assert_uses_index(plan, 'transactions', 'ix_transactions_user_id_date_id (user_id=? AND date>? AND date<?)')
+
+    def test_available_months_use_user_date_index(self, app, test_user):
+        """Test the per-user month listing."""
+        with app.app_context():
+            query = db.session.query(
+                extract('year', Transaction.date),
+                extract('month', Transaction.date),
+                func.count(Transaction.id)
+            ).filter(Transaction.user_id == test_user).group_by(
+                extract('year', Transaction.date),
+                extract('month', Transaction.date)
+            )
+
+            assert_uses_index(query_plan(query), 'transactions', 'ix_transactions_user_id_date_id (user_id=?)')
+
+    def test_effective_budgets_use_category_year_month_index(self, app, test_user):
+        """Test the get_budgets()/home() lookup of the latest budget at or before a month."""
+        with app.app_context():
+            query = effective_budgets_query(test_user, 2024, 12)
+
+            plan = query_plan(query)
+
+            assert_uses_index(plan, 'categories', 'ix_categories_user_id (user_id=?)')
+            assert any('ix_budgets_category_id_year_month (category_id=?' in line for line in plan), plan
+            assert not any('TEMP B-TREE' in line for line in plan), plan
+
+    def test_rule_matcher_query_uses_category_indexes(self, app, test_user):
+        """Test the categorizer's rules-to-categories join for one user."""
+        with app.app_context():
+            query = db.session.query(Rule.keyword_pattern, Category.id, Category.name).join(Category).filter(
+                Category.user_id == test_user
+            ).order_by(func.length(Rule.keyword_pattern).desc(), Rule.id)
+
+            plan = query_plan(query)
+
+            assert_uses_index(plan, 'categories', 'ix_categories_user_id (user_id=?)')
+            assert_uses_index(plan, 'rules', 'ix_rules_category_id (category_id=?)')
+
+    def test_category_transactions_use_category_index(self, app, test_user, test_category):
+        """Test looking up transactions by category (category delete, per-category views)."""
+        with app.app_context():
+            query = Transaction.query.filter_by(category_id=test_category)
+
+            assert_uses_index(query_plan(query), 'transactions', 'ix_transactions_category_id (category_id=?)')
+
+    def test_duplicate_check_uses_fingerprint_index(self, app, test_user):
+        """Test the duplicate check, which looks up the fingerprint unique index."""
+        with app.app_context():
+            query = Transaction.query.filter(Transaction.fingerprint == 'abc', Transaction.id != 1)
+
+            plan = query_plan(query)
+
+            assert_uses_index(plan, 'transactions', '(fingerprint=?)')
+
+    def test_rule_preview_uses_trigram_index(self, app, test_user):
+        """Test the rule preview substring lookup through the FTS5 trigram table."""
+        with app.app_context():
+            query, index = candidates_query(test_user, 'tim*hortons')
+
+            plan = query_plan(query)
+
+            assert index == 'fts5'
+            assert any(line.startswith('SCAN transactions_description_fts VIRTUAL TABLE INDEX') for line in plan), plan
+            assert not any(line == 'SCAN transactions' for line in plan), plan
@@ -0,0 +1,212 @@
+"""
+Tests for re-applying rules to existing transactions when rules change
+"""
+import pytest
+from datetime import date
+from models import Transaction, Category, Rule
+from extensions import db
+from categorizer import invalidate_rule_cache
+from recategorize import count_candidates, recategorize_matching, wait_for_background_jobs
+from rollup import verify_monthly_totals
+
+
+@pytest.fixture
+def rule_data(app, test_user, test_user2):
+    """Coffee and Groceries categories with one rule each, and uncategorized transactions."""
+    with app.app_context():
+        coffee = Category(name='Coffee', user_id=test_user)
+        groceries = Category(name='Groceries', user_id=test_user)
+        other_category = Category(name='Theirs', user_id=test_user2)
+        db.session.add_all([coffee, groceries, other_category])
+        db.session.flush()
+        db.session.add_all([
+            Rule(keyword_pattern='starbucks', category_id=coffee.id),
+            Rule(keyword_pattern='superstore', category_id=groceries.id),
+            Rule(keyword_pattern='tim', category_id=other_category.id),
+        ])
+        db.session.add_all([
+            Transaction(date=date(2024, 11, 20), description='STARBUCKS #12', amount=-5.25,
+                        account_source='Amex', category_id=coffee.id, user_id=test_user),
+            Transaction(date=date(2024, 12, 1), description='TIM HORTONS #88', amount=-3.10,
+                        account_source='Amex', user_id=test_user),
+            Transaction(date=date(2024, 12, 2), description='Tim Hortons #88', amount=-2.40,
+                        account_source='Amex', user_id=test_user),
+            Transaction(date=date(2024, 12, 3), description='TIM HORTONS #91', amount=-4.00,
+                        account_source='Amex', category_id=groceries.id, category_manual=True, user_id=test_user),
+            Transaction(date=date(2024, 12, 4), description='SUPERSTORE #1', amount=-60.00,
+                        account_source='Amex', category_id=groceries.id, user_id=test_user),
+            Transaction(date=date(2024, 12, 5), description='TIM HORTONS #88', amount=-1.00,
+                        account_source='Amex', user_id=test_user2),
+        ])
+        db.session.commit()
+        return {'coffee': coffee.id, 'groceries': groceries.id, 'other_category': other_category.id}
+
+
+def categories_by_description(user_id):
+    return sorted((t.description, t.category_id) for t in Transaction.query.filter_by(user_id=user_id))
+
+
+class TestRuleChangesRecategorize:
+    """Test that adding, editing and deleting rules re-categorizes matching transactions."""
+
+    def test_add_rule_recategorizes_matching_transactions(self, app, auth_client, test_user, test_user2, rule_data):
+        """Test that a new rule applies to stored transactions, case-insensitively, for this user only."""
+        response = auth_client.post(f"/api/categories/{rule_data['coffee']}/rules",
+                                    json={'keyword_pattern': 'tim hortons'})
+
+        assert response.status_code == 201
+        assert response.get_json()['recategorization'] == {'status': 'done', 'candidates': 3, 'updated': 3}
+        with app.app_context():
+            assert categories_by_description(test_user) == [
+                ('STARBUCKS #12', rule_data['coffee']),
+                ('SUPERSTORE #1', rule_data['groceries']),
+                ('TIM HORTONS #88', rule_data['coffee']),
+                ('TIM HORTONS #91', rule_data['coffee']),
+                ('Tim Hortons #88', rule_data['coffee']),
+            ]
+            assert categories_by_description(test_user2) == [('TIM HORTONS #88', None)]
+            assert verify_monthly_totals(test_user) == []
+
+    def test_preserve_manual_keeps_hand_picked_categories(self, app, auth_client, test_user, rule_data):
+        """Test the opt-in flag that leaves categories set by hand alone."""
+        response = auth_client.post(f"/api/categories/{rule_data['coffee']}/rules",
+                                    json={'keyword_pattern': 'tim*#', 'preserve_manual': True})
+
+        assert response.get_json()['recategorization']['updated'] == 2
+        with app.app_context():
+            manual = Transaction.query.filter_by(description='TIM HORTONS #91').one()
+            assert manual.category_id == rule_data['groceries']
+            assert manual.category_manual is True
+
+    def test_hand_edits_are_marked_manual(self, app, auth_client, test_user, rule_data):
+        """Test that categories picked in the edit form or in bulk survive a preserving rule change."""
+        with app.app_context():
+            edited, bulk = Transaction.query.filter_by(user_id=test_user, category_id=None).order_by(Transaction.id)
+            edited_id, bulk_id = edited.id, bulk.id
+        auth_client.post(f'/edit-transaction/{edited_id}', data={
+            'date': '2024-12-01', 'description': 'TIM HORTONS #88', 'amount': '-3.10',
+            'account_source': 'Amex', 'category_id': str(rule_data['groceries'])
+        })
+        auth_client.post('/api/transactions/bulk', json={
+            'action': 'recategorize', 'ids': [bulk_id], 'category_id': rule_data['groceries']
+        })
+
+        response = auth_client.post(f"/api/categories/{rule_data['coffee']}/rules",
+                                    json={'keyword_pattern': 'tim', 'preserve_manual': True})
+
+        assert response.get_json()['recategorization']['updated'] == 0
+        with app.app_context():
+            assert Transaction.query.filter_by(category_id=rule_data['groceries']).count() == 4
+
+    def test_longest_rule_still_wins(self, app, auth_client, test_user, rule_data):
+        """Test that a shorter new rule does not override a longer existing one."""
+        auth_client.post(f"/api/categories/{rule_data['groceries']}/rules", json={'keyword_pattern': 'store'})
+
+        with app.app_context():
+            assert Transaction.query.filter_by(description='SUPERSTORE #1').one().category_id == rule_data['groceries']
+
+    def test_update_rule_recategorizes_old_and_new_matches(self, app, auth_client, test_user, rule_data):
+        """Test that editing a rule moves its new matches in and its old matches out."""
+        with app.app_context():
+            rule_id = Rule.query.filter_by(keyword_pattern='starbucks').one().id
+
+        response = auth_client.put(f'/api/rules/{rule_id}', json={'keyword_pattern': 'tim hortons #88'})
+
+        assert response.get_json()['recategorization'] == {'status': 'done', 'candidates': 3, 'updated': 3}
+        with app.app_context():
+            assert categories_by_description(test_user)[0] == ('STARBUCKS #12', None)
+            assert Transaction.query.filter_by(category_id=rule_data['coffee']).count() == 2
+
+    def test_delete_rule_uncategorizes_its_matches(self, app, auth_client, test_user, rule_data):
+        """Test that deleting a rule re-runs the remaining rules on its matches."""
+        with app.app_context():
+            rule_id = Rule.query.filter_by(keyword_pattern='superstore').one().id
+
+        response = auth_client.delete(f'/api/rules/{rule_id}')
+
+        assert response.get_json()['recategorization']['updated'] == 1
+        with app.app_context():
+            assert Transaction.query.filter_by(description='SUPERSTORE #1').one().category_id is None
+            assert verify_monthly_totals(test_user) == []
+
+    def test_rule_change_invalidates_dashboard(self, app, auth_client, test_user, rule_data):
+        """Test that the dashboard shows the re-categorized spending."""
+        assert b'Coffee' not in auth_client.get('/2024/12').data.split(b'budget-planning')[0]
+
+        auth_client.post(f"/api/categories/{rule_data['coffee']}/rules", json={'keyword_pattern': 'tim'})
+
+        assert b'Coffee' in auth_client.get('/2024/12').data.split(b'budget-planning')[0]
+
+    def test_large_changes_run_in_background(self, app, auth_client, test_user, rule_data):
+        """Test that more candidates than RECATEGORIZE_SYNC_LIMIT are queued."""
+        app.config['RECATEGORIZE_SYNC_LIMIT'] = 2
+
+        response = auth_client.post(f"/api/categories/{rule_data['coffee']}/rules",
+                                    json={'keyword_pattern': 'tim hortons'})
+        wait_for_background_jobs(timeout=10)
+
+        assert response.get_json()['recategorization'] == {'status': 'queued', 'candidates': 3}
+        with app.app_context():
+            assert Transaction.query.filter_by(user_id=test_user, category_id=rule_data['coffee']).count() == 4
+            assert verify_monthly_totals(test_user) == []
+
+
+class TestRecategorizeMatching:
+    """Test the re-categorization engine directly."""
+
+    def test_only_changed_transactions_are_updated(self, app, test_user, rule_data):
+        """Test that transactions already in the right category are not rewritten."""
+        with app.app_context():
+            assert recategorize_matching(test_user, ['superstore', 'starbucks']) == 0
+
+    def test_like_wildcards_in_descriptions_are_literal(self, app, test_user, rule_data):
+        """Test that % and _ in a keyword only match themselves."""
+        with app.app_context():
+            db.session.add(Transaction(date=date(2024, 12, 9), description='50% OFF_SALE', amount=-9.0,
+                                       account_source='Amex', user_id=test_user))
+            db.session.commit()
+
+            assert count_candidates(test_user, ['50% off_']) == 1
+            assert count_candidates(test_user, ['5_%']) == 0
+
+    def test_non_ascii_keywords_match_any_case(self, app, auth_client, test_user, rule_data):
+        """Test keywords whose case SQLite's lower() and LIKE do not fold, e.g. CAFÉ."""
+        with app.app_context():
+            db.session.add_all([
+                Transaction(date=date(2024, 12, 9), description='CAFÉ DEPOT #3', amount=-7.0,
+                            account_source='Amex', user_id=test_user),
+                Transaction(date=date(2024, 12, 10), description='Café Olé', amount=-3.0,
+                            account_source='Amex', user_id=test_user),
+            ])
+            db.session.commit()
+            assert count_candidates(test_user, ['café']) == 2
+
+        response = auth_client.post(f"/api/categories/{rule_data['coffee']}/rules", json={'keyword_pattern': 'CAFÉ'})
+
+        assert response.get_json()['recategorization'] == {'status': 'done', 'candidates': 2, 'updated': 2}
+        with app.app_context():
+            assert Transaction.query.filter_by(user_id=test_user, category_id=rule_data['coffee']).count() == 3
+
+    def test_statements_do_not_grow_with_transactions(self, app, test_user, rule_data, query_counter):
+        """Test that 500 matching transactions take as many statements as 3."""
+        def recategorize(keyword):
+            with app.app_context():
+                db.session.add(Rule(keyword_pattern=keyword, category_id=rule_data['coffee']))
+                db.session.commit()
+                invalidate_rule_cache(test_user)
+                with query_counter() as counter:
+                    updated = recategorize_matching(test_user, [keyword])
+                db.session.commit()
+            return updated, counter.count
+
+        with app.app_context():
+            db.session.add_all([Transaction(date=date(2024, 12, 1 + i % 28), description=f'PAYMENT {i}',
+                                            amount=-1.0 - i, account_source='Amex', user_id=test_user)
+                                for i in range(500)])
+            db.session.commit()
+
+        few, few_count = recategorize('tim hortons')
+        many, many_count = recategorize('payment')
+
+        assert (few, many) == (3, 500)
+        assert few_count == many_count
@@ -0,0 +1,159 @@
+"""
+Tests for the incrementally maintained monthly_category_totals rollup
+"""
+import io
+from datetime import date
+from models import Transaction, Category, MonthlyCategoryTotal
+from extensions import db
+from rollup import rebuild_monthly_totals, verify_monthly_totals
+
+
+def rollup_rows(user_id):
+    """Rollup rows of a user as {(year, month, category_id): (income_sum, expense_sum, txn_count)}."""
+    return {
+        (row.year, row.month, row.category_id): (row.income_sum, row.expense_sum, row.txn_count)
+        for row in MonthlyCategoryTotal.query.filter_by(user_id=user_id).all()
+    }
+
+
+def add_transaction(user_id, category_id, day, amount, description):
+    transaction = Transaction(date=day, description=description, amount=amount,
+                              account_source='Test Account', category_id=category_id, user_id=user_id)
+    db.session.add(transaction)
+    db.session.commit()
+    return transaction.id
+
+
+class TestRollupMaintenance:
+    """Test that the rollup follows every kind of transaction change."""
+
+    def test_orm_insert_update_delete(self, app, test_user, test_category):
+        """Test session adds, edits (including moving months/categories) and deletes."""
+        with app.app_context():
+            first = add_transaction(test_user, test_category, date(2024, 12, 1), -40.00, 'FIRST')
+            add_transaction(test_user, None, date(2024, 12, 2), 100.00, 'SECOND')
+            assert rollup_rows(test_user) == {
+                (2024, 12, test_category): (0.0, -40.00, 1),
+                (2024, 12, None): (100.00, 0.0, 1),
+            }
+
+            transaction = db.session.get(Transaction, first)
+            transaction.date = date(2024, 11, 30)
+            transaction.category_id = None
+            transaction.amount = -45.00
+            db.session.commit()
+            assert rollup_rows(test_user) == {
+                (2024, 11, None): (0.0, -45.00, 1),
+                (2024, 12, None): (100.00, 0.0, 1),
+            }
+
+            db.session.delete(db.session.get(Transaction, first))
+            db.session.commit()
+            assert rollup_rows(test_user) == {(2024, 12, None): (100.00, 0.0, 1)}
+            assert verify_monthly_totals(test_user) == []
+
+    def test_routes_keep_rollup_in_sync(self, app, auth_client, test_user, test_category):
+        """Test upload, manual add, edit, delete and delete-all through the routes."""
+        csv_content = """Date,Description,Debit,Credit,Balance
+2024-11-15,UPLOADED ONE,25.50,,1000.00
+2024-12-01,UPLOADED TWO,10.00,,990.00
+2024-12-03,PAYCHECK,,2000.00,2990.00
+"""
+        auth_client.post('/upload', data={'file': (io.BytesIO(csv_content.encode('utf-8')), 'accountactivity.csv')})
+        auth_client.post('/add-transaction', data={
+            'date': '2024-12-05', 'description': 'MANUAL', 'amount': '-4.50',
+            'account_source': 'Test Account', 'category_id': test_category
+        })
+        with app.app_context():
+            assert rollup_rows(test_user) == {
+                (2024, 11, None): (0.0, -25.50, 1),
+                (2024, 12, None): (2000.00, -10.00, 2),
+                (2024, 12, test_category): (0.0, -4.50, 1),
+            }
+            manual_id = Transaction.query.filter_by(description='MANUAL').first().id
+
+        auth_client.post(f'/edit-transaction/{manual_id}', data={
+            'date': '2024-12-05', 'description': 'MANUAL', 'amount': '-6.00',
+            'account_source': 'Test Account', 'category_id': test_category
+        })
+        with app.app_context():
+            assert rollup_rows(test_user)[(2024, 12, test_category)] == (0.0, -6.00, 1)
+
+        auth_client.post(f'/delete-transaction/{manual_id}')
+        with app.app_context():
+            assert (2024, 12, test_category) not in rollup_rows(test_user)
+            assert verify_monthly_totals(test_user) == []
+
+        auth_client.post('/delete-all-transactions')
+        with app.app_context():
+            assert rollup_rows(test_user) == {}
+
+    def test_deleting_category_moves_totals_to_uncategorized(self, app, auth_client, test_user, test_category):
+        """Test that transactions left without a category are rolled up as uncategorized."""
+        with app.app_context():
+            add_transaction(test_user, test_category, date(2024, 12, 1), -40.00, 'ORPHANED')
+
+        auth_client.delete(f'/api/categories/{test_category}')
+
+        with app.app_context():
+            assert rollup_rows(test_user) == {(2024, 12, None): (0.0, -40.00, 1)}
+
+
+class TestRollupReaders:
+    """Test the endpoints that read from the rollup."""
+
+    def test_available_months_and_fixed_costs(self, app, auth_client, test_user):
+        """Test available months counts and the fixed vs variable split."""
+        with app.app_context():
+            rent = Category(name='Rent', user_id=test_user, is_fixed_cost=True)
+            food = Category(name='Food', user_id=test_user)
+            db.session.add_all([rent, food])
+            db.session.commit()
+            add_transaction(test_user, rent.id, date(2024, 12, 1), -1000.00, 'RENT')
+            add_transaction(test_user, food.id, date(2024, 12, 2), -150.00, 'FOOD')
+            add_transaction(test_user, food.id, date(2024, 12, 3), 20.00, 'FOOD REFUND')
+            add_transaction(test_user, None, date(2024, 11, 3), -50.00, 'NOVEMBER')
+
+        months = auth_client.get('/api/available-months').get_json()
+        analysis = auth_client.get('/api/fixed-costs-analysis/2024/12').get_json()
+
+        assert [(m['year'], m['month'], m['transaction_count']) for m in months] == [(2024, 12, 3), (2024, 11, 1)]
+        assert analysis['fixed_costs']['categories'] == {'Rent': 1000.00}
+        assert analysis['variable_costs']['categories'] == {'Food': 150.00}
+        assert analysis['total_expenses'] == 1150.00
+
+
+class TestRollupCommands:
+    """Test the rebuild and verify CLI commands."""
+
+    def test_verify_detects_drift_and_rebuild_fixes_it(self, app, runner, test_user, test_category):
+        """Test that verify fails on a corrupted rollup until it is rebuilt."""
+        with app.app_context():
+            add_transaction(test_user, test_category, date(2024, 12, 1), -40.00, 'DRIFT')
+            MonthlyCategoryTotal.query.filter_by(user_id=test_user).update({'txn_count': 7})
+            db.session.commit()
+
+        result = runner.invoke(args=['verify-monthly-totals'])
+        assert result.exit_code == 1
+        assert 'expected (0.0, -40.0, 1), found (0.0, -40.0, 7)' in result.output
+
+        result = runner.invoke(args=['rebuild-monthly-totals', '--user-id', str(test_user)])
+        assert result.exit_code == 0
+
+        result = runner.invoke(args=['verify-monthly-totals'])
+        assert result.exit_code == 0
+        assert 'match' in result.output
+
+    def test_rebuild_all_users(self, app, test_user, test_user2):
+        """Test a full rebuild from raw transactions."""
+        with app.app_context():
+            add_transaction(test_user, None, date(2024, 12, 1), -1.00, 'USER ONE')
+            add_transaction(test_user2, None, date(2024, 12, 1), -2.00, 'USER TWO')
+            MonthlyCategoryTotal.query.delete()
+            db.session.commit()
+
+            rebuild_monthly_totals()
+            db.session.commit()
+
+            assert rollup_rows(test_user) == {(2024, 12, None): (0.0, -1.00, 1)}
+            assert rollup_rows(test_user2) == {(2024, 12, None): (0.0, -2.00, 1)}
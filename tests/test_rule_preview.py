@@ -0,0 +1,185 @@
+"""
+Tests for GET /api/rules/preview and the description search index behind it
+"""
+import pytest
+from datetime import date
+from sqlalchemy import text
+from models import Transaction, Category
+from extensions import db
+from categorizer import RuleMatcher
+import models
+from rule_preview import _index_cache, description_search_index, fts_match_query, preview_rule
+
+
+@pytest.fixture
+def preview_data(app, test_user, test_user2):
+    """Coffee purchases, partly categorized, plus another user's matching transaction."""
+    with app.app_context():
+        coffee = Category(name='Coffee', user_id=test_user)
+        dining = Category(name='Dining', user_id=test_user)
+        db.session.add_all([coffee, dining])
+        db.session.flush()
+        db.session.add_all([
+            Transaction(date=date(2024, 11, 1), description='TIM HORTONS #88', amount=-3.10,
+                        account_source='Amex', category_id=coffee.id, user_id=test_user),
+            Transaction(date=date(2024, 12, 1), description='TIM HORTONS #88', amount=-2.40,
+                        account_source='Amex', user_id=test_user),
+            Transaction(date=date(2024, 12, 2), description='Tim Hortons Toronto', amount=-4.00,
+                        account_source='Amex', category_id=dining.id, user_id=test_user),
+            Transaction(date=date(2024, 12, 3), description='TIMBERLAND OUTLET', amount=-90.00,
+                        account_source='Amex', user_id=test_user),
+            Transaction(date=date(2024, 12, 4), description='STARBUCKS 100% ARABICA', amount=-5.00,
+                        account_source='Amex', user_id=test_user),
+            Transaction(date=date(2024, 12, 5), description='TIM HORTONS #12', amount=-1.00,
+                        account_source='Amex', user_id=test_user2),
+        ])
+        db.session.commit()
+        return {'coffee': coffee.id, 'dining': dining.id}
+
+
+def preview(auth_client, keyword_pattern, **params):
+    return auth_client.get('/api/rules/preview', query_string={'keyword_pattern': keyword_pattern, **params})
+
+
+class TestRulePreviewApi:
+    """Test previewing which transactions a keyword would match."""
+
+    def test_counts_matches_per_current_category(self, auth_client, preview_data):
+        """Test case-insensitive matches of this user's transactions, grouped by category."""
+        response = preview(auth_client, 'tim hortons')
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['match_count'] == 3
+        assert data['index'] == 'fts5'
+        assert data['categories'] == [
+            {'category_id': preview_data['coffee'], 'category': 'Coffee', 'count': 1},
+            {'category_id': preview_data['dining'], 'category': 'Dining', 'count': 1},
+            {'category_id': None, 'category': 'Uncategorized', 'count': 1},
+        ]
+
+    def test_sample_is_most_recent_first(self, auth_client, preview_data):
+        """Test the sample rows and their current categories."""
+        response = preview(auth_client, 'TIM HORTONS', limit=2)
+
+        sample = response.get_json()['sample']
+        assert [(t['date'], t['description'], t['category']) for t in sample] == [
+            ('2024-12-02', 'Tim Hortons Toronto', 'Dining'),
+            ('2024-12-01', 'TIM HORTONS #88', 'Uncategorized'),
+        ]
+
+    def test_wildcards_match_like_rules(self, auth_client, preview_data):
+        """Test * wildcards, which must match in order."""
+        ordered = preview(auth_client, 'tim*toronto').get_json()
+        reversed_order = preview(auth_client, 'toronto*tim').get_json()
+
+        assert ordered['match_count'] == 1
+        assert reversed_order['match_count'] == 0
+
+    def test_short_keywords_fall_back_to_a_scan(self, auth_client, preview_data):
+        """Test keywords without a three character run, which the trigram index cannot look up."""
+        data = preview(auth_client, 'ti*#').get_json()
+
+        assert data['index'] == 'scan'
+        assert data['match_count'] == 2
+
+    def test_like_and_fts_syntax_is_literal(self, auth_client, preview_data):
+        """Test that %, _ and double quotes in a keyword only match themselves."""
+        assert preview(auth_client, '100%').get_json()['match_count'] == 1
+        assert preview(auth_client, '1_0').get_json()['match_count'] == 0
+        assert preview(auth_client, '"tim" OR "star"').get_json()['match_count'] == 0
+
+    @pytest.mark.parametrize('query_string', ['', 'keyword_pattern=%20', 'keyword_pattern=tim&limit=101'])
+    def test_invalid_parameters_return_400(self, auth_client, query_string):
+        """Test that a keyword is required and the sample size is bounded."""
+        response = auth_client.get(f'/api/rules/preview?{query_string}')
+
+        assert response.status_code == 400
+
+    def test_requires_login(self, client):
+        """Test that the endpoint requires authentication."""
+        assert client.get('/api/rules/preview?keyword_pattern=tim').status_code == 302
+
+
+class TestDescriptionSearchIndex:
+    """Test the FTS5 trigram index kept in sync with transactions."""
+
+    def test_index_follows_updates_and_deletes(self, app, test_user, preview_data):
+        """Test that edited and deleted descriptions are reflected in previews."""
+        with app.app_context():
+            renamed = Transaction.query.filter_by(description='TIMBERLAND OUTLET').one()
+            renamed.description = 'TIM HORTONS KIOSK'
+            Transaction.query.filter_by(description='Tim Hortons Toronto').delete()
+            db.session.commit()
+
+            assert preview_rule(test_user, 'timberland')['match_count'] == 0
+            assert preview_rule(test_user, 'tim hortons')['match_count'] == 3
+
+    def test_scan_fallback_without_index(self, app, test_user, preview_data):
+        """Test that previews still work on a database without the search index."""
+        with app.app_context():
+            db.session.execute(text('DROP TABLE transactions_description_fts'))
+            db.session.commit()
+            _index_cache.clear()
+
+            data = preview_rule(test_user, 'tim hortons')
+
+            assert description_search_index() is None
+            assert (data['index'], data['match_count']) == ('scan', 3)
+            _index_cache.clear()
+
+    def test_schema_without_fts_support(self, app, monkeypatch):
+        """Test that the schema is created and previews scan when the SQLite build cannot create the index."""
+        unsupported = [models.SQLITE_DESCRIPTION_SEARCH_DDL[0].replace("'trigram'", "'no_such_tokenizer'")]
+        monkeypatch.setattr(models, 'SQLITE_DESCRIPTION_SEARCH_DDL', unsupported + models.SQLITE_DESCRIPTION_SEARCH_DDL[1:])
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            _index_cache.clear()
+            user = models.User(email='nofts@example.com')
+            user.set_password('testpassword123')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Transaction(date=date(2024, 12, 1), description='TIM HORTONS #88', amount=-3.10,
+                                       account_source='Amex', user_id=user.id))
+            db.session.commit()
+
+            search_objects = db.session.execute(text(
+                "SELECT name FROM sqlite_master WHERE name LIKE 'transactions_description_fts%'"
+            )).all()
+            data = preview_rule(user.id, 'tim hortons')
+
+            assert search_objects == []
+            assert (data['index'], data['match_count']) == ('scan', 1)
+            _index_cache.clear()
+
+    def test_preview_agrees_with_rule_matcher(self, app, test_user, preview_data):
+        """Test that the preview counts exactly the transactions the rule would match."""
+        keywords = ['tim', 'hortons #', 'tim*#8', 'o*o*o', 'arabica', '100% a', 'x*y*z', '#']
+        with app.app_context():
+            descriptions = [t.description for t in Transaction.query.filter_by(user_id=test_user)]
+            for keyword in keywords:
+                matcher = RuleMatcher([(keyword, 1, 'Rule')])
+                expected = sum(1 for description in descriptions if matcher.match(description))
+                assert preview_rule(test_user, keyword)['match_count'] == expected, keyword
+
+    def test_fts_match_query_quotes_parts(self):
+        """Test the MATCH query built from a keyword's literal parts."""
+        assert fts_match_query('Tim*"Hortons"') == '"tim" AND """hortons"""'
+        assert fts_match_query('ab*cd') is None
+
+    def test_statements_do_not_depend_on_matches(self, app, test_user, preview_data, query_counter):
+        """Test that a preview takes the same statements for 2 or 300 matches."""
+        with app.app_context():
+            db.session.add_all([Transaction(date=date(2024, 10, 1 + i % 28), description=f'PAYMENT {i}',
+                                            amount=-1.0 - i, account_source='Amex', user_id=test_user)
+                                for i in range(300)])
+            db.session.commit()
+            description_search_index()
+
+            with query_counter() as few:
+                preview_rule(test_user, 'tim hortons #')
+            with query_counter() as many:
+                preview_rule(test_user, 'payment')
+
+        assert few.count == many.count == 2
@@ -3,6 +3,7 @@ Tests for transaction management functionality
 """
 import pytest
 from datetime import date
+import models
 from models import Transaction, Category, User
 from extensions import db
 
@@ -81,6 +82,19 @@ class TestTransactionCRUD:
         assert response.status_code == 200
         assert b'same description, amount, and date already exists' in response.data
 
+    def test_add_duplicate_without_on_conflict_support(self, app, auth_client, test_user, monkeypatch):
+        """Test duplicate detection on databases without INSERT ... ON CONFLICT."""
+        monkeypatch.setattr(models, 'ON_CONFLICT_DIALECTS', ())
+        form = {'date': '2024-12-01', 'description': 'Plain Insert', 'amount': '-25.00', 'account_source': 'Cash'}
+
+        first = auth_client.post('/add-transaction', data=form)
+        second = auth_client.post('/add-transaction', data=form)
+
+        assert first.status_code == 302
+        assert b'same description, amount, and date already exists' in second.data
+        with app.app_context():
+            assert Transaction.query.filter_by(description='Plain Insert').count() == 1
+
     def test_edit_transaction_page_loads(self, app, auth_client, test_user, test_category):
         """Test that edit transaction page loads."""
         # Create a transaction first
@@ -134,6 +148,31 @@ class TestTransactionCRUD:
             assert updated_transaction.description == 'Updated Description'
             assert updated_transaction.amount == -35.00
 
+    def test_edit_transaction_into_duplicate_rejected(self, app, auth_client, test_user, test_category):
+        """Test that editing a transaction to match another one is rejected."""
+        with app.app_context():
+            for description in ('First Transaction', 'Second Transaction'):
+                db.session.add(Transaction(
+                    date=date(2024, 12, 1),
+                    description=description,
+                    amount=-30.00,
+                    account_source='Test Account',
+                    user_id=test_user
+                ))
+            db.session.commit()
+            second_id = Transaction.query.filter_by(description='Second Transaction').first().id
+
+        response = auth_client.post(f'/edit-transaction/{second_id}', data={
+            'date': '2024-12-01',
+            'description': 'First Transaction',
+            'amount': '-30.00',
+            'account_source': 'Test Account'
+        })
+
+        assert response.status_code == 302
+        with app.app_context():
+            assert db.session.get(Transaction, second_id).description == 'Second Transaction'
+
     def test_delete_transaction_success(self, app, auth_client, test_user, test_category):
         """Test successful transaction deletion."""
         # Create a transaction first
@@ -344,4 +383,85 @@ class TestTransactionMonthNavigation:
         response = auth_client.get('/transactions/2024/11')
         assert response.status_code == 200
         assert b'November Transaction' in response.data
-        assert b'December Transaction' not in response.data
\ No newline at end of file
+        assert b'December Transaction' not in response.data
+
+class TestTransactionFingerprint:
+    """Test the stored duplicate-detection fingerprint."""
+
+    def test_fingerprint_set_on_insert_and_refreshed_on_update(self, app, test_user):
+        """Test that the ORM keeps the fingerprint in sync with the row."""
+        from models import transaction_fingerprint
+
+        with app.app_context():
+            transaction = Transaction(date=date(2024, 12, 1), description='Coffee  Shop',
+                                      amount=-4.5, account_source='TD', user_id=test_user)
+            db.session.add(transaction)
+            db.session.commit()
+            assert transaction.fingerprint == transaction_fingerprint(
+                test_user, date(2024, 12, 1), 'coffee shop', -4.50, 'TD')
+
+            transaction.amount = -5.0
+            db.session.commit()
+            assert transaction.fingerprint == transaction_fingerprint(
+                test_user, date(2024, 12, 1), 'Coffee Shop', -5.0, 'TD')
+
+    def test_database_rejects_duplicate_fingerprint(self, app, test_user):
+        """Test that the unique index blocks duplicates that bypass the app checks."""
+        from sqlalchemy.exc import IntegrityError
+
+        with app.app_context():
+            for _ in range(2):
+                db.session.add(Transaction(date=date(2024, 12, 1), description='Rent',
+                                           amount=-1000.0, account_source='TD', user_id=test_user))
+            with pytest.raises(IntegrityError):
+                db.session.commit()
+            db.session.rollback()
+
+    def test_same_transaction_allowed_for_different_users(self, app, test_user, test_user2):
+        """Test that fingerprints are scoped per user."""
+        with app.app_context():
+            for user_id in (test_user, test_user2):
+                db.session.add(Transaction(date=date(2024, 12, 1), description='Rent',
+                                           amount=-1000.0, account_source='TD', user_id=user_id))
+            db.session.commit()
+            assert Transaction.query.filter_by(description='Rent').count() == 2
+
+    def test_historical_duplicates_survive_unrelated_updates(self, app, auth_client, test_user, test_category):
+        """Test rows given an id-salted fingerprint by the a5a66cc6c9d4 migration."""
+        import hashlib
+        from models import transaction_fingerprint
+
+        with app.app_context():
+            original, duplicate = (Transaction(date=date(2024, 12, 1), description=f'Rent {i}', amount=-1000.0,
+                                               account_source='TD', category_id=test_category, user_id=test_user)
+                                   for i in range(2))
+            db.session.add_all([original, duplicate])
+            db.session.commit()
+            # Recreate the migrated state: the same row twice, the copy salted with its id
+            fingerprint = transaction_fingerprint(test_user, date(2024, 12, 1), 'Rent', -1000.0, 'TD')
+            salted = hashlib.sha256(f"{fingerprint}:{duplicate.id}".encode('utf-8')).hexdigest()
+            Transaction.query.filter_by(id=original.id).update(
+                {'description': 'Rent', 'fingerprint': fingerprint})
+            Transaction.query.filter_by(id=duplicate.id).update(
+                {'description': 'Rent', 'fingerprint': salted})
+            db.session.commit()
+            duplicate_id = duplicate.id
+
+        other = auth_client.post('/api/categories', json={'name': 'Housing'}).get_json()['id']
+        response = auth_client.post(f'/edit-transaction/{duplicate_id}', data={
+            'date': '2024-12-01',
+            'description': 'Rent',
+            'amount': '-1000.00',
+            'account_source': 'TD',
+            'category_id': str(other)
+        }, follow_redirects=True)
+
+        assert b'already exists' not in response.data
+        with app.app_context():
+            edited = db.session.get(Transaction, duplicate_id)
+            assert (edited.category_id, edited.fingerprint) == (other, salted)
+
+        assert auth_client.delete(f'/api/categories/{test_category}').status_code == 200
+        assert auth_client.delete(f'/api/categories/{other}').status_code == 200
+        with app.app_context():
+            assert Transaction.query.filter_by(user_id=test_user, category_id=None).count() == 2
@@ -0,0 +1,190 @@
+"""
+Tests for GET /api/transactions: filters, field selection and the columnar encoding
+"""
+import pytest
+from datetime import date
+from models import Transaction, Category
+from extensions import db
+from transaction_payloads import columnar_payload, parse_fields, rows_payload
+
+
+@pytest.fixture
+def api_data(app, test_user, test_user2):
+    """Two categories and five transactions over two months, plus another user's transaction."""
+    with app.app_context():
+        groceries = Category(name='Groceries', user_id=test_user)
+        dining = Category(name='Dining', user_id=test_user)
+        db.session.add_all([groceries, dining])
+        db.session.flush()
+        db.session.add_all([
+            Transaction(date=date(2024, 11, 28), description='SUPERSTORE', amount=-80.25,
+                        account_source='TD Chequing', category_id=groceries.id, user_id=test_user),
+            Transaction(date=date(2024, 12, 2), description='PIZZA', amount=-22.50,
+                        account_source='Amex', category_id=dining.id, user_id=test_user),
+            Transaction(date=date(2024, 12, 3), description='SUPERSTORE', amount=-45.10,
+                        account_source='Amex', category_id=groceries.id, user_id=test_user),
+            Transaction(date=date(2024, 12, 15), description='PAYROLL', amount=2500.00,
+                        account_source='TD Chequing', user_id=test_user),
+            Transaction(date=date(2024, 12, 20), description='SUSHI', amount=-35.00,
+                        account_source='Amex', category_id=dining.id, user_id=test_user),
+            Transaction(date=date(2024, 12, 5), description='OTHER USER', amount=-1.00,
+                        account_source='Amex', user_id=test_user2),
+        ])
+        db.session.commit()
+        return {'groceries': groceries.id, 'dining': dining.id}
+
+
+class TestTransactionsApiFilters:
+    """Test filtering /api/transactions."""
+
+    def test_returns_own_transactions_oldest_first(self, auth_client, api_data):
+        """Test the default row encoding with every field."""
+        response = auth_client.get('/api/transactions')
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['count'] == 5
+        assert [t['description'] for t in data['transactions']] == [
+            'SUPERSTORE', 'PIZZA', 'SUPERSTORE', 'PAYROLL', 'SUSHI'
+        ]
+        assert data['transactions'][1] == {
+            'id': data['transactions'][1]['id'], 'date': '2024-12-02', 'description': 'PIZZA', 'amount': -22.5,
+            'account_source': 'Amex', 'category_id': api_data['dining'], 'category': 'Dining'
+        }
+
+    def test_date_range_excludes_end_date(self, auth_client, api_data):
+        """Test start_date (inclusive) and end_date (exclusive)."""
+        response = auth_client.get('/api/transactions?start_date=2024-12-01&end_date=2024-12-15&fields=description')
+
+        assert response.get_json()['transactions'] == [{'description': 'PIZZA'}, {'description': 'SUPERSTORE'}]
+
+    def test_account_filter_is_repeatable(self, auth_client, api_data):
+        """Test filtering by one or several accounts."""
+        amex = auth_client.get('/api/transactions?account=Amex').get_json()
+        both = auth_client.get('/api/transactions?account=Amex&account=TD%20Chequing').get_json()
+
+        assert amex['count'] == 3
+        assert both['count'] == 5
+
+    def test_category_filter_with_uncategorized(self, auth_client, api_data):
+        """Test filtering by category id and by 'uncategorized'."""
+        response = auth_client.get(
+            f"/api/transactions?category={api_data['groceries']}&category=uncategorized&fields=description"
+        )
+
+        assert [t['description'] for t in response.get_json()['transactions']] == [
+            'SUPERSTORE', 'SUPERSTORE', 'PAYROLL'
+        ]
+
+    @pytest.mark.parametrize('query_string', [
+        'fields=id,fingerprint',
+        'fields=,',
+        'start_date=12/01/2024',
+        'category=groceries',
+        'encoding=xml',
+        'limit=0',
+        'limit=10001',
+        'cursor=not-a-cursor',
+    ])
+    def test_invalid_parameters_return_400(self, auth_client, query_string):
+        """Test that bad filters, fields or encodings are rejected."""
+        response = auth_client.get(f'/api/transactions?{query_string}')
+
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+
+    def test_requires_login(self, client):
+        """Test that the endpoint requires authentication."""
+        assert client.get('/api/transactions').status_code == 302
+
+
+class TestTransactionsApiPaging:
+    """Test keyset paging of /api/transactions."""
+
+    def test_pages_follow_next_cursor(self, auth_client, api_data):
+        """Test that following next_cursor returns every row once, in order."""
+        descriptions = []
+        cursor = ''
+        for _ in range(3):
+            data = auth_client.get(f'/api/transactions?limit=2&fields=description&cursor={cursor}').get_json()
+            descriptions += [t['description'] for t in data['transactions']]
+            cursor = data['next_cursor']
+
+        assert descriptions == ['SUPERSTORE', 'PIZZA', 'SUPERSTORE', 'PAYROLL', 'SUSHI']
+        assert cursor is None
+
+    def test_columnar_pages_keep_filters(self, auth_client, api_data):
+        """Test the columnar encoding with a cursor and a filter that drops the date and id fields."""
+        first = auth_client.get('/api/transactions?encoding=columnar&fields=amount&account=Amex&limit=2').get_json()
+        second = auth_client.get(
+            f"/api/transactions?encoding=columnar&fields=amount&account=Amex&limit=2&cursor={first['next_cursor']}"
+        ).get_json()
+
+        assert first['columns'] == {'amount': [-22.5, -45.1]}
+        assert second == {'count': 1, 'columns': {'amount': [-35.0]}, 'next_cursor': None}
+
+    def test_default_page_size(self, app, auth_client, api_data):
+        """Test that a page holds TRANSACTIONS_API_PAGE_SIZE rows without ?limit=."""
+        app.config['TRANSACTIONS_API_PAGE_SIZE'] = 3
+
+        data = auth_client.get('/api/transactions').get_json()
+
+        assert data['count'] == 3
+        assert data['next_cursor'] is not None
+
+
+class TestTransactionsApiEncodings:
+    """Test field selection and the columnar encoding."""
+
+    def test_fields_selects_and_orders_columns(self, auth_client, api_data):
+        """Test that only the requested fields are returned, in the requested order."""
+        response = auth_client.get('/api/transactions?fields=amount,date&end_date=2024-12-01')
+
+        assert response.get_json()['transactions'] == [{'amount': -80.25, 'date': '2024-11-28'}]
+
+    def test_columnar_dictionary_encodes_categories(self, auth_client, api_data):
+        """Test parallel column arrays with category names sent once."""
+        response = auth_client.get('/api/transactions?encoding=columnar&fields=description,amount,category')
+
+        data = response.get_json()
+        assert data['count'] == 5
+        assert data['columns']['description'] == ['SUPERSTORE', 'PIZZA', 'SUPERSTORE', 'PAYROLL', 'SUSHI']
+        assert data['columns']['amount'] == [-80.25, -22.5, -45.1, 2500.0, -35.0]
+        assert data['categories'] == ['Groceries', 'Dining']
+        assert data['columns']['category'] == [0, 1, 0, None, 1]
+
+    def test_columnar_matches_rows(self, auth_client, api_data):
+        """Test that both encodings carry the same data."""
+        rows = auth_client.get('/api/transactions').get_json()['transactions']
+        columnar = auth_client.get('/api/transactions?encoding=columnar').get_json()
+
+        decoded = [dict(zip(columnar['columns'], values)) for values in zip(*columnar['columns'].values())]
+        for row in decoded:
+            row['category'] = None if row['category'] is None else columnar['categories'][row['category']]
+        assert decoded == rows
+
+    def test_columnar_without_category_has_no_dictionary(self, auth_client, api_data):
+        """Test that the dictionary is only sent with the category column."""
+        data = auth_client.get('/api/transactions?encoding=columnar&fields=id').get_json()
+
+        assert list(data) == ['count', 'columns', 'next_cursor']
+
+    def test_empty_result(self, auth_client, api_data):
+        """Test both encodings with no matching transactions."""
+        rows = auth_client.get('/api/transactions?start_date=2030-01-01').get_json()
+        columnar = auth_client.get('/api/transactions?start_date=2030-01-01&encoding=columnar&fields=id,category').get_json()
+
+        assert rows == {'count': 0, 'transactions': [], 'next_cursor': None}
+        assert columnar == {'count': 0, 'columns': {'id': [], 'category': []}, 'categories': [], 'next_cursor': None}
+
+    def test_columnar_payload_is_smaller(self):
+        """Test that the columnar encoding shrinks a large range."""
+        import orjson
+        fields = parse_fields(None)
+        rows = [(i, date(2024, 1, 1 + i % 28), f'MERCHANT {i % 40}', -1.5 * i, 'Amex', i % 6, f'Category {i % 6}')
+                for i in range(1000)]
+
+        row_size = len(orjson.dumps(rows_payload(fields, rows)))
+        columnar_size = len(orjson.dumps(columnar_payload(fields, rows)))
+
+        assert columnar_size < row_size * 0.6
@@ -0,0 +1,107 @@
+import orjson
+from flask import Response
+from sqlalchemy import select, tuple_
+
+from extensions import db
+from models import Category, Transaction
+from pagination import decode_cursor, encode_cursor
+
+# --- /api/transactions payloads ---
+# Rows are read as plain tuples (no ORM objects) with only the requested
+# columns, and serialized with orjson, which writes dates and floats natively.
+# Results are paged oldest first with the keyset cursors of pagination.py:
+# next_cursor continues after the last row and is null on the last page.
+#
+# Two encodings:
+#   rows      {"count": n, "transactions": [{"id": 1, "date": "2024-12-01", ...}, ...],
+#              "next_cursor": "..."}
+#   columnar  {"count": n, "columns": {"id": [1, ...], "date": ["2024-12-01", ...], ...},
+#              "categories": ["Dining", ...], "next_cursor": "..."}
+# In the columnar encoding the category column holds indexes into "categories"
+# (null when uncategorized), so each category name is sent once per response.
+
+FIELDS = {
+    'id': Transaction.id,
+    'date': Transaction.date,
+    'description': Transaction.description,
+    'amount': Transaction.amount,
+    'account_source': Transaction.account_source,
+    'category_id': Transaction.category_id,
+    'category': Category.name,
+}
+DEFAULT_FIELDS = tuple(FIELDS)
+ENCODINGS = ('rows', 'columnar')
+API_PAGE_SIZE = 1000
+MAX_API_PAGE_SIZE = 10000
+
+
+def parse_fields(fields_param):
+    """Turns a comma-separated fields= value into a tuple of field names; raises ValueError for unknown ones."""
+    if not fields_param:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in fields_param.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(FIELDS)}")
+    return fields
+
+
+def select_transactions(user_id, fields, start_date=None, end_date=None, accounts=(), category_ids=(), uncategorized=False,
+                        cursor=None, limit=API_PAGE_SIZE):
+    """
+    Returns (rows, next_cursor) for one page of the requested columns of a
+    user's transactions in [start_date, end_date), oldest first, starting
+    just after cursor. accounts and category_ids restrict to those values
+    (uncategorized adds transactions without a category). next_cursor is
+    None on the last page; raises ValueError for a malformed cursor.
+    """
+    # date and id are always read last to build the next cursor from
+    query = select(*(FIELDS[field] for field in fields), Transaction.date, Transaction.id).select_from(Transaction)
+    if 'category' in fields:
+        query = query.outerjoin(Category, Transaction.category_id == Category.id)
+    query = query.where(Transaction.user_id == user_id)
+    if start_date is not None:
+        query = query.where(Transaction.date >= start_date)
+    if end_date is not None:
+        query = query.where(Transaction.date < end_date)
+    if accounts:
+        query = query.where(Transaction.account_source.in_(accounts))
+    if category_ids or uncategorized:
+        category_filter = Transaction.category_id.in_(category_ids)
+        if uncategorized:
+            category_filter = category_filter | Transaction.category_id.is_(None)
+        query = query.where(category_filter)
+    if cursor is not None:
+        cursor_date, cursor_id = decode_cursor(cursor, 'date', 'asc')
+        query = query.where(tuple_(Transaction.date, Transaction.id) > tuple_(cursor_date, cursor_id))
+    # Served by ix_transactions_user_id_date_id; one extra row tells whether there is a next page
+    query = query.order_by(Transaction.date, Transaction.id).limit(limit + 1)
+    rows = db.session.execute(query).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor('date', 'asc', rows[-1][-2].isoformat(), rows[-1][-1])
+    return [row[:len(fields)] for row in rows], next_cursor
+
+
+def rows_payload(fields, rows, next_cursor=None):
+    return {'count': len(rows), 'transactions': [dict(zip(fields, row)) for row in rows], 'next_cursor': next_cursor}
+
+
+def columnar_payload(fields, rows, next_cursor=None):
+    columns = {field: list(values) for field, values in zip(fields, zip(*rows))} if rows else {field: [] for field in fields}
+    payload = {'count': len(rows), 'columns': columns}
+    if 'category' in columns:
+        # Dictionary-encode category names
+        categories = {}
+        columns['category'] = [None if name is None else categories.setdefault(name, len(categories))
+                               for name in columns['category']]
+        payload['categories'] = list(categories)
+    payload['next_cursor'] = next_cursor
+    return payload
+
+
+def json_response(payload, status=200):
+    """JSON response serialized by orjson, much faster than jsonify for large payloads."""
+    return Response(orjson.dumps(payload), status=status, mimetype='application/json')